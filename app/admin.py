@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import CustomUser
-from .models import Product, Entradas, Saidas, Solicitacao, Movimentacao, logs
+from .models import Product, Entradas, Saidas, Solicitacao, Movimentacao, logs, Notificacao
+from django.utils import timezone
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -79,4 +80,15 @@ class LogsAdmin(admin.ModelAdmin):
         ('Detalhes do Log', {
             'fields': ('usuario', 'acao')
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(Notificacao)
+class NotificacaoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'canal', 'tipo', 'status', 'tentativas', 'proxima_tentativa', 'criado_em')
+    list_filter = ('canal', 'status', 'tipo')
+    readonly_fields = ('ultimo_erro', 'criado_em', 'enviado_em')
+    actions = ['reenfileirar']
+
+    @admin.action(description='Reenfileirar notificações selecionadas')
+    def reenfileirar(self, request, queryset):
+        queryset.exclude(status='ENVIADA').update(status='PENDENTE', tentativas=0, proxima_tentativa=timezone.now())
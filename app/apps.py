@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # Registra os receivers de signals (versões de recursos, etc.)
+        from . import signals  # noqa: F401
@@ -0,0 +1,43 @@
+import hashlib
+import time
+from django.core.cache import cache
+
+# Tempo de vida das respostas em cache e parâmetros da proteção contra stampede
+CACHE_API_TIMEOUT = 300
+CACHE_API_TEMPO_TRAVA = 30
+CACHE_API_ESPERA_MAXIMA = 5
+CACHE_API_INTERVALO_ESPERA = 0.05
+
+def chave_cache_api(recurso, versoes, params):
+    """Monta a chave do cache de uma resposta da API a partir do recurso, das versões e da query string"""
+    query = '&'.join(f'{nome}={valor}' for nome, valores in sorted(params.lists()) for valor in valores)
+    resumo = hashlib.md5(query.encode()).hexdigest()
+    versao = '.'.join(str(v) for v in versoes)
+    return f'api:{recurso}:{versao}:{resumo}'
+
+def obter_ou_gerar(chave, gerar, timeout=CACHE_API_TIMEOUT):
+    """Retorna o valor em cache ou o gera uma única vez, mesmo com várias requisições simultâneas
+
+    Apenas quem consegue a trava (cache.add) executa gerar(); os demais aguardam o valor aparecer
+    no cache e, se a espera estourar, geram por conta própria.
+    """
+    valor = cache.get(chave)
+    if valor is not None:
+        return valor
+
+    trava = f'{chave}:trava'
+    if cache.add(trava, 1, CACHE_API_TEMPO_TRAVA):
+        try:
+            valor = gerar()
+            cache.set(chave, valor, timeout)
+        finally:
+            cache.delete(trava)
+        return valor
+
+    limite = time.monotonic() + CACHE_API_ESPERA_MAXIMA
+    while time.monotonic() < limite:
+        time.sleep(CACHE_API_INTERVALO_ESPERA)
+        valor = cache.get(chave)
+        if valor is not None:
+            return valor
+    return gerar()
@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import FechamentoEstoque, Movimentacao, Product, SaldoFechamento, VersaoRecurso
+
+# ============================================================================
+# ATUALIZAÇÕES ATÔMICAS DE ESTOQUE
+# ============================================================================
+# As funções abaixo alteram a quantidade com um único UPDATE ... SET quantidade = quantidade ± n,
+# sem ler e regravar a linha inteira em Python. Como o UPDATE não dispara signals de save,
+# elas mesmas atualizam o atualizado_em do produto e a versão do catálogo.
+
+def adicionar_estoque(produto, quantidade):
+    """Soma a quantidade ao estoque do produto e atualiza produto.quantidade com o novo saldo"""
+    Product.objects.filter(pk=produto.pk).update(
+        quantidade=F('quantidade') + quantidade,
+        atualizado_em=timezone.now()
+    )
+    VersaoRecurso.incrementar_apos_commit('catalogo')
+    produto.refresh_from_db(fields=['quantidade', 'atualizado_em'])
+
+def retirar_estoque(produto, quantidade):
+    """Retira a quantidade apenas se houver saldo suficiente; retorna False quando não há
+
+    A condição quantidade >= n fica no próprio UPDATE, então duas retiradas concorrentes
+    nunca deixam o estoque negativo.
+    """
+    atualizados = Product.objects.filter(pk=produto.pk, quantidade__gte=quantidade).update(
+        quantidade=F('quantidade') - quantidade,
+        atualizado_em=timezone.now()
+    )
+    if atualizados:
+        VersaoRecurso.incrementar_apos_commit('catalogo')
+    produto.refresh_from_db(fields=['quantidade', 'atualizado_em'])
+    return bool(atualizados)
+
+# ============================================================================
+# LEDGER DE MOVIMENTAÇÕES E FECHAMENTOS
+# ============================================================================
+# Movimentacao funciona como ledger (só recebe inserções): a soma de `variacao` por produto é o
+# saldo esperado. Os fechamentos consolidam esse saldo até uma movimentação, e a reconciliação
+# só precisa agregar as movimentações posteriores ao último fechamento.
+
+# Movimentações mais novas que isso ficam fora do fechamento: transações ainda abertas podem ter
+# reservado ids menores que o maior id já visível
+MARGEM_FECHAMENTO = timedelta(minutes=5)
+FECHAMENTOS_MANTIDOS = 5
+
+@contextmanager
+def leitura_consistente():
+    """Transação em que todas as consultas enxergam o mesmo snapshot do banco (REPEATABLE READ no PostgreSQL)"""
+    externa = connection.in_atomic_block
+    with transaction.atomic():
+        if connection.vendor == 'postgresql' and not externa:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+def saldos_ledger(ate_movimentacao_id=None):
+    """Retorna ({produto_id: saldo}, fechamento) somando as movimentações após o último fechamento"""
+    fechamento = FechamentoEstoque.objects.order_by('-id').first()
+    saldos = {}
+    corte = 0
+    if fechamento:
+        corte = fechamento.ultima_movimentacao_id
+        saldos = dict(fechamento.saldos.values_list('produto_id', 'quantidade'))
+
+    movimentacoes = Movimentacao.objects.filter(id__gt=corte)
+    if ate_movimentacao_id is not None:
+        movimentacoes = movimentacoes.filter(id__lte=ate_movimentacao_id)
+    # Uma única agregação (GROUP BY produto) sobre as movimentações posteriores ao fechamento
+    for produto_id, soma in movimentacoes.order_by().values_list('produto_id').annotate(soma=Sum('variacao')):
+        saldos[produto_id] = saldos.get(produto_id, 0) + soma
+    return saldos, fechamento
+
+def divergencias_estoque():
+    """Lista (produto_id, codigo, quantidade, saldo_ledger) dos produtos cujo estoque difere do ledger"""
+    with leitura_consistente():
+        saldos, _ = saldos_ledger()
+        produtos = Product.objects.order_by('id').values_list('id', 'codigo', 'quantidade')
+        return [
+            (produto_id, codigo, quantidade, saldos.get(produto_id, 0))
+            for produto_id, codigo, quantidade in produtos.iterator(chunk_size=2000)
+            if quantidade != saldos.get(produto_id, 0)
+        ]
+
+def corrigir_estoque(divergencias):
+    """Grava o saldo do ledger na quantidade dos produtos; retorna quantos foram corrigidos
+
+    Cada UPDATE só vale se a quantidade ainda for a lida na reconciliação, para não desfazer
+    uma movimentação feita nesse meio tempo.
+    """
+    corrigidos = 0
+    with transaction.atomic():
+        for produto_id, _, quantidade, saldo in divergencias:
+            corrigidos += Product.objects.filter(pk=produto_id, quantidade=quantidade).update(
+                quantidade=saldo,
+                atualizado_em=timezone.now()
+            )
+        if corrigidos:
+            VersaoRecurso.incrementar_apos_commit('catalogo')
+    return corrigidos
+
+def ajustar_ledger(divergencias, usuario):
+    """Registra movimentações de AJUSTE para que o ledger passe a bater com a quantidade atual"""
+    ajustes = [
+        Movimentacao(
+            tipo='AJUSTE',
+            produto_id=produto_id,
+            quantidade=abs(quantidade - saldo),
+            variacao=quantidade - saldo,
+            usuario=usuario,
+            observacao=f'Ajuste de reconciliação: ledger {saldo}, estoque {quantidade}'
+        )
+        for produto_id, _, quantidade, saldo in divergencias
+    ]
+    with transaction.atomic():
+        Movimentacao.objects.bulk_create(ajustes, batch_size=1000)
+        if ajustes:
+            # bulk_create não dispara signals, então a versão é atualizada aqui
+            VersaoRecurso.incrementar_apos_commit('movimentacoes')
+    return len(ajustes)
+
+def criar_fechamento(margem=MARGEM_FECHAMENTO):
+    """Consolida os saldos do ledger em um novo fechamento; retorna None se não há o que consolidar"""
+    with leitura_consistente():
+        corte = (
+            Movimentacao.objects.filter(data_hora__lte=timezone.now() - margem)
+            .order_by('-id').values_list('id', flat=True).first()
+        )
+        anterior = FechamentoEstoque.objects.order_by('-id').values_list('ultima_movimentacao_id', flat=True).first() or 0
+        if not corte or corte <= anterior:
+            return None
+
+        saldos, _ = saldos_ledger(ate_movimentacao_id=corte)
+        existentes = set(Product.objects.values_list('id', flat=True))
+        fechamento = FechamentoEstoque.objects.create(ultima_movimentacao_id=corte)
+        SaldoFechamento.objects.bulk_create(
+            [
+                SaldoFechamento(fechamento=fechamento, produto_id=produto_id, quantidade=saldo)
+                for produto_id, saldo in saldos.items() if produto_id in existentes
+            ],
+            batch_size=1000
+        )
+
+        # Os fechamentos antigos não são mais lidos; mantém só os mais recentes para auditoria
+        antigos = FechamentoEstoque.objects.order_by('-id').values_list('id', flat=True)[FECHAMENTOS_MANTIDOS:]
+        FechamentoEstoque.objects.filter(id__in=list(antigos)).delete()
+    return fechamento
@@ -0,0 +1,29 @@
+from .models import EventoEstoque
+
+def novo_evento(tipo, produto, usuario, **dados):
+    """Monta (sem salvar) um evento de estoque, para uso com bulk_create"""
+
+    # Se usuario for um objeto, pegar o username
+    if hasattr(usuario, 'username'):
+        username = usuario.username
+    else:
+        username = str(usuario)
+
+    return EventoEstoque(
+        tipo=tipo,
+        produto=produto,
+        dados={
+            'produto_id': produto.id,
+            'codigo': produto.codigo,
+            'produto': produto.nome,
+            'estoque': produto.quantidade,
+            'usuario': username,
+            **dados,
+        }
+    )
+
+def registrar_evento(tipo, produto, usuario, **dados):
+    """Registra um evento de estoque que será publicado aos clientes conectados via SSE"""
+    evento = novo_evento(tipo, produto, usuario, **dados)
+    evento.save()
+    return evento
@@ -0,0 +1,126 @@
+import uuid
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from .models import ChaveIdempotencia
+
+# Tempo que o resultado de uma chave fica guardado (sobrescrito por settings.IDEMPOTENCIA_TTL, em segundos)
+IDEMPOTENCIA_TTL_PADRAO = 24 * 60 * 60
+# Uma chave "em processamento" há mais tempo que isso é considerada abandonada (ex.: worker reiniciado)
+TEMPO_MAXIMO_PROCESSAMENTO = timedelta(seconds=60)
+TAMANHO_MAXIMO_CHAVE = 100
+
+def ttl_idempotencia():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_TTL', IDEMPOTENCIA_TTL_PADRAO))
+
+def ler_chave(request):
+    """Lê a chave do header Idempotency-Key ou do campo oculto idempotency_key do formulário"""
+    return (request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key', '')).strip()
+
+def chave_idempotencia_contexto(request):
+    """Context processor: uma chave nova a cada página renderizada, para o campo oculto dos formulários"""
+    return {'chave_idempotencia': SimpleLazyObject(lambda: uuid.uuid4().hex)}
+
+def _dashboard(request):
+    if request.user.nivel_acesso == 'comum':
+        return redirect('dashboard_comum')
+    elif request.user.nivel_acesso == 'admin':
+        return redirect('dashboard_admin')
+    return redirect('dashboard_super')
+
+def _reservar(request, endpoint, chave):
+    """Grava a chave antes de executar a view; retorna (registro, criado)
+
+    A unique constraint garante que, entre dois envios simultâneos, só um executa a view.
+    """
+    filtro = {'usuario': request.user, 'endpoint': endpoint, 'chave': chave}
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                return ChaveIdempotencia.objects.create(**filtro), True
+        except IntegrityError:
+            registro = ChaveIdempotencia.objects.filter(**filtro).first()
+            if registro is None:
+                continue
+            agora = timezone.now()
+            expirada = registro.criado_em < agora - ttl_idempotencia()
+            abandonada = registro.status_code is None and registro.criado_em < agora - TEMPO_MAXIMO_PROCESSAMENTO
+            if expirada or abandonada:
+                # Só quem apagar a linha antiga tenta gravar de novo
+                ChaveIdempotencia.objects.filter(pk=registro.pk, criado_em=registro.criado_em).delete()
+                continue
+            return registro, False
+    return None, False
+
+def _repetir(request, registro):
+    """Reproduz a resposta guardada do primeiro envio, sem executar a view"""
+    if registro.status_code is None:
+        mensagem = 'Esta operação já foi recebida e ainda está sendo processada.'
+        if 'Idempotency-Key' in request.headers:
+            return HttpResponse(mensagem, status=409, content_type='text/plain; charset=utf-8')
+        messages.info(request, mensagem)
+        return _dashboard(request)
+
+    for nivel, texto in registro.mensagens:
+        messages.add_message(request, nivel, texto)
+    if registro.redirecionamento:
+        response = HttpResponseRedirect(registro.redirecionamento)
+    else:
+        response = HttpResponse(status=registro.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+# ============================================================================
+# DECORATOR
+# ============================================================================
+
+def idempotente(endpoint):
+    """Torna os POSTs da view idempotentes quando o cliente envia uma chave
+
+    O primeiro envio executa a view e guarda status, redirecionamento e mensagens; os reenvios
+    com a mesma chave recebem a mesma resposta sem gravar nada nem disparar notificações.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            chave = ler_chave(request) if request.method == 'POST' else ''
+            if not chave:
+                return view_func(request, *args, **kwargs)
+            if len(chave) > TAMANHO_MAXIMO_CHAVE:
+                return HttpResponse('Chave de idempotência inválida', status=400, content_type='text/plain; charset=utf-8')
+
+            registro, criado = _reservar(request, endpoint, chave)
+            if registro is None:
+                return view_func(request, *args, **kwargs)
+            if not criado:
+                return _repetir(request, registro)
+
+            # Mensagens já existentes na sessão não fazem parte do resultado desta requisição
+            armazenamento = messages.get_messages(request)
+            anteriores = len(list(armazenamento))
+            armazenamento.used = False
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                registro.delete()
+                raise
+            if response.status_code >= 500:
+                registro.delete()
+                return response
+
+            novas = list(armazenamento)[anteriores:]
+            armazenamento.used = False
+            registro.status_code = response.status_code
+            registro.redirecionamento = response.get('Location', '')
+            registro.mensagens = [[mensagem.level, mensagem.message] for mensagem in novas]
+            registro.save(update_fields=['status_code', 'redirecionamento', 'mensagens'])
+            return response
+        return _wrapped
+    return decorator
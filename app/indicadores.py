@@ -0,0 +1,92 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import Entradas, IndicadorEstoque, Product, Saidas, Solicitacao
+from .reposicao import FILTRO_ABAIXO_CARENCIA, abaixo_da_carencia
+
+# ============================================================================
+# INDICADORES DOS DASHBOARDS
+# ============================================================================
+# Os contadores são ajustados pelas views na mesma transação das alterações de estoque, então
+# os dashboards leem poucas linhas em vez de agregar as tabelas a cada acesso. Alterações feitas
+# por fora das views (admin do Django, shell) não passam por aqui: para corrigir os valores, rode
+# `python manage.py recalcular_indicadores`.
+
+INDICADORES_GERAIS = ('produtos', 'unidades', 'abaixo_carencia', 'solicitacoes_pendentes')
+INDICADORES_DIARIOS = ('entradas', 'saidas')
+
+def chave_diaria(nome, data=None):
+    """Chave do contador diário (ex.: entradas:2026-10-18), no dia local atual por padrão"""
+    return f'{nome}:{(data or timezone.localdate()).isoformat()}'
+
+def variacao_carencia(quantidade_antes, quantidade_depois, carencia_antes, carencia_depois=None):
+    """+1 quando o produto passa a ficar no limite da carência (quantidade <= carencia), -1 quando sai dele"""
+    if carencia_depois is None:
+        carencia_depois = carencia_antes
+    return int(abaixo_da_carencia(quantidade_depois, carencia_depois)) - int(abaixo_da_carencia(quantidade_antes, carencia_antes))
+
+def atualizar_indicadores(produtos=0, unidades=0, abaixo_carencia=0, solicitacoes_pendentes=0, entradas=0, saidas=0):
+    """Aplica as variações aos indicadores; deve ser chamada dentro da transação da operação"""
+    IndicadorEstoque.ajustar({
+        'produtos': produtos,
+        'unidades': unidades,
+        'abaixo_carencia': abaixo_carencia,
+        'solicitacoes_pendentes': solicitacoes_pendentes,
+        chave_diaria('entradas'): entradas,
+        chave_diaria('saidas'): saidas,
+    })
+
+def indicadores_dashboard():
+    """Valores atuais dos indicadores em uma única consulta"""
+    chaves = {nome: nome for nome in INDICADORES_GERAIS}
+    chaves.update({f'{nome}_hoje': chave_diaria(nome) for nome in INDICADORES_DIARIOS})
+    valores = dict(IndicadorEstoque.objects.filter(chave__in=chaves.values()).values_list('chave', 'valor'))
+    return {nome: valores.get(chave, 0) for nome, chave in chaves.items()}
+
+def _contagem_por_dia(queryset, campo, inicio):
+    return dict(
+        queryset.filter(**{f'{campo}__date__gte': inicio})
+        .annotate(dia=TruncDate(campo)).values('dia')
+        .annotate(total=Count('id')).values_list('dia', 'total')
+    )
+
+def recalcular_indicadores(dias=7):
+    """Recalcula todos os indicadores a partir das tabelas; os contadores diários cobrem os últimos `dias`
+
+    As linhas existentes são travadas antes das agregações: operações concorrentes esperam o
+    recálculo terminar e aplicam a variação delas sobre o valor novo. Contadores diários mais
+    antigos que a janela são removidos.
+    """
+    hoje = timezone.localdate()
+    inicio = hoje - timedelta(days=dias - 1)
+    with transaction.atomic():
+        list(IndicadorEstoque.objects.select_for_update().order_by('chave').values_list('id', flat=True))
+
+        valores = Product.objects.aggregate(
+            produtos=Count('id'),
+            unidades=Coalesce(Sum('quantidade'), 0),
+            abaixo_carencia=Count('id', filter=FILTRO_ABAIXO_CARENCIA),
+        )
+        valores['solicitacoes_pendentes'] = Solicitacao.objects.filter(status='PENDENTE').count()
+
+        por_dia = {
+            'entradas': _contagem_por_dia(Entradas.objects, 'data_entrada', inicio),
+            'saidas': _contagem_por_dia(Saidas.objects, 'data_saida', inicio),
+        }
+        for nome, contagens in por_dia.items():
+            for n in range(dias):
+                data = inicio + timedelta(days=n)
+                valores[chave_diaria(nome, data)] = contagens.get(data, 0)
+
+        agora = timezone.now()
+        for chave, valor in valores.items():
+            IndicadorEstoque.objects.update_or_create(chave=chave, defaults={'valor': valor, 'atualizado_em': agora})
+
+        antigos = [
+            chave for chave in IndicadorEstoque.objects.filter(chave__contains=':').values_list('chave', flat=True)
+            if chave not in valores
+        ]
+        IndicadorEstoque.objects.filter(chave__in=antigos).delete()
+    return valores
@@ -0,0 +1,67 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from app.models import Product, Movimentacao
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compara o custo por linha da API usando instâncias de model e usando values() com fields='
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=5000, help='Quantidade de movimentações geradas')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções de cada variante')
+
+    def handle(self, *args, **options):
+        linhas = options['linhas']
+        repeticoes = options['repeticoes']
+
+        # Os dados do benchmark são criados e descartados dentro de uma transação
+        try:
+            with transaction.atomic():
+                self._popular(linhas)
+                self._executar(linhas, repeticoes)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _popular(self, linhas):
+        produtos = Product.objects.bulk_create(
+            Product(nome=f'Bench {i}', codigo=f'BENCH-{i:06d}', quantidade=i, local='Bench', carencia=1)
+            for i in range(max(linhas // 10, 1))
+        )
+        Movimentacao.objects.bulk_create(
+            Movimentacao(tipo='ENTRADA', produto=produtos[i % len(produtos)], quantidade=1, usuario='bench')
+            for i in range(linhas)
+        )
+
+    def _medir(self, funcao, repeticoes):
+        melhor = None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            total = funcao()
+            duracao = time.perf_counter() - inicio
+            melhor = duracao if melhor is None else min(melhor, duracao)
+        return melhor, total
+
+    def _executar(self, linhas, repeticoes):
+        movimentacoes = Movimentacao.objects.filter(usuario='bench').order_by('-data_hora', '-id')
+
+        def instancias():
+            # Caminho antigo: model completo + produto carregado por select_related
+            return len([
+                {"codigo": mov.produto.codigo, "quantidade": mov.quantidade}
+                for mov in movimentacoes.select_related('produto')
+            ])
+
+        def projecao():
+            # Caminho com fields=codigo,quantidade: apenas as colunas pedidas, sem instanciar models
+            return len(list(movimentacoes.values('produto__codigo', 'quantidade')))
+
+        for nome, funcao in (('instâncias de model', instancias), ('values() com fields=', projecao)):
+            duracao, total = self._medir(funcao, repeticoes)
+            self.stdout.write(f'{nome:<22} {total} linhas em {duracao * 1000:.1f} ms '
+                              f'({duracao / max(total, 1) * 1_000_000:.2f} µs/linha)')
@@ -0,0 +1,60 @@
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from app.models import Notificacao
+from app.notificacoes import montar_email, renderizar_email
+
+
+class Command(BaseCommand):
+    help = 'Mede o custo por evento de renderizar e enviar emails, com uma conexão por mensagem e com uma conexão por lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--eventos', type=int, default=200, help='Quantidade de eventos simulados')
+        parser.add_argument(
+            '--backend',
+            default='django.core.mail.backends.locmem.EmailBackend',
+            help='Backend de email usado no envio (ex.: django.core.mail.backends.console.EmailBackend)'
+        )
+
+    def handle(self, *args, **options):
+        eventos = options['eventos']
+        backend = options['backend']
+
+        contexto = {
+            'id': 1, 'solicitante': 'bench', 'produto': 'Produto Bench', 'codigo': 'BENCH-1',
+            'quantidade': 10, 'destino': 'TI', 'data': '01/01/2025 às 10:00',
+        }
+
+        # A primeira renderização compila o template; as seguintes saem do cached loader
+        inicio = time.perf_counter()
+        renderizar_email('nova_solicitacao', contexto)
+        primeira_ms = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        notificacoes = []
+        for i in range(eventos):
+            texto, html = renderizar_email('nova_solicitacao', {**contexto, 'id': i})
+            notificacoes.append(Notificacao(
+                canal='EMAIL', tipo='nova_solicitacao', destinatarios=['bench@example.com'],
+                assunto='Nova Solicitação de Produto - Stock Flow', texto=texto, html=html,
+            ))
+        render_ms = (time.perf_counter() - inicio) * 1000 / eventos
+
+        # Uma conexão por mensagem (comportamento de EmailMultiAlternatives.send() sem connection)
+        inicio = time.perf_counter()
+        for notificacao in notificacoes:
+            montar_email(notificacao, get_connection(backend)).send()
+        individual_ms = (time.perf_counter() - inicio) * 1000 / eventos
+
+        # Uma única conexão para o lote inteiro
+        inicio = time.perf_counter()
+        with get_connection(backend) as conexao:
+            for notificacao in notificacoes:
+                conexao.send_messages([montar_email(notificacao, conexao)])
+        lote_ms = (time.perf_counter() - inicio) * 1000 / eventos
+
+        self.stdout.write(f'Backend: {backend} ({eventos} eventos)')
+        self.stdout.write(f'  Primeira renderização (compilação):   {primeira_ms:8.3f} ms')
+        self.stdout.write(f'  Renderização com cache, por evento:   {render_ms:8.3f} ms')
+        self.stdout.write(f'  Envio com conexão por mensagem:       {individual_ms:8.3f} ms/evento')
+        self.stdout.write(f'  Envio com conexão única por lote:     {lote_ms:8.3f} ms/evento')
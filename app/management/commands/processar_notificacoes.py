@@ -0,0 +1,42 @@
+import time
+import traceback
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from app.notificacoes import processar_fila
+from app.whatsapp_service import WhatsAppService
+
+
+class Command(BaseCommand):
+    help = 'Worker que envia os emails e mensagens de WhatsApp da fila de notificações'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Processa a fila uma vez e termina')
+        parser.add_argument('--lote', type=int, default=50, help='Notificações reservadas por iteração')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera quando a fila está vazia')
+
+    def handle(self, *args, **options):
+        while True:
+            # Descarta conexões quebradas (banco reiniciado, timeout) antes de cada iteração
+            close_old_connections()
+            try:
+                enviadas, falhas = processar_fila(limite=options['lote'])
+            except Exception:
+                if options['uma_vez']:
+                    raise
+                # Um erro de banco não pode derrubar o worker: registra, espera e tenta de novo
+                self.stderr.write(f'Erro ao processar a fila de notificações:\n{traceback.format_exc()}')
+                close_old_connections()
+                time.sleep(options['intervalo'])
+                continue
+
+            if enviadas or falhas:
+                metricas = WhatsAppService.metricas()
+                self.stdout.write(
+                    f'{enviadas} notificações enviadas, {falhas} falhas '
+                    f'(WhatsApp: latência média {metricas["latencia_media_ms"]} ms, circuito {metricas["circuito"]})'
+                )
+            if options['uma_vez']:
+                break
+            # Lote cheio: provavelmente há mais pendências, então não espera
+            if enviadas + falhas < options['lote']:
+                time.sleep(options['intervalo'])
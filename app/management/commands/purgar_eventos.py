@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.models import EventoEstoque
+from app.views_eventos import retencao_eventos
+
+
+class Command(BaseCommand):
+    help = 'Remove os eventos de estoque (SSE) mais antigos que a retenção (settings.SSE_RETENCAO)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas removidas por DELETE')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - retencao_eventos()
+        removidos = 0
+        # Remove em lotes para não segurar uma transação longa sobre a tabela
+        while True:
+            ids = list(
+                EventoEstoque.objects.filter(criado_em__lt=limite)
+                .order_by('id').values_list('id', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+            removidos += EventoEstoque.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f'{removidos} eventos de estoque removidos')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.idempotencia import ttl_idempotencia
+from app.models import ChaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = 'Remove as chaves de idempotência mais antigas que o TTL (settings.IDEMPOTENCIA_TTL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas removidas por DELETE')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - ttl_idempotencia()
+        removidas = 0
+        # Remove em lotes para não segurar uma transação longa sobre a tabela
+        while True:
+            ids = list(
+                ChaveIdempotencia.objects.filter(criado_em__lt=limite)
+                .order_by('id').values_list('id', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+            removidas += ChaveIdempotencia.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f'{removidas} chaves de idempotência removidas')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from app.indicadores import INDICADORES_GERAIS, recalcular_indicadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os indicadores (KPIs) dos dashboards a partir das tabelas de produtos, solicitações, entradas e saídas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help='Dias (incluindo hoje) recalculados nos contadores diários de entradas e saídas')
+
+    def handle(self, *args, **options):
+        valores = recalcular_indicadores(max(options['dias'], 1))
+        for chave in INDICADORES_GERAIS:
+            self.stdout.write(f'{chave}: {valores[chave]}')
+        self.stdout.write(self.style.SUCCESS(f'{len(valores)} indicadores recalculados'))
@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app.estoque import ajustar_ledger, corrigir_estoque, criar_fechamento, divergencias_estoque
+from app.indicadores import recalcular_indicadores
+
+
+class Command(BaseCommand):
+    help = 'Compara a quantidade de cada produto com o saldo do ledger de movimentações e corrige divergências'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corrigir', action='store_true', help='Grava o saldo do ledger na quantidade dos produtos divergentes')
+        parser.add_argument('--ajustar-ledger', action='store_true', help='Registra movimentações de AJUSTE para o ledger bater com a quantidade atual')
+        parser.add_argument('--fechamento', action='store_true', help='Cria um novo fechamento (snapshot) dos saldos ao final')
+        parser.add_argument('--usuario', default='reconcile_stock', help='Usuário gravado nas movimentações de ajuste')
+        parser.add_argument('--mostrar', type=int, default=50, help='Máximo de divergências listadas')
+
+    def handle(self, *args, **options):
+        if options['corrigir'] and options['ajustar_ledger']:
+            raise CommandError('Use --corrigir ou --ajustar-ledger, não os dois')
+
+        inicio = time.perf_counter()
+        divergencias = divergencias_estoque()
+        duracao = time.perf_counter() - inicio
+
+        for produto_id, codigo, quantidade, saldo in divergencias[:options['mostrar']]:
+            self.stdout.write(f'{codigo}: estoque {quantidade}, ledger {saldo} (diferença {quantidade - saldo:+d})')
+        if len(divergencias) > options['mostrar']:
+            self.stdout.write(f'... e mais {len(divergencias) - options["mostrar"]} produtos')
+        self.stdout.write(f'{len(divergencias)} produtos divergentes (reconciliação em {duracao:.2f} s)')
+
+        if divergencias and options['corrigir']:
+            corrigidos = corrigir_estoque(divergencias)
+            self.stdout.write(self.style.SUCCESS(f'{corrigidos} produtos corrigidos a partir do ledger'))
+            # A correção altera quantidades sem passar pelas views, então os indicadores são refeitos
+            recalcular_indicadores()
+        elif divergencias and options['ajustar_ledger']:
+            ajustes = ajustar_ledger(divergencias, options['usuario'])
+            self.stdout.write(self.style.SUCCESS(f'{ajustes} movimentações de ajuste registradas'))
+
+        if options['fechamento']:
+            fechamento = criar_fechamento()
+            if fechamento:
+                self.stdout.write(self.style.SUCCESS(f'Fechamento {fechamento.id} criado até a movimentação {fechamento.ultima_movimentacao_id}'))
+            else:
+                self.stdout.write('Nenhuma movimentação nova para consolidar em fechamento')
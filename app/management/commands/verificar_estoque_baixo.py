@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from app.reposicao import verificar_estoque_baixo
+
+
+class Command(BaseCommand):
+    help = 'Verifica os produtos alterados desde a última execução e notifica os administradores dos que chegaram ao limite da carência'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completa', action='store_true', help='Verifica o catálogo inteiro, não só os produtos alterados')
+
+    def handle(self, *args, **options):
+        varredura = verificar_estoque_baixo(completa=options['completa'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{varredura.produtos_verificados} produtos verificados, {varredura.alertas} alertas de estoque baixo'
+        ))
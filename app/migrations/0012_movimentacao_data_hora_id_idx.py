@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_customuser_politicas_privacidade_aceitas_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacao',
+            index=models.Index(fields=['data_hora', 'id'], name='mov_data_hora_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def criar_versao_catalogo(apps, schema_editor):
+    VersaoRecurso = apps.get_model('app', 'VersaoRecurso')
+    VersaoRecurso.objects.get_or_create(recurso='catalogo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_movimentacao_data_hora_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoRecurso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recurso', models.CharField(max_length=50, unique=True)),
+                ('numero', models.BigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(criar_versao_catalogo, migrations.RunPython.noop),
+    ]
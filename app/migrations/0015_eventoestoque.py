@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_product_atualizado_em_produtoremovido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ENTRADA', 'Entrada'), ('SOLICITACAO', 'Solicitação'), ('APROVACAO', 'Aprovação'), ('REPROVACAO', 'Reprovação')], max_length=15)),
+                ('dados', models.JSONField(default=dict)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_eventoestoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notificacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('canal', models.CharField(choices=[('EMAIL', 'Email'), ('WHATSAPP', 'WhatsApp')], max_length=10)),
+                ('tipo', models.CharField(max_length=50)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('assunto', models.CharField(blank=True, max_length=200)),
+                ('texto', models.TextField(blank=True)),
+                ('html', models.TextField(blank=True)),
+                ('dados', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('ENVIADA', 'Enviada'), ('FALHA', 'Falha')], default='PENDENTE', max_length=10)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='notificacao_fila_idx')],
+            },
+        ),
+    ]
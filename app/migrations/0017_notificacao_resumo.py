@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_notificacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacao',
+            name='resumo',
+            field=models.BooleanField(default=False),
+        ),
+    ]
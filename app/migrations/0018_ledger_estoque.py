@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def preencher_variacao(apps, schema_editor):
+    # Movimentações antigas: entradas somam e retiradas subtraem; solicitações não afetam o estoque
+    Movimentacao = apps.get_model('app', 'Movimentacao')
+    Movimentacao.objects.filter(tipo='ENTRADA', quantidade__isnull=False).update(variacao=F('quantidade'))
+    Movimentacao.objects.filter(tipo='RETIRADA', quantidade__isnull=False).update(variacao=-F('quantidade'))
+
+
+def registrar_saldo_inicial(apps, schema_editor):
+    # O cadastro de produtos não registrava o saldo inicial como movimentação: um AJUSTE por
+    # produto faz a soma das variações bater com a quantidade atual
+    Movimentacao = apps.get_model('app', 'Movimentacao')
+    Product = apps.get_model('app', 'Product')
+    saldos = dict(Movimentacao.objects.order_by().values_list('produto_id').annotate(soma=Sum('variacao')))
+    ajustes = []
+    for produto_id, quantidade in Product.objects.order_by('id').values_list('id', 'quantidade').iterator():
+        diferenca = quantidade - (saldos.get(produto_id) or 0)
+        if diferenca:
+            ajustes.append(Movimentacao(
+                tipo='AJUSTE',
+                produto_id=produto_id,
+                quantidade=abs(diferenca),
+                variacao=diferenca,
+                usuario='sistema',
+                observacao='Saldo inicial'
+            ))
+    Movimentacao.objects.bulk_create(ajustes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_notificacao_resumo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FechamentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultima_movimentacao_id', models.BigIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movimentacao',
+            name='variacao',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_variacao, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='movimentacao',
+            name='tipo',
+            field=models.CharField(choices=[('ENTRADA', 'Entrada'), ('SOLICITACAO', 'Solicitação'), ('APROVACAO', 'Aprovação'), ('RETIRADA', 'Retirada'), ('AJUSTE', 'Ajuste')], max_length=15),
+        ),
+        migrations.RunPython(registrar_saldo_inicial, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='SaldoFechamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.IntegerField()),
+                ('fechamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='app.fechamentoestoque')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fechamento', 'produto'), name='saldo_fechamento_produto_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:50
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def preencher_indicadores(apps, schema_editor):
+    # Valores iniciais dos indicadores gerais; os contadores diários começam a contar a partir daqui
+    # (`manage.py recalcular_indicadores` preenche também os dias anteriores)
+    Product = apps.get_model('app', 'Product')
+    Solicitacao = apps.get_model('app', 'Solicitacao')
+    IndicadorEstoque = apps.get_model('app', 'IndicadorEstoque')
+    valores = Product.objects.aggregate(
+        produtos=Count('id'),
+        unidades=Coalesce(Sum('quantidade'), 0),
+        abaixo_carencia=Count('id', filter=Q(quantidade__lte=F('carencia'))),
+    )
+    valores['solicitacoes_pendentes'] = Solicitacao.objects.filter(status='PENDENTE').count()
+    IndicadorEstoque.objects.bulk_create([
+        IndicadorEstoque(chave=chave, valor=valor) for chave, valor in valores.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_chaveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicadorEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=50, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(preencher_indicadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:54
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_indicadorestoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('abaixo_carencia', models.BooleanField(default=False)),
+                ('alertado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VarreduraEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iniciada_em', models.DateTimeField(db_index=True)),
+                ('produtos_verificados', models.PositiveIntegerField(default=0)),
+                ('alertas', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('quantidade'), '-', models.F('carencia')), models.F('id'), name='produto_folga_idx'),
+        ),
+        migrations.AddField(
+            model_name='alertaestoque',
+            name='produto',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alerta', to='app.product'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_alerta_estoque_folga'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventoestoque',
+            name='criado_em',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
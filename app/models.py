@@ -1,4 +1,6 @@
-from django.db import models
+from functools import partial
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
@@ -25,9 +27,27 @@ class Product(models.Model):
     local = models.CharField(max_length=100)
     codigo = models.CharField(max_length=100, unique=True)
     carencia = models.IntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Índice funcional na folga (quantidade - carencia): a lista de reposição filtra e
+            # ordena por essa expressão sem varrer o catálogo inteiro
+            models.Index(F('quantidade') - F('carencia'), F('id'), name='produto_folga_idx'),
+        ]
 
     def __str__(self):
         return self.nome
+
+class ProdutoRemovido(models.Model):
+    # Model da tabela de produtos removidos
+    # Guarda um registro (tombstone) de cada produto deletado para a sincronização incremental
+    produto_id = models.BigIntegerField()
+    codigo = models.CharField(max_length=100)
+    removido_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Produto {self.codigo} removido em {self.removido_em}"
     
 class Entradas(models.Model):
     # Model da tabela de entradas de produtos
@@ -82,19 +102,69 @@ class Movimentacao(models.Model):
         ('SOLICITACAO', 'Solicitação'),
         ('APROVACAO', 'Aprovação'),
         ('RETIRADA', 'Retirada'),
+        ('AJUSTE', 'Ajuste'),
     ]
     
     tipo = models.CharField(max_length=15, choices=TIPO_CHOICES)
     produto = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantidade = models.IntegerField(null=True, blank=True)
+    # Efeito com sinal no estoque (+entrada, -retirada, 0 para solicitações); a soma é o saldo do ledger
+    variacao = models.IntegerField(default=0)
     data_hora = models.DateTimeField(auto_now_add=True)
     usuario = models.CharField(max_length=150)
     referencia_id = models.IntegerField(null=True, blank=True) 
     observacao = models.TextField(blank=True)
 
+    class Meta:
+        # Índice usado pela paginação por cursor da API (data_hora, id)
+        indexes = [
+            models.Index(fields=['data_hora', 'id'], name='mov_data_hora_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.tipo} - {self.produto.nome} - {self.data_hora}"   
 
+class FechamentoEstoque(models.Model):
+    # Model da tabela de fechamentos (snapshots) do ledger de estoque
+    # Guarda até qual movimentação os saldos de SaldoFechamento já foram consolidados
+    ultima_movimentacao_id = models.BigIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Fechamento {self.id} até movimentação {self.ultima_movimentacao_id}"
+
+class SaldoFechamento(models.Model):
+    # Model da tabela de saldos por produto em cada fechamento do ledger
+    fechamento = models.ForeignKey(FechamentoEstoque, on_delete=models.CASCADE, related_name='saldos')
+    produto = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantidade = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fechamento', 'produto'], name='saldo_fechamento_produto_unico'),
+        ]
+
+    def __str__(self):
+        return f"Fechamento {self.fechamento_id} - {self.produto_id}: {self.quantidade}"
+
+class EventoEstoque(models.Model):
+    # Model da tabela de eventos de estoque
+    # Fila de eventos (entradas, solicitações, aprovações) publicada para os clientes via SSE
+    TIPO_CHOICES = [
+        ('ENTRADA', 'Entrada'),
+        ('SOLICITACAO', 'Solicitação'),
+        ('APROVACAO', 'Aprovação'),
+        ('REPROVACAO', 'Reprovação'),
+    ]
+
+    tipo = models.CharField(max_length=15, choices=TIPO_CHOICES)
+    produto = models.ForeignKey(Product, on_delete=models.CASCADE)
+    dados = models.JSONField(default=dict)
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Evento {self.id} - {self.tipo} - {self.produto_id}"
+
 class logs (models.Model):
     # Model da tabela de logs de ações do sistema
     # Contém informações sobre ações realizadas pelos usuários no sistema
@@ -104,4 +174,148 @@ class logs (models.Model):
     detalhes = models.TextField(blank=True)
 
     def __str__(self):
-        return f"Log {self.id} - {self.acao} por {self.usuario} em {self.data_hora}"
\ No newline at end of file
+        return f"Log {self.id} - {self.acao} por {self.usuario} em {self.data_hora}"
+
+class VersaoRecurso(models.Model):
+    # Model da tabela de versões de recursos
+    # Contador incrementado a cada alteração do recurso (ex.: catálogo), usado em ETags e caches
+    recurso = models.CharField(max_length=50, unique=True)
+    numero = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def atual(cls, recurso):
+        """Retorna (numero, atualizado_em) da versão atual do recurso"""
+        versao = cls.objects.filter(recurso=recurso).values_list('numero', 'atualizado_em').first()
+        return versao or (0, None)
+
+    @classmethod
+    def atuais(cls, *recursos):
+        """Retorna os números de versão de vários recursos em uma única consulta"""
+        numeros = dict(cls.objects.filter(recurso__in=recursos).values_list('recurso', 'numero'))
+        return [numeros.get(recurso, 0) for recurso in recursos]
+
+    @classmethod
+    def incrementar(cls, recurso):
+        """Incrementa a versão do recurso com um UPDATE atômico no banco"""
+        atualizados = cls.objects.filter(recurso=recurso).update(numero=F('numero') + 1, atualizado_em=timezone.now())
+        if not atualizados:
+            _, criado = cls.objects.get_or_create(recurso=recurso, defaults={'numero': 1})
+            if not criado:
+                cls.objects.filter(recurso=recurso).update(numero=F('numero') + 1, atualizado_em=timezone.now())
+
+    @classmethod
+    def incrementar_apos_commit(cls, *recursos):
+        """Agenda o incremento das versões para depois do commit da transação atual
+
+        Dentro da transação o UPDATE deixaria a linha do recurso travada até o commit, e todas as
+        escritas do recurso ficariam em fila atrás dela. Depois do commit cada incremento é um
+        UPDATE curto em autocommit, sem travas acumuladas. Fora de transação roda na hora.
+        """
+        for recurso in recursos:
+            transaction.on_commit(partial(cls.incrementar, recurso))
+
+    def __str__(self):
+        return f"{self.recurso} v{self.numero}"
+
+class IndicadorEstoque(models.Model):
+    # Model da tabela de indicadores (KPIs) dos dashboards
+    # Cada linha é um contador ajustado na mesma transação das operações de estoque (app/indicadores.py);
+    # os contadores diários levam a data na chave (ex.: entradas:2026-10-18)
+    chave = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def ajustar(cls, variacoes):
+        """Soma cada variação ao contador da chave com um UPDATE atômico, criando a linha se não existir"""
+        agora = timezone.now()
+        # Chaves sempre na mesma ordem: transações concorrentes travam as linhas na mesma sequência
+        for chave in sorted(variacoes):
+            variacao = variacoes[chave]
+            if not variacao:
+                continue
+            atualizados = cls.objects.filter(chave=chave).update(valor=F('valor') + variacao, atualizado_em=agora)
+            if not atualizados:
+                _, criado = cls.objects.get_or_create(chave=chave, defaults={'valor': variacao})
+                if not criado:
+                    cls.objects.filter(chave=chave).update(valor=F('valor') + variacao, atualizado_em=agora)
+
+    def __str__(self):
+        return f"{self.chave} = {self.valor}"
+
+class Notificacao(models.Model):
+    # Model da tabela de notificações (outbox)
+    # Emails e mensagens de WhatsApp gravados na mesma transação da operação e enviados por um worker
+    CANAL_CHOICES = [
+        ('EMAIL', 'Email'),
+        ('WHATSAPP', 'WhatsApp'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('ENVIADA', 'Enviada'),
+        ('FALHA', 'Falha'),
+    ]
+
+    canal = models.CharField(max_length=10, choices=CANAL_CHOICES)
+    tipo = models.CharField(max_length=50)
+    destinatarios = models.JSONField(default=list)
+    assunto = models.CharField(max_length=200, blank=True)
+    texto = models.TextField(blank=True)
+    html = models.TextField(blank=True)
+    dados = models.JSONField(default=dict)
+    # Notificações em modo resumo são agrupadas por destinatário e canal até o fim da janela
+    resumo = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa'], name='notificacao_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notificação {self.id} - {self.canal} {self.tipo} ({self.status})"
+
+class ChaveIdempotencia(models.Model):
+    # Model da tabela de chaves de idempotência
+    # Guarda o resultado do primeiro POST feito com uma chave, repetido quando o mesmo POST é reenviado
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    endpoint = models.CharField(max_length=50)
+    chave = models.CharField(max_length=100)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    redirecionamento = models.CharField(max_length=500, blank=True)
+    mensagens = models.JSONField(default=list)
+    criado_em = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'endpoint', 'chave'], name='chave_idempotencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.chave} ({self.status_code or 'em processamento'})"
+
+class AlertaEstoque(models.Model):
+    # Model da tabela de estado dos alertas de estoque baixo
+    # Guarda, por produto, se ele estava no limite da carência na última varredura, para notificar só quando cruza o limite
+    produto = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='alerta')
+    abaixo_carencia = models.BooleanField(default=False)
+    alertado_em = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Alerta de {self.produto_id} ({'abaixo' if self.abaixo_carencia else 'ok'})"
+
+class VarreduraEstoque(models.Model):
+    # Model da tabela de execuções da varredura de estoque baixo
+    # O início da última execução define quais produtos a próxima precisa verificar
+    iniciada_em = models.DateTimeField(db_index=True)
+    produtos_verificados = models.PositiveIntegerField(default=0)
+    alertas = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Varredura de {self.iniciada_em} ({self.alertas} alertas)"
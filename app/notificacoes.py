@@ -0,0 +1,287 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import CustomUser, Notificacao
+from .whatsapp_service import WhatsAppService
+
+# Padrões da fila de notificações, sobrescritos por settings.NOTIFICACOES
+NOTIFICACOES_PADRAO = {
+    'max_tentativas': 6,
+    'backoff_inicial': 30,     # segundos até a 2ª tentativa; dobra a cada falha
+    'backoff_maximo': 3600,
+    'reserva': 300,            # tempo que um lote fica reservado para o worker que o pegou
+    'janela_resumo': 0,        # segundos; > 0 agrupa as notificações de cada destinatário em um resumo
+    'tipos_urgentes': ['nova_solicitacao'],  # tipos que nunca esperam a janela do resumo
+}
+
+def configuracao_notificacoes():
+    """Retorna a configuração da fila de notificações mesclada com settings.NOTIFICACOES"""
+    return {**NOTIFICACOES_PADRAO, **getattr(settings, 'NOTIFICACOES', {})}
+
+# ============================================================================
+# DIRETÓRIO DE DESTINATÁRIOS
+# ============================================================================
+
+# Coluna de CustomUser lida para cada canal
+COLUNAS_CANAL = {'email': 'email', 'whatsapp': 'telefone'}
+NIVEIS_ACESSO = ('comum', 'admin', 'superadmin')
+DESTINATARIOS_TIMEOUT = 600
+
+def _chave_destinatarios(nivel_acesso, canal):
+    return f'destinatarios:{nivel_acesso}:{canal}'
+
+def destinatarios(nivel_acesso, canal):
+    """Retorna os emails ou telefones dos usuários de um nível de acesso, a partir do cache
+
+    Só a coluna do canal é lida do banco; o cache é limpo pelos signals de CustomUser.
+    """
+    chave = _chave_destinatarios(nivel_acesso, canal)
+    valores = cache.get(chave)
+    if valores is None:
+        coluna = COLUNAS_CANAL[canal]
+        valores = list(
+            CustomUser.objects.filter(nivel_acesso=nivel_acesso)
+            .exclude(**{f'{coluna}__isnull': True}).exclude(**{coluna: ''})
+            .order_by('id').values_list(coluna, flat=True)
+        )
+        cache.set(chave, valores, DESTINATARIOS_TIMEOUT)
+    return valores
+
+def limpar_destinatarios():
+    """Remove do cache o diretório de destinatários de todos os níveis e canais"""
+    cache.delete_many([_chave_destinatarios(nivel, canal) for nivel in NIVEIS_ACESSO for canal in COLUNAS_CANAL])
+
+# ============================================================================
+# ENFILEIRAMENTO
+# ============================================================================
+
+def renderizar_email(template, contexto):
+    """Renderiza emails/<template>.txt e emails/<template>.html; retorna (texto, html)
+
+    Os templates ficam compilados em memória pelo cached loader do Django.
+    """
+    return (
+        render_to_string(f'emails/{template}.txt', contexto).strip(),
+        render_to_string(f'emails/{template}.html', contexto),
+    )
+
+def _agendamento(tipo, configuracao=None):
+    """Retorna (resumo, proxima_tentativa) de uma nova notificação do tipo informado"""
+    configuracao = configuracao or configuracao_notificacoes()
+    janela = configuracao['janela_resumo']
+    agora = timezone.now()
+    if not janela or tipo in configuracao['tipos_urgentes']:
+        return False, agora
+    # Janelas alinhadas no relógio: tudo que chega para um destinatário na mesma janela vence junto
+    fim_janela = (int(agora.timestamp()) // janela + 1) * janela
+    return True, datetime.fromtimestamp(fim_janela, tz=dt_timezone.utc)
+
+def enfileirar_email(tipo, assunto, texto, destinatarios, html=''):
+    """Grava um email por destinatário na fila; deve ser chamado dentro da transação da operação que o originou
+
+    Como no WhatsApp, cada destinatário tem a sua linha: as tentativas são independentes e o
+    resumo junta as notificações de cada endereço, seja qual for a lista em que ele veio.
+    """
+    resumo, proxima_tentativa = _agendamento(tipo)
+    return Notificacao.objects.bulk_create([
+        Notificacao(
+            canal='EMAIL',
+            tipo=tipo,
+            destinatarios=[email],
+            assunto=assunto,
+            texto=texto,
+            html=html,
+            resumo=resumo,
+            proxima_tentativa=proxima_tentativa,
+        )
+        for email in dict.fromkeys(destinatarios) if email
+    ])
+
+def enfileirar_whatsapp(tipo, telefones, dados):
+    """Grava uma mensagem de WhatsApp por telefone na fila, para que cada uma tenha suas próprias tentativas"""
+    return enfileirar_whatsapp_lote(tipo, [(telefone, dados) for telefone in dict.fromkeys(telefones)])
+
+def enfileirar_whatsapp_lote(tipo, mensagens):
+    """Grava várias mensagens (telefone, dados) do mesmo tipo com um único INSERT"""
+    resumo, proxima_tentativa = _agendamento(tipo)
+    return Notificacao.objects.bulk_create([
+        Notificacao(
+            canal='WHATSAPP',
+            tipo=tipo,
+            destinatarios=[telefone],
+            dados=dados,
+            resumo=resumo,
+            proxima_tentativa=proxima_tentativa,
+        )
+        for telefone, dados in mensagens if telefone
+    ])
+
+# ============================================================================
+# ENVIO (WORKER)
+# ============================================================================
+
+def calcular_atraso(tentativas, configuracao=None):
+    """Backoff exponencial: atraso antes da próxima tentativa depois de `tentativas` falhas"""
+    configuracao = configuracao or configuracao_notificacoes()
+    atraso = configuracao['backoff_inicial'] * (2 ** max(tentativas - 1, 0))
+    return timedelta(seconds=min(atraso, configuracao['backoff_maximo']))
+
+def montar_email(notificacao, conexao=None):
+    """Monta a mensagem de email de uma notificação, opcionalmente presa a uma conexão já aberta"""
+    msg = EmailMultiAlternatives(
+        notificacao.assunto,
+        notificacao.texto,
+        settings.EMAIL_HOST_USER or settings.DEFAULT_FROM_EMAIL,
+        notificacao.destinatarios,
+        connection=conexao
+    )
+    if notificacao.html:
+        msg.attach_alternative(notificacao.html, "text/html")
+    return msg
+
+def enviar_notificacao(notificacao, whatsapp=None):
+    """Envia uma notificação; lança exceção em caso de falha"""
+    if notificacao.canal == 'EMAIL':
+        montar_email(notificacao).send(fail_silently=False)
+    else:
+        whatsapp = whatsapp or WhatsAppService()
+        if not whatsapp.send_notification(notificacao.destinatarios[0], notificacao.tipo, notificacao.dados):
+            raise RuntimeError('Falha no envio via WhatsApp')
+
+def _descrever_erro(erro):
+    return str(erro) or erro.__class__.__name__
+
+def _enviar_emails(grupos):
+    """Envia os emails de um lote por uma única conexão SMTP; retorna [(grupo, erro)]"""
+    conexao = get_connection()
+    try:
+        conexao.open()
+    except Exception as erro:
+        return [(grupo, _descrever_erro(erro)) for grupo in grupos]
+
+    resultados = []
+    try:
+        for grupo in grupos:
+            notificacao = grupo[0] if len(grupo) == 1 else _email_resumo(grupo)
+            try:
+                conexao.send_messages([montar_email(notificacao, conexao)])
+                resultados.append((grupo, None))
+            except Exception as erro:
+                resultados.append((grupo, _descrever_erro(erro)))
+    finally:
+        conexao.close()
+    return resultados
+
+def _reservar_lote(limite, configuracao):
+    """Reserva um lote de notificações vencidas adiando a próxima tentativa, para que outro worker não as pegue
+
+    Para cada destinatário em modo resumo presente no lote, todas as notificações vencidas dele
+    entram junto, mesmo passando do limite: assim sai um único resumo por janela.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        vencidas = Notificacao.objects.select_for_update(skip_locked=True).filter(status='PENDENTE', proxima_tentativa__lte=agora)
+        lote = list(vencidas.order_by('proxima_tentativa', 'id')[:limite])
+
+        resumos = {(notificacao.canal, tuple(notificacao.destinatarios)) for notificacao in lote if notificacao.resumo}
+        if resumos:
+            mesmos_destinatarios = Q()
+            for canal, destinatarios in resumos:
+                mesmos_destinatarios |= Q(canal=canal, destinatarios=list(destinatarios))
+            lote += list(
+                vencidas.filter(mesmos_destinatarios, resumo=True)
+                .exclude(id__in=[notificacao.id for notificacao in lote])
+                .order_by('proxima_tentativa', 'id')
+            )
+        if lote:
+            Notificacao.objects.filter(id__in=[notificacao.id for notificacao in lote]).update(
+                proxima_tentativa=agora + timedelta(seconds=configuracao['reserva'])
+            )
+    return lote
+
+def _registrar_resultado(notificacao, erro, configuracao):
+    """Atualiza a notificação depois de uma tentativa de envio (erro None = sucesso)"""
+    notificacao.tentativas += 1
+    if erro is None:
+        notificacao.status = 'ENVIADA'
+        notificacao.enviado_em = timezone.now()
+        notificacao.ultimo_erro = ''
+    else:
+        notificacao.ultimo_erro = erro[:1000]
+        if notificacao.tentativas >= configuracao['max_tentativas']:
+            # Dead letter: fica registrada para análise e reenvio manual pelo admin
+            notificacao.status = 'FALHA'
+        else:
+            notificacao.proxima_tentativa = timezone.now() + calcular_atraso(notificacao.tentativas, configuracao)
+    notificacao.save(update_fields=['status', 'tentativas', 'proxima_tentativa', 'ultimo_erro', 'enviado_em'])
+
+def _agrupar(lote):
+    """Agrupa as notificações em modo resumo por canal e destinatário; as demais ficam sozinhas"""
+    grupos = {}
+    for notificacao in lote:
+        if notificacao.resumo:
+            chave = (notificacao.canal, tuple(notificacao.destinatarios))
+        else:
+            chave = ('UNICA', notificacao.id)
+        grupos.setdefault(chave, []).append(notificacao)
+    return list(grupos.values())
+
+def _email_resumo(grupo):
+    """Monta (sem salvar) um email único com o texto de todas as notificações do grupo"""
+    return Notificacao(
+        canal='EMAIL',
+        tipo='resumo',
+        destinatarios=grupo[0].destinatarios,
+        assunto=f'Resumo de Notificações ({len(grupo)}) - Stock Flow',
+        texto='\n\n---\n\n'.join(f'{notificacao.assunto}\n{notificacao.texto}' for notificacao in grupo),
+    )
+
+def processar_fila(limite=50):
+    """Envia as notificações pendentes vencidas; retorna (enviadas, falhas)
+
+    Notificações em modo resumo do mesmo destinatário e canal saem em uma única mensagem.
+    """
+    configuracao = configuracao_notificacoes()
+    whatsapp = WhatsAppService()
+    grupos = _agrupar(_reservar_lote(limite, configuracao))
+    resultados = []
+
+    mensagens = [grupo for grupo in grupos if grupo[0].canal == 'WHATSAPP']
+    if mensagens and whatsapp.circuito.segundos_para_reabrir():
+        # Provedor fora do ar: as mensagens esperam o circuito reabrir sem consumir tentativas
+        Notificacao.objects.filter(id__in=[notificacao.id for grupo in mensagens for notificacao in grupo]).update(
+            proxima_tentativa=timezone.now() + timedelta(seconds=whatsapp.circuito.segundos_para_reabrir())
+        )
+    elif mensagens:
+        # Envio em paralelo, reaproveitando as conexões da sessão do serviço
+        envios = []
+        for grupo in mensagens:
+            if len(grupo) == 1:
+                envios.append((grupo[0].destinatarios[0], grupo[0].tipo, grupo[0].dados))
+            else:
+                itens = [{'tipo': notificacao.tipo, 'dados': notificacao.dados} for notificacao in grupo]
+                envios.append((grupo[0].destinatarios[0], 'resumo', {'itens': itens}))
+        enviados = whatsapp.send_notifications(envios)
+        resultados += [
+            (grupo, None if enviado else 'Falha no envio via WhatsApp')
+            for grupo, enviado in zip(mensagens, enviados)
+        ]
+
+    emails = [grupo for grupo in grupos if grupo[0].canal == 'EMAIL']
+    if emails:
+        resultados += _enviar_emails(emails)
+
+    enviadas = falhas = 0
+    for grupo, erro in resultados:
+        for notificacao in grupo:
+            _registrar_resultado(notificacao, erro, configuracao)
+        if erro is None:
+            enviadas += len(grupo)
+        else:
+            falhas += len(grupo)
+    return enviadas, falhas
@@ -0,0 +1,122 @@
+import math
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+# Limites padrão por grupo de endpoints: capacidade do balde e tokens repostos por segundo.
+# Podem ser sobrescritos em settings.RATE_LIMITS.
+RATE_LIMITS_PADRAO = {
+    'api': {'capacidade': 120, 'por_segundo': 2},
+    'login': {'capacidade': 10, 'por_segundo': 10 / 60},
+    'totp': {'capacidade': 5, 'por_segundo': 5 / 60},
+    'relatorios': {'capacidade': 5, 'por_segundo': 1 / 30},
+}
+
+# Trava de cada balde: requisições simultâneas do mesmo cliente leem e gravam o saldo uma de cada
+# vez. Se a trava não sair dentro da espera (trava abandonada, cache lento), a requisição segue
+# sem ela e só nesse caso o limite fica aproximado.
+RATE_LIMIT_TEMPO_TRAVA = 1
+RATE_LIMIT_ESPERA_MAXIMA = 0.2
+RATE_LIMIT_INTERVALO_ESPERA = 0.005
+
+# ============================================================================
+# FUNÇÕES AUXILIARES
+# ============================================================================
+
+def configuracao_limites():
+    """Retorna os limites efetivos (padrão + settings.RATE_LIMITS)"""
+    return {**RATE_LIMITS_PADRAO, **getattr(settings, 'RATE_LIMITS', {})}
+
+def identificar_cliente(request):
+    """Identifica o cliente pelo usuário logado ou, para anônimos, pelo IP"""
+    if request.user.is_authenticated:
+        return f'u{request.user.id}'
+    # Cada proxy confiável adiciona um IP no fim do X-Forwarded-For; o que vem antes deles pode ter
+    # sido enviado pelo próprio cliente, então só é lido o IP adicionado pelo proxy mais externo
+    proxies = getattr(settings, 'RATE_LIMIT_PROXIES', 0)
+    encaminhado = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if proxies and encaminhado:
+        return encaminhado[-min(proxies, len(encaminhado))]
+    return request.META.get('REMOTE_ADDR', '')
+
+def _contar(grupo, resultado):
+    chave = f'rl:contador:{grupo}:{resultado}'
+    cache.add(chave, 0, None)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 1, None)
+
+def _travar(trava):
+    """Tenta obter a trava (cache.add) até a espera máxima; retorna se conseguiu"""
+    limite = time.monotonic() + RATE_LIMIT_ESPERA_MAXIMA
+    while not cache.add(trava, 1, RATE_LIMIT_TEMPO_TRAVA):
+        if time.monotonic() >= limite:
+            return False
+        time.sleep(RATE_LIMIT_INTERVALO_ESPERA)
+    return True
+
+def consumir_token(grupo, identidade):
+    """Consome um token do balde do cliente; retorna (permitido, segundos até o próximo token)"""
+    limite = configuracao_limites()[grupo]
+    capacidade, por_segundo = limite['capacidade'], limite['por_segundo']
+    chave = f'rl:balde:{grupo}:{identidade}'
+
+    travado = _travar(f'{chave}:trava')
+    try:
+        agora = time.time()
+        tokens, ultimo = cache.get(chave, (capacidade, agora))
+        tokens = min(capacidade, tokens + (agora - ultimo) * por_segundo)
+
+        permitido = tokens >= 1
+        if permitido:
+            tokens -= 1
+        # O balde expira sozinho quando já estaria cheio de novo
+        cache.set(chave, (tokens, agora), math.ceil(capacidade / por_segundo))
+    finally:
+        if travado:
+            cache.delete(f'{chave}:trava')
+    _contar(grupo, 'permitidas' if permitido else 'rejeitadas')
+
+    espera = 0 if permitido else math.ceil((1 - tokens) / por_segundo)
+    return permitido, espera
+
+def contadores_limites():
+    """Retorna as requisições permitidas e rejeitadas por grupo, para dimensionar os limites"""
+    chaves = [f'rl:contador:{grupo}:{resultado}' for grupo in configuracao_limites() for resultado in ('permitidas', 'rejeitadas')]
+    valores = cache.get_many(chaves)
+    return {
+        grupo: {
+            resultado: valores.get(f'rl:contador:{grupo}:{resultado}', 0)
+            for resultado in ('permitidas', 'rejeitadas')
+        }
+        for grupo in configuracao_limites()
+    }
+
+# ============================================================================
+# DECORATOR
+# ============================================================================
+
+def limitar_taxa(grupo, metodos=None):
+    """Aplica o token bucket do grupo à view; responde 429 com Retry-After quando o balde esvazia
+
+    metodos restringe o limite a alguns métodos HTTP (ex.: apenas POST no login).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if metodos is None or request.method in metodos:
+                permitido, espera = consumir_token(grupo, identificar_cliente(request))
+                if not permitido:
+                    mensagem = 'Muitas requisições. Tente novamente em instantes.'
+                    if grupo == 'api':
+                        response = JsonResponse({"error": mensagem}, status=429)
+                    else:
+                        response = HttpResponse(mensagem, status=429, content_type='text/plain; charset=utf-8')
+                    response['Retry-After'] = str(espera)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return _wrapped
+    return decorator
@@ -0,0 +1,112 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import AlertaEstoque, Product, VarreduraEstoque
+from .notificacoes import destinatarios, enfileirar_email, enfileirar_whatsapp, renderizar_email
+
+# ============================================================================
+# REGRA DE REPOSIÇÃO
+# ============================================================================
+# Um produto precisa de compra quando a quantidade chega na carência (quantidade <= carencia).
+# A mesma regra vale para o relatório Excel ("Realizar Compra"), para os indicadores dos
+# dashboards, para a lista de reposição e para os alertas de estoque baixo.
+
+# Folga do produto: quanto ainda falta para chegar na carência. A expressão é a mesma do
+# índice produto_folga_idx, então os filtros e a ordenação por folga usam o índice.
+FOLGA = F('quantidade') - F('carencia')
+
+# Folga até a qual o estoque geral mostra o produto em amarelo (atenção)
+MARGEM_ATENCAO_PADRAO = 5
+
+def margem_atencao():
+    """Margem de atenção do estoque geral, configurável em settings.REPOSICAO_MARGEM_ATENCAO"""
+    return getattr(settings, 'REPOSICAO_MARGEM_ATENCAO', MARGEM_ATENCAO_PADRAO)
+
+def abaixo_da_carencia(quantidade, carencia):
+    """True quando o produto está no limite da carência e precisa de reposição"""
+    return quantidade <= (carencia or 0)
+
+# Filtro equivalente a abaixo_da_carencia() para as consultas no banco
+FILTRO_ABAIXO_CARENCIA = Q(quantidade__lte=F('carencia'))
+
+def candidatos_reposicao(margem=0):
+    """Produtos com folga <= margem, do mais crítico para o menos crítico (folga, id)"""
+    return (Product.objects.annotate(folga=FOLGA)
+            .filter(folga__lte=margem)
+            .order_by('folga', 'id'))
+
+# ============================================================================
+# VARREDURA DE ESTOQUE BAIXO
+# ============================================================================
+# A varredura só olha os produtos alterados (atualizado_em) desde o início da execução
+# anterior e compara com o estado guardado em AlertaEstoque: a notificação sai apenas
+# quando o produto cruza a carência, não a cada execução enquanto ele continua abaixo.
+# A primeira execução (sem varredura anterior) só registra o estado de todo o catálogo, como
+# linha de base: os produtos que já estavam abaixo da carência não viram uma rajada de alertas
+# e continuam visíveis na página de reposição.
+
+# Folga aplicada ao início da última varredura, para não perder produtos salvos em
+# transações que ainda não tinham sido confirmadas quando ela rodou
+MARGEM_VARREDURA = timedelta(minutes=1)
+
+# Quantidade de execuções mantidas no histórico
+VARREDURAS_MANTIDAS = 100
+
+def _produtos_alterados(desde):
+    produtos = Product.objects.order_by('id')
+    if desde is not None:
+        produtos = produtos.filter(atualizado_em__gte=desde - MARGEM_VARREDURA)
+    return produtos.values_list('id', 'codigo', 'nome', 'quantidade', 'carencia')
+
+def _notificar_estoque_baixo(itens):
+    data = timezone.localtime().strftime('%d/%m/%Y às %H:%M')
+    texto, html = renderizar_email('estoque_baixo', {'itens': itens, 'data': data})
+    enfileirar_email('estoque_baixo', 'Estoque Baixo - Stock Flow', texto, destinatarios('admin', 'email'), html=html)
+    enfileirar_whatsapp('estoque_baixo', destinatarios('admin', 'whatsapp'), {'itens': itens, 'data': data})
+
+def verificar_estoque_baixo(completa=False):
+    """Verifica os produtos alterados desde a última varredura e notifica os que cruzaram a carência
+
+    Com completa=True todo o catálogo é verificado (útil após importações feitas direto no
+    banco). A primeira execução verifica o catálogo inteiro sem notificar. O estado, as
+    notificações e o registro da execução são gravados na mesma transação. Retorna a
+    VarreduraEstoque criada.
+    """
+    inicio = timezone.now()
+    with transaction.atomic():
+        # Trava a última execução: varreduras simultâneas rodam uma depois da outra
+        ultima = VarreduraEstoque.objects.select_for_update().order_by('-iniciada_em').first()
+        linha_de_base = ultima is None
+        produtos = list(_produtos_alterados(None if completa or linha_de_base else ultima.iniciada_em))
+
+        estados = AlertaEstoque.objects.select_for_update().in_bulk(
+            [produto_id for produto_id, *_ in produtos], field_name='produto_id'
+        )
+        novos, alterados, itens = [], [], []
+        for produto_id, codigo, nome, quantidade, carencia in produtos:
+            abaixo = abaixo_da_carencia(quantidade, carencia)
+            estado = estados.get(produto_id)
+            if estado is None:
+                estado = AlertaEstoque(produto_id=produto_id)
+                novos.append(estado)
+            elif estado.abaixo_carencia == abaixo:
+                continue
+            else:
+                alterados.append(estado)
+
+            estado.abaixo_carencia = abaixo
+            if abaixo and not linha_de_base:
+                estado.alertado_em = inicio
+                itens.append({'codigo': codigo, 'produto': nome, 'quantidade': quantidade, 'carencia': carencia})
+
+        AlertaEstoque.objects.bulk_create(novos)
+        AlertaEstoque.objects.bulk_update(alterados, ['abaixo_carencia', 'alertado_em'])
+        if itens:
+            _notificar_estoque_baixo(itens)
+
+        varredura = VarreduraEstoque.objects.create(iniciada_em=inicio, produtos_verificados=len(produtos), alertas=len(itens))
+        antigas = VarreduraEstoque.objects.order_by('-iniciada_em').values_list('id', flat=True)[VARREDURAS_MANTIDAS:]
+        VarreduraEstoque.objects.filter(id__in=list(antigas)).delete()
+    return varredura
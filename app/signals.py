@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CustomUser, Product, Movimentacao, ProdutoRemovido, Solicitacao, VersaoRecurso
+from .notificacoes import limpar_destinatarios
+
+# ============================================================================
+# VERSÕES DE RECURSOS (ETAGS E CACHE DA API)
+# ============================================================================
+# As versões sobem só depois do commit (VersaoRecurso.incrementar_apos_commit): antes dele
+# nenhum leitor enxerga os dados novos, e assim a linha da versão não fica travada durante
+# a transação de quem escreve.
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def incrementar_versao_catalogo(sender, **kwargs):
+    """Invalida ETags do catálogo sempre que um produto é salvo ou removido"""
+    VersaoRecurso.incrementar_apos_commit('catalogo')
+
+@receiver(post_save, sender=Movimentacao)
+@receiver(post_delete, sender=Movimentacao)
+def incrementar_versao_movimentacoes(sender, **kwargs):
+    """Invalida o cache da API de movimentações a cada movimentação salva ou removida"""
+    VersaoRecurso.incrementar_apos_commit('movimentacoes')
+
+@receiver(post_save, sender=Solicitacao)
+@receiver(post_delete, sender=Solicitacao)
+def incrementar_versao_solicitacoes(sender, **kwargs):
+    """Invalida os fragmentos de solicitações pendentes dos dashboards"""
+    VersaoRecurso.incrementar_apos_commit('solicitacoes')
+
+# ============================================================================
+# SINCRONIZAÇÃO INCREMENTAL
+# ============================================================================
+
+@receiver(post_delete, sender=Product)
+def registrar_produto_removido(sender, instance, **kwargs):
+    """Guarda o tombstone do produto removido para o feed de alterações"""
+    ProdutoRemovido.objects.create(produto_id=instance.id, codigo=instance.codigo)
+
+# ============================================================================
+# DIRETÓRIO DE DESTINATÁRIOS DAS NOTIFICAÇÕES
+# ============================================================================
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidar_destinatarios(sender, **kwargs):
+    """Limpa o cache de emails/telefones por nível de acesso quando um usuário muda
+
+    A limpeza espera o commit: antes dele uma leitura concorrente ainda enxerga as linhas antigas
+    e as gravaria de volta no cache.
+    """
+    transaction.on_commit(limpar_destinatarios)
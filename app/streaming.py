@@ -0,0 +1,36 @@
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+# ============================================================================
+# RESPOSTAS EM STREAMING
+# ============================================================================
+# O Django só transmite de verdade quando o tipo do iterador combina com o servidor: sob ASGI
+# um iterador síncrono é lido inteiro com sync_to_async(list) antes do primeiro byte, e sob
+# WSGI acontece o mesmo com iteradores assíncronos. Os geradores das views continuam
+# síncronos; nas requisições ASGI eles são consumidos em lotes na thread da requisição (a
+# mesma da conexão com o banco), e cada lote é enviado assim que fica pronto.
+
+# Partes lidas do gerador a cada ida à thread da requisição
+PARTES_POR_LOTE = 500
+
+async def _iterar_em_lotes(iterador, tamanho):
+    ler_lote = sync_to_async(lambda: list(islice(iterador, tamanho)))
+    try:
+        while True:
+            lote = await ler_lote()
+            if not lote:
+                return
+            for parte in lote:
+                yield parte
+    finally:
+        # Cliente desconectado no meio do download: fecha o gerador e o cursor do banco
+        if hasattr(iterador, 'close'):
+            await sync_to_async(iterador.close)()
+
+def resposta_streaming(request, conteudo, **kwargs):
+    """StreamingHttpResponse que envia `conteudo` (iterador síncrono) aos poucos, em WSGI ou ASGI"""
+    if isinstance(request, ASGIRequest):
+        conteudo = _iterar_em_lotes(iter(conteudo), PARTES_POR_LOTE)
+    return StreamingHttpResponse(conteudo, **kwargs)
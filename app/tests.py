@@ -1,15 +1,75 @@
-from django.test import TestCase, Client
+from django.apps import apps as django_apps
+from django.test import TestCase, Client, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection, transaction
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import Product, Solicitacao, Movimentacao, Entradas, Saidas, logs
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
+from django.core.mail import get_connection
+from django.utils import timezone
+from .models import Product, Solicitacao, Movimentacao, Entradas, Saidas, logs, VersaoRecurso, EventoEstoque, Notificacao, ChaveIdempotencia, IndicadorEstoque, AlertaEstoque, VarreduraEstoque
+from .notificacoes import destinatarios, enfileirar_email, enfileirar_whatsapp, processar_fila, renderizar_email
+from .whatsapp_service import WhatsAppService, CircuitBreaker, circuito_whatsapp
 from .views_log import registrar_log
+from .ratelimit import consumir_token
+from .urls import urlpatterns
+from .estoque import ajustar_ledger, criar_fechamento, divergencias_estoque, saldos_ledger
+from .indicadores import indicadores_dashboard, recalcular_indicadores
 from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import asyncio
+import importlib
 import json
+import os
+import threading
+import time
+import unittest
+from io import StringIO
+from urllib.parse import unquote_plus
+from datetime import timedelta
 
 User = get_user_model()
 
-class ComprehensiveTestCase(TestCase):
+class ServidorWhatsAppLocal:
+    # Servidor HTTP local que substitui a API do UltraMsg nos testes da fila de notificações
+    def __init__(self, status=200):
+        recebidas = self.recebidas = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                recebidas.append((self.path, self.rfile.read(int(self.headers['Content-Length'])).decode()))
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = HTTPServer(('127.0.0.1', 0), Handler)
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.ambiente = patch.dict(os.environ, {
+            'ULTRAMSG_BASE_URL': f'http://127.0.0.1:{self.servidor.server_port}',
+            'ULTRAMSG_INSTANCE_ID': 'instancia',
+            'ULTRAMSG_TOKEN': 'token',
+        })
+        self.ambiente.start()
+        return self
+
+    def __exit__(self, *args):
+        self.ambiente.stop()
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+class EstoqueTestCase(TestCase):
+    # Usuários e produto básicos usados por todas as suítes
     def setUp(self):
+        # As versões dos recursos voltam ao início a cada teste, então o cache também precisa
+        cache.clear()
+        circuito_whatsapp.fechar()
         self.client = Client()
         self.admin_user = User.objects.create_user(
             username='admin', email='admin@test.com', password='test123', nivel_acesso='admin'
@@ -24,6 +84,7 @@ class ComprehensiveTestCase(TestCase):
             nome='Produto Teste', codigo='TEST001', quantidade=50, local='Estoque A', carencia=10
         )
 
+class ComprehensiveTestCase(EstoqueTestCase):
     # Testes de Models
     def test_product_creation(self):
         self.assertEqual(str(self.produto), 'Produto Teste')
@@ -74,6 +135,59 @@ class ComprehensiveTestCase(TestCase):
         response = self.client.post(reverse('login'), {'username': 'wrong', 'password': 'wrong'})
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(RATE_LIMITS={'login': {'capacidade': 2, 'por_segundo': 0.01}})
+    def test_login_rate_limit(self):
+        for _ in range(2):
+            response = self.client.post(reverse('login'), {'username': 'wrong', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('login'), {'username': 'wrong', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        # 100s para repor o token, menos o que já foi reposto durante os logins
+        self.assertTrue(98 <= int(response['Retry-After']) <= 100)
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+    @override_settings(RATE_LIMITS={'api': {'capacidade': 1, 'por_segundo': 0.01}})
+    def test_rate_limit_x_forwarded_for(self):
+        url = reverse('listar_produtos_api')
+        # Sem proxies confiáveis o header é ignorado: trocar o X-Forwarded-For não dá um balde novo
+        self.client.get(url, HTTP_X_FORWARDED_FOR='1.1.1.1')
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='2.2.2.2').status_code, 429)
+        with self.settings(RATE_LIMIT_PROXIES=1):
+            # Atrás de um proxy vale o IP que ele adicionou, não o que o cliente enviou antes
+            self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='9.9.9.9, 3.3.3.3').status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='8.8.8.8, 3.3.3.3').status_code, 429)
+
+    @override_settings(RATE_LIMITS={'api': {'capacidade': 5, 'por_segundo': 0.01}})
+    def test_rate_limit_concorrente(self):
+        # Threads do mesmo cliente não podem ler o mesmo saldo e passar juntas da capacidade;
+        # a leitura lenta do cache abre a janela entre o get e o set do balde
+        resultados = []
+        # (o backend é trocado na classe porque cada thread tem a sua instância do cache)
+        backend = type(caches['default'])
+        ler = backend.get
+        def ler_devagar(self, *args, **kwargs):
+            valor = ler(self, *args, **kwargs)
+            time.sleep(0.01)
+            return valor
+        def consumir():
+            for _ in range(5):
+                resultados.append(consumir_token('api', 'cliente-concorrente')[0])
+        with patch.object(backend, 'get', ler_devagar):
+            threads = [threading.Thread(target=consumir) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(resultados.count(True), 5)
+
+    @override_settings(RATE_LIMITS={'api': {'capacidade': 1, 'por_segundo': 1}})
+    def test_limites_taxa_api(self):
+        self.client.get(reverse('listar_produtos_api'))
+        self.assertEqual(self.client.get(reverse('listar_produtos_api')).status_code, 429)
+        self.client.login(username='super', password='test123')
+        data = json.loads(self.client.get(reverse('limites_taxa_api')).content)
+        self.assertEqual(data['contadores']['api'], {'permitidas': 1, 'rejeitadas': 1})
+
     def test_dashboard_redirect(self):
         self.client.login(username='admin', password='test123')
         response = self.client.get(reverse('dashboard'))
@@ -89,6 +203,61 @@ class ComprehensiveTestCase(TestCase):
         response = self.client.get(reverse('dashboard_super'))
         self.assertEqual(response.status_code, 200)
 
+    def test_dashboard_admin_tamanho_constante(self):
+        Product.objects.bulk_create([
+            Product(nome=f'Produto {i}', codigo=f'P{i:03d}', quantidade=i, local='A') for i in range(60)
+        ])
+        self.client.login(username='admin', password='test123')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('dashboard_admin'))
+        self.assertFalse([q for q in consultas.captured_queries if 'app_product' in q['sql']])
+        self.assertNotContains(response, 'Produto 59')
+        self.assertContains(response, reverse('painel_dashboard', args=['produtos']))
+
+    def test_painel_produtos_paginado(self):
+        Product.objects.bulk_create([
+            Product(nome=f'Produto {i}', codigo=f'P{i:03d}', quantidade=i, local='A') for i in range(30)
+        ])
+        self.client.login(username='admin', password='test123')
+        response = self.client.get(reverse('painel_dashboard', args=['produtos']), {'page': 2})
+        self.assertContains(response, 'Produto 25')
+        self.assertNotContains(response, 'Produto 24')
+        self.assertContains(response, '2 de 2')
+        data = self.client.get(reverse('painel_dashboard', args=['produtos']), HTTP_ACCEPT='application/json').json()
+        self.assertEqual((data['total'], data['paginas'], len(data['itens'])), (31, 2, 25))
+        self.assertEqual(set(data['itens'][0]), {'id', 'codigo', 'nome', 'quantidade', 'local', 'carencia'})
+
+    def test_painel_acesso(self):
+        self.client.login(username='admin', password='test123')
+        self.assertEqual(self.client.get(reverse('painel_dashboard', args=['usuarios'])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('painel_dashboard', args=['inexistente'])).status_code, 404)
+        self.client.login(username='super', password='test123')
+        self.assertContains(self.client.get(reverse('painel_dashboard', args=['usuarios'])), 'comum@test.com')
+        self.client.login(username='comum', password='test123')
+        self.assertEqual(self.client.get(reverse('painel_dashboard', args=['produtos'])).status_code, 403)
+
+    def test_painel_fragmentos_cacheados(self):
+        Solicitacao.objects.create(produto=self.produto, quantidade=5, destino='TI', solicitante='comum')
+        self.client.login(username='admin', password='test123')
+        url = reverse('painel_dashboard', args=['solicitacoes'])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as segunda:
+            response = self.client.get(url)
+        # Só a contagem do paginador vai ao banco; as linhas vêm do fragmento cacheado
+        self.assertEqual(len([q for q in segunda.captured_queries if 'app_solicitacao' in q['sql']]), 1)
+        self.assertContains(response, reverse('aprovar_solicitacao', args=[Solicitacao.objects.get().id]))
+
+    def test_painel_fragmentos_invalidados(self):
+        self.client.login(username='admin', password='test123')
+        for painel in ('produtos', 'entradas', 'solicitacoes'):
+            self.client.get(reverse('painel_dashboard', args=[painel]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 7})
+            Solicitacao.objects.create(produto=self.produto, quantidade=3, destino='Almoxarifado', solicitante='comum')
+        self.assertContains(self.client.get(reverse('painel_dashboard', args=['produtos'])), '<td>57</td>')
+        self.assertContains(self.client.get(reverse('painel_dashboard', args=['entradas'])), '+7')
+        self.assertContains(self.client.get(reverse('painel_dashboard', args=['solicitacoes'])), 'Almoxarifado')
+
     def test_dashboard_comum(self):
         self.client.login(username='comum', password='test123')
         response = self.client.get(reverse('dashboard_comum'))
@@ -152,15 +321,41 @@ class ComprehensiveTestCase(TestCase):
         response = self.client.get(reverse('listar_movimentacoes'))
         self.assertEqual(response.status_code, 302)
 
+    def test_exportar_movimentacoes_csv(self):
+        outro = Product.objects.create(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+        Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=7, usuario='admin')
+        Movimentacao.objects.create(tipo='RETIRADA', produto=outro, quantidade=2, usuario='super')
+        self.client.login(username='admin', password='test123')
+        response = self.client.get(reverse('exportar_movimentacoes_csv'), {'codigo': 'TEST'})
+        self.assertEqual(response.status_code, 200)
+        linhas = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(linhas), 2)
+        self.assertIn('Entrada;TEST001;Produto Teste;7;admin', linhas[1])
+
+    async def test_exportar_movimentacoes_csv_asgi(self):
+        await Movimentacao.objects.acreate(tipo='ENTRADA', produto=self.produto, quantidade=7, usuario='admin')
+        client = AsyncClient()
+        await client.aforce_login(self.admin_user)
+        response = await client.get(reverse('exportar_movimentacoes_csv'))
+        self.assertTrue(response.is_async)
+        linhas = b''.join([parte async for parte in response.streaming_content]).decode('utf-8-sig').splitlines()
+        self.assertIn('Entrada;TEST001;Produto Teste;7;admin', linhas[1])
+
+    def test_exportar_movimentacoes_csv_comum_denied(self):
+        self.client.login(username='comum', password='test123')
+        response = self.client.get(reverse('exportar_movimentacoes_csv'))
+        self.assertEqual(response.status_code, 302)
+
     # Testes de Solicitações
-    @patch('app.views_product.EmailMultiAlternatives')
-    def test_solicitar_produto(self, mock_email):
-        mock_email.return_value.send.return_value = True
+    def test_solicitar_produto(self):
         self.client.login(username='admin', password='test123')
         response = self.client.post(reverse('solicitar_produto'), {
             'codigo': 'TEST001', 'quantidade': 5, 'destino': 'TI'
         })
         self.assertEqual(response.status_code, 302)
+        # O email vai para a fila; nada é enviado durante a requisição
+        self.assertEqual(Notificacao.objects.get().tipo, 'nova_solicitacao')
+        self.assertEqual(len(mail.outbox), 0)
 
     def test_solicitar_produto_quantidade_zero(self):
         self.client.login(username='admin', password='test123')
@@ -169,15 +364,37 @@ class ComprehensiveTestCase(TestCase):
         })
         self.assertEqual(response.status_code, 302)
 
-    @patch('app.views_product.EmailMultiAlternatives')
-    def test_entrada_produto(self, mock_email):
-        mock_email.return_value.send.return_value = True
+    def test_entrada_produto(self):
         self.client.login(username='admin', password='test123')
         response = self.client.post(reverse('entrada_produto'), {
             'codigo': 'TEST001', 'quantidade': 20
         })
         self.assertEqual(response.status_code, 302)
 
+    def test_aprovar_solicitacao(self):
+        sol = Solicitacao.objects.create(produto=self.produto, quantidade=20, destino='TI', solicitante='comum')
+        self.client.login(username='admin', password='test123')
+        response = self.client.get(reverse('aprovar_solicitacao', args=[sol.id]))
+        self.assertEqual(response.status_code, 302)
+        self.produto.refresh_from_db()
+        sol.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 30)
+        self.assertEqual(sol.status, 'ATENDIDA')
+        self.assertEqual(Saidas.objects.get().quantidade, 20)
+        # Uma segunda aprovação da mesma solicitação não retira de novo
+        response = self.client.get(reverse('aprovar_solicitacao', args=[sol.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_aprovar_solicitacao_estoque_insuficiente(self):
+        sol = Solicitacao.objects.create(produto=self.produto, quantidade=51, destino='TI', solicitante='comum')
+        self.client.login(username='admin', password='test123')
+        self.client.get(reverse('aprovar_solicitacao', args=[sol.id]))
+        self.produto.refresh_from_db()
+        sol.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 50)
+        self.assertEqual(sol.status, 'PENDENTE')
+        self.assertFalse(Movimentacao.objects.filter(tipo='RETIRADA').exists())
+
     # Testes de Usuários
     def test_perfil_get(self):
         self.client.login(username='admin', password='test123')
@@ -246,6 +463,88 @@ class ComprehensiveTestCase(TestCase):
         data = json.loads(response.content)
         self.assertIn('produtos', data)
 
+    def test_listar_produtos_api_cache(self):
+        self.client.get(reverse('listar_produtos_api'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('listar_produtos_api'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+        data = json.loads(self.client.get(reverse('listar_produtos_api')).content)
+        self.assertEqual(len(data['produtos']), 2)
+
+    def test_obter_ou_gerar_stampede(self):
+        import threading
+        from .cache_api import obter_ou_gerar
+        chamadas = []
+        # Outro processo está com a trava: a requisição espera o valor em vez de gerar de novo
+        cache.add('chave:trava', 1)
+        threading.Timer(0.1, cache.set, args=('chave', 'pronto')).start()
+        self.assertEqual(obter_ou_gerar('chave', lambda: chamadas.append(1)), 'pronto')
+        self.assertEqual(chamadas, [])
+        cache.delete_many(['chave', 'chave:trava'])
+        self.assertEqual(obter_ou_gerar('chave', lambda: chamadas.append(1) or 'novo'), 'novo')
+        self.assertEqual(obter_ou_gerar('chave', lambda: chamadas.append(1) or 'outro'), 'novo')
+        self.assertEqual(len(chamadas), 1)
+
+    def test_listar_produtos_api_ndjson(self):
+        Product.objects.create(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+        response = self.client.get(reverse('listar_produtos_api'), {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        linhas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linha)['codigo'] for linha in linhas], ['TEST001', 'OUT001'])
+
+    @patch('app.streaming.PARTES_POR_LOTE', 1)
+    async def test_listar_produtos_api_ndjson_asgi(self):
+        # Sob ASGI a resposta precisa de um iterador assíncrono para não ser lida inteira antes do envio
+        await Product.objects.acreate(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+        response = await AsyncClient().get(reverse('listar_produtos_api'), {'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        linhas = b''.join([parte async for parte in response.streaming_content]).decode().splitlines()
+        self.assertEqual([json.loads(linha)['codigo'] for linha in linhas], ['TEST001', 'OUT001'])
+
+    def test_listar_produtos_api_formato_invalido(self):
+        response = self.client.get(reverse('listar_produtos_api'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_listar_produtos_api_etag(self):
+        response = self.client.get(reverse('listar_produtos_api'))
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('listar_produtos_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.produto.quantidade = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.save()
+        response = self.client.get(reverse('detalhes_produtos_api', args=[self.produto.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_versao_catalogo_entrada_produto(self):
+        versao, _ = VersaoRecurso.atual('catalogo')
+        self.client.login(username='admin', password='test123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 5})
+        self.assertGreater(VersaoRecurso.atual('catalogo')[0], versao)
+
+    def test_versao_incrementada_apos_commit(self):
+        versao = VersaoRecurso.atual('catalogo')[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            Product.objects.create(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+            # Antes do commit a linha da versão nem é tocada
+            self.assertEqual(VersaoRecurso.atual('catalogo')[0], versao)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(VersaoRecurso.atual('catalogo')[0], versao + 1)
+
+    def test_listar_produtos_api_fields(self):
+        response = self.client.get(reverse('listar_produtos_api'), {'fields': 'codigo,quantidade'})
+        data = json.loads(response.content)
+        self.assertEqual(data['produtos'], [{'codigo': 'TEST001', 'quantidade': 50}])
+
+    def test_listar_produtos_api_fields_invalido(self):
+        response = self.client.get(reverse('listar_produtos_api'), {'fields': 'codigo,senha'})
+        self.assertEqual(response.status_code, 400)
+
     def test_detalhes_produto_api(self):
         response = self.client.get(reverse('detalhes_produtos_api', args=[self.produto.id]))
         self.assertEqual(response.status_code, 200)
@@ -256,10 +555,657 @@ class ComprehensiveTestCase(TestCase):
         response = self.client.get(reverse('detalhes_produtos_api', args=[9999]))
         self.assertEqual(response.status_code, 404)
 
+    def test_lote_produtos_api_codigos(self):
+        Product.objects.create(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse('lote_produtos_api'),
+                json.dumps({'codigos': ['OUT001', 'NAOEXISTE', 'TEST001']}),
+                content_type='application/json'
+            )
+        data = json.loads(response.content)
+        self.assertEqual([p['codigo'] for p in data['produtos']], ['OUT001', 'TEST001'])
+        self.assertEqual(data['nao_encontrados'], ['NAOEXISTE'])
+        self.assertIn('carencia', data['produtos'][0])
+
+    def test_lote_produtos_api_ids(self):
+        response = self.client.get(reverse('lote_produtos_api'), {'ids': f'{self.produto.id},9999'})
+        data = json.loads(response.content)
+        self.assertEqual(data['produtos'][0]['nome'], 'Produto Teste')
+        self.assertEqual(data['nao_encontrados'], [9999])
+
+    def test_lote_produtos_api_limite(self):
+        ids = ','.join(str(i) for i in range(1000))
+        response = self.client.get(reverse('lote_produtos_api'), {'ids': ids})
+        self.assertEqual(response.status_code, 400)
+
     def test_listar_movimentacoes_api(self):
         response = self.client.get(reverse('listar_movimentacoes_api'))
         self.assertEqual(response.status_code, 200)
 
+    def test_listar_movimentacoes_api_cursor(self):
+        for i in range(3):
+            Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=i + 1, usuario='admin')
+        # Uma consulta para as versões do cache e uma para a página
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('listar_movimentacoes_api'), {'limit': 2})
+        data = json.loads(response.content)
+        self.assertEqual([m['quantidade'] for m in data['movimentacoes']], [3, 2])
+        self.assertIsNotNone(data['proximo_cursor'])
+        response = self.client.get(reverse('listar_movimentacoes_api'), {'limit': 2, 'cursor': data['proximo_cursor']})
+        data = json.loads(response.content)
+        self.assertEqual([m['quantidade'] for m in data['movimentacoes']], [1])
+        self.assertIsNone(data['proximo_cursor'])
+
+    def test_listar_movimentacoes_api_cache(self):
+        Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=1, usuario='admin')
+        primeira = self.client.get(reverse('listar_movimentacoes_api')).content
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('listar_movimentacoes_api')).content, primeira)
+        with self.captureOnCommitCallbacks(execute=True):
+            Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=2, usuario='admin')
+        data = json.loads(self.client.get(reverse('listar_movimentacoes_api')).content)
+        self.assertEqual(len(data['movimentacoes']), 2)
+
+    def test_listar_movimentacoes_api_filtros(self):
+        outro = Product.objects.create(nome='Outro', codigo='OUT001', quantidade=1, local='B')
+        Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=1, usuario='admin')
+        Movimentacao.objects.create(tipo='ENTRADA', produto=outro, quantidade=1, usuario='super')
+        response = self.client.get(reverse('listar_movimentacoes_api'), {'codigo': 'OUT', 'usuario': 'sup'})
+        data = json.loads(response.content)
+        self.assertEqual([m['produto'] for m in data['movimentacoes']], ['Outro'])
+
+    def test_listar_movimentacoes_api_json_stream(self):
+        for i in range(3):
+            Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=i + 1, usuario='admin')
+        response = self.client.get(reverse('listar_movimentacoes_api'), {'format': 'json-stream', 'limit': 1})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([m['quantidade'] for m in data], [3, 2, 1])
+        self.assertEqual(data[0]['produto'], 'Produto Teste')
+
+    def test_listar_movimentacoes_api_fields(self):
+        for i in range(3):
+            Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=i + 1, usuario='admin')
+        response = self.client.get(reverse('listar_movimentacoes_api'), {'fields': 'codigo,quantidade', 'limit': 2})
+        data = json.loads(response.content)
+        self.assertEqual(data['movimentacoes'], [{'codigo': 'TEST001', 'quantidade': 3}, {'codigo': 'TEST001', 'quantidade': 2}])
+        response = self.client.get(reverse('listar_movimentacoes_api'), {'fields': 'quantidade', 'cursor': data['proximo_cursor']})
+        self.assertEqual(json.loads(response.content)['movimentacoes'], [{'quantidade': 1}])
+
+    def test_listar_movimentacoes_api_cursor_invalido(self):
+        response = self.client.get(reverse('listar_movimentacoes_api'), {'cursor': 'invalido'})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('app.views_api.MARGEM_TOKEN_ALTERACOES', timedelta(0))
+    def test_alteracoes_api(self):
+        removido = Product.objects.create(nome='Removido', codigo='DEL001', quantidade=1, local='B')
+        Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=1, usuario='admin')
+        data = json.loads(self.client.get(reverse('alteracoes_api')).content)
+        self.assertEqual({p['codigo'] for p in data['produtos']}, {'TEST001', 'DEL001'})
+        self.assertEqual(data['movimentacoes'], [])
+
+        novo = Product.objects.create(nome='Novo', codigo='NEW001', quantidade=1, local='B')
+        removido_id = removido.id
+        removido.delete()
+        Movimentacao.objects.create(tipo='ENTRADA', produto=novo, quantidade=3, usuario='admin')
+        data = json.loads(self.client.get(reverse('alteracoes_api'), {'since': data['token']}).content)
+        self.assertIn('NEW001', [p['codigo'] for p in data['produtos']])
+        self.assertEqual(data['removidos'], [{'id': removido_id, 'codigo': 'DEL001'}])
+        self.assertEqual([(m['codigo'], m['quantidade']) for m in data['movimentacoes']], [('NEW001', 3)])
+
+        data = json.loads(self.client.get(reverse('alteracoes_api'), {'since': data['token']}).content)
+        self.assertEqual(data['removidos'], [])
+        self.assertEqual(data['movimentacoes'], [])
+
+    def test_alteracoes_api_margem_confirmacao(self):
+        data = self.client.get(reverse('alteracoes_api')).json()
+        movimentacao = Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=1, usuario='admin')
+        # Recente demais: transações ainda abertas podem ter reservado ids menores
+        data = self.client.get(reverse('alteracoes_api'), {'since': data['token']}).json()
+        self.assertEqual(data['movimentacoes'], [])
+        Movimentacao.objects.filter(pk=movimentacao.pk).update(data_hora=timezone.now() - timedelta(minutes=1))
+        data = self.client.get(reverse('alteracoes_api'), {'since': data['token']}).json()
+        self.assertEqual([m['id'] for m in data['movimentacoes']], [movimentacao.id])
+
+    def test_entrada_produto_registra_evento(self):
+        self.client.login(username='admin', password='test123')
+        self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 20})
+        evento = EventoEstoque.objects.get()
+        self.assertEqual(evento.tipo, 'ENTRADA')
+        self.assertEqual(evento.dados['estoque'], 70)
+
+    def test_processar_solicitacoes_lote_aprovar(self):
+        primeira = Solicitacao.objects.create(produto=self.produto, quantidade=30, destino='TI', solicitante='comum')
+        segunda = Solicitacao.objects.create(produto=self.produto, quantidade=30, destino='RH', solicitante='comum')
+        terceira = Solicitacao.objects.create(produto=self.produto, quantidade=20, destino='RH', solicitante='comum')
+        self.client.login(username='admin', password='test123')
+        response = self.client.post(
+            reverse('processar_solicitacoes_lote'),
+            {'acao': 'aprovar', 'solicitacoes': [primeira.id, segunda.id, terceira.id, 999]},
+            HTTP_ACCEPT='application/json'
+        )
+        data = response.json()
+        self.assertEqual((data['sucesso'], data['falhas']), (2, 2))
+        self.assertEqual([item['ok'] for item in data['resultados']], [True, False, True, False])
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 0)
+        self.assertEqual(Solicitacao.objects.get(id=segunda.id).status, 'PENDENTE')
+        self.assertEqual(Saidas.objects.count(), 2)
+        self.assertEqual(Movimentacao.objects.filter(tipo='RETIRADA').count(), 2)
+        self.assertEqual(EventoEstoque.objects.order_by('id').last().dados['estoque'], 0)
+
+    def test_processar_solicitacoes_lote_reprovar(self):
+        sol = Solicitacao.objects.create(produto=self.produto, quantidade=5, destino='TI', solicitante='comum')
+        self.client.login(username='super', password='test123')
+        response = self.client.post(reverse('processar_solicitacoes_lote'), {'acao': 'reprovar', 'solicitacoes': [sol.id]})
+        self.assertEqual(response.status_code, 302)
+        sol.refresh_from_db()
+        self.assertEqual(sol.status, 'REPROVADA')
+        self.assertEqual(sol.aprovador, 'super')
+
+    def test_processar_solicitacoes_lote_comum_denied(self):
+        sol = Solicitacao.objects.create(produto=self.produto, quantidade=5, destino='TI', solicitante='comum')
+        self.client.login(username='comum', password='test123')
+        self.client.post(reverse('processar_solicitacoes_lote'), {'acao': 'aprovar', 'solicitacoes': [sol.id]})
+        sol.refresh_from_db()
+        self.assertEqual(sol.status, 'PENDENTE')
+
+    def test_entrada_lote_csv(self):
+        Product.objects.create(nome='Outro', codigo='TEST002', quantidade=0, local='Estoque B', carencia=1)
+        arquivo = SimpleUploadedFile('entradas.csv', 'codigo;quantidade\nTEST001;5\nTEST002;3\nTEST001;2\n'.encode())
+        self.client.login(username='admin', password='test123')
+        versao = VersaoRecurso.atual('catalogo')[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('entrada_lote'), {'arquivo': arquivo})
+        self.assertEqual(response.status_code, 302)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 57)
+        self.assertEqual(Product.objects.get(codigo='TEST002').quantidade, 3)
+        self.assertEqual(Movimentacao.objects.filter(tipo='ENTRADA').count(), 2)
+        self.assertEqual(EventoEstoque.objects.count(), 2)
+        self.assertGreater(VersaoRecurso.atual('catalogo')[0], versao)
+        self.assertEqual(Notificacao.objects.filter(canal='EMAIL', tipo='entrada_lote').count(), 1)
+
+    def test_entrada_lote_codigo_inexistente(self):
+        arquivo = SimpleUploadedFile('entradas.csv', b'TEST001,5\nNAOEXISTE,1\n')
+        self.client.login(username='admin', password='test123')
+        self.client.post(reverse('entrada_lote'), {'arquivo': arquivo})
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 50)
+        self.assertFalse(Movimentacao.objects.exists())
+
+    def test_entrada_lote_comum_denied(self):
+        arquivo = SimpleUploadedFile('entradas.csv', b'TEST001,5\n')
+        self.client.login(username='comum', password='test123')
+        self.client.post(reverse('entrada_lote'), {'arquivo': arquivo})
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 50)
+
+    def test_processar_fila_email(self):
+        enfileirar_email('teste', 'Assunto', 'Texto', ['admin@test.com', ''], html='<p>Texto</p>')
+        self.assertEqual(processar_fila(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['admin@test.com'])
+        notificacao = Notificacao.objects.get()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ('ENVIADA', 1))
+
+    @override_settings(EMAIL_HOST_USER='', DEFAULT_FROM_EMAIL='estoque@test.com')
+    def test_processar_fila_email_remetente_padrao(self):
+        enfileirar_email('teste', 'Assunto', 'Texto', ['admin@test.com'])
+        self.assertEqual(processar_fila(), (1, 0))
+        self.assertEqual(mail.outbox[0].from_email, 'estoque@test.com')
+
+    def test_processar_notificacoes_sobrevive_a_erros(self):
+        # Um erro de banco não encerra o worker; KeyboardInterrupt (não é Exception) encerra o teste
+        chamadas = [OperationalError('conexão perdida'), (1, 0), KeyboardInterrupt()]
+        erros = StringIO()
+        with patch('app.management.commands.processar_notificacoes.processar_fila', side_effect=chamadas) as processar, \
+                patch('app.management.commands.processar_notificacoes.time') as relogio, \
+                patch('app.management.commands.processar_notificacoes.close_old_connections') as fechar:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('processar_notificacoes', stdout=StringIO(), stderr=erros)
+        self.assertEqual(processar.call_count, 3)
+        self.assertIn('conexão perdida', erros.getvalue())
+        self.assertEqual(relogio.sleep.call_count, 2)
+        self.assertGreaterEqual(fechar.call_count, 4)
+
+    def test_processar_fila_whatsapp_servidor_local(self):
+        enfileirar_whatsapp('entrada_produto', ['+5511999999999', None], {
+            'produto': 'Produto Teste', 'codigo': 'TEST001', 'quantidade': 5, 'usuario': 'admin', 'data': 'hoje'
+        })
+        with ServidorWhatsAppLocal() as servidor:
+            self.assertEqual(processar_fila(), (1, 0))
+        caminho, corpo = servidor.recebidas[0]
+        self.assertEqual(caminho, '/instancia/messages/chat')
+        self.assertIn('to=%2B5511999999999', corpo)
+        self.assertEqual(Notificacao.objects.get().status, 'ENVIADA')
+
+    @override_settings(NOTIFICACOES={'max_tentativas': 2, 'backoff_inicial': 60})
+    def test_processar_fila_backoff_e_falha(self):
+        enfileirar_whatsapp('entrada_produto', ['+5511999999999'], {
+            'produto': 'Produto Teste', 'codigo': 'TEST001', 'quantidade': 5, 'usuario': 'admin', 'data': 'hoje'
+        })
+        with ServidorWhatsAppLocal(status=500):
+            self.assertEqual(processar_fila(), (0, 1))
+            notificacao = Notificacao.objects.get()
+            self.assertEqual((notificacao.status, notificacao.tentativas), ('PENDENTE', 1))
+            self.assertGreater(notificacao.proxima_tentativa, timezone.now() + timedelta(seconds=50))
+            # Ainda não venceu: o worker não tenta de novo
+            self.assertEqual(processar_fila(), (0, 0))
+            Notificacao.objects.update(proxima_tentativa=timezone.now())
+            self.assertEqual(processar_fila(), (0, 1))
+        notificacao.refresh_from_db()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ('FALHA', 2))
+
+    def test_whatsapp_send_notifications_paralelo(self):
+        sucessos = WhatsAppService.metricas()['sucessos']
+        dados = {'produto': 'Produto Teste', 'codigo': 'TEST001', 'quantidade': 5, 'usuario': 'admin', 'data': 'hoje'}
+        with ServidorWhatsAppLocal() as servidor:
+            resultados = WhatsAppService().send_notifications(
+                (telefone, 'entrada_produto', dados) for telefone in ['+551101', '+551102', '+551103']
+            )
+        self.assertEqual(resultados, [True, True, True])
+        self.assertEqual(len(servidor.recebidas), 3)
+        self.assertEqual(WhatsAppService.metricas()['sucessos'], sucessos + 3)
+
+    def test_whatsapp_circuit_breaker(self):
+        bloqueadas = WhatsAppService.metricas()['bloqueadas']
+        with ServidorWhatsAppLocal(status=500) as servidor:
+            whatsapp = WhatsAppService(circuito=CircuitBreaker(limiar=2, recuperacao=60))
+            resultados = [whatsapp.send_message('+551101', 'teste') for _ in range(4)]
+        self.assertEqual(resultados, [False] * 4)
+        # Depois de 2 falhas o provedor não é mais chamado
+        self.assertEqual(len(servidor.recebidas), 2)
+        self.assertEqual(whatsapp.circuito.estado, 'aberto')
+        self.assertEqual(WhatsAppService.metricas()['bloqueadas'], bloqueadas + 2)
+
+    def test_processar_fila_circuito_aberto(self):
+        enfileirar_whatsapp('entrada_produto', ['+5511999999999'], {})
+        for _ in range(circuito_whatsapp.limiar):
+            circuito_whatsapp.registrar_falha()
+        self.assertEqual(processar_fila(), (0, 0))
+        notificacao = Notificacao.objects.get()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ('PENDENTE', 0))
+        self.assertGreater(notificacao.proxima_tentativa, timezone.now())
+
+    @override_settings(NOTIFICACOES={'janela_resumo': 600})
+    def test_processar_fila_resumo_whatsapp(self):
+        dados = {'produto': 'Produto Teste', 'codigo': 'TEST001', 'quantidade': 5, 'usuario': 'admin', 'data': 'hoje'}
+        enfileirar_whatsapp('entrada_produto', ['+5511999999999'], dados)
+        enfileirar_whatsapp('entrada_produto', ['+5511999999999'], {**dados, 'quantidade': 7})
+        enfileirar_whatsapp('nova_solicitacao', ['+5511999999999'], {
+            'id': 1, 'solicitante': 'comum', 'produto': 'Produto Teste', 'codigo': 'TEST001',
+            'quantidade': 2, 'destino': 'TI', 'data': 'hoje'
+        })
+        with ServidorWhatsAppLocal() as servidor:
+            # Só a solicitação (urgente) sai antes do fim da janela
+            self.assertEqual(processar_fila(), (1, 0))
+            Notificacao.objects.filter(status='PENDENTE').update(proxima_tentativa=timezone.now())
+            self.assertEqual(processar_fila(), (2, 0))
+        self.assertEqual(len(servidor.recebidas), 2)
+        corpo = unquote_plus(servidor.recebidas[1][1])
+        self.assertIn('Resumo de Notificações', corpo)
+        self.assertIn('+5', corpo)
+        self.assertIn('+7', corpo)
+
+    @override_settings(NOTIFICACOES={'janela_resumo': 600})
+    def test_processar_fila_resumo_email(self):
+        enfileirar_email('entrada_produto', 'Entrada 1', 'Texto 1', ['admin@test.com'])
+        enfileirar_email('entrada_produto', 'Entrada 2', 'Texto 2', ['admin@test.com'])
+        enfileirar_email('entrada_produto', 'Entrada 3', 'Texto 3', ['super@test.com'])
+        self.assertEqual(processar_fila(), (0, 0))
+        Notificacao.objects.update(proxima_tentativa=timezone.now())
+        self.assertEqual(processar_fila(), (3, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        resumo = next(email for email in mail.outbox if email.to == ['admin@test.com'])
+        self.assertEqual(resumo.subject, 'Resumo de Notificações (2) - Stock Flow')
+        self.assertIn('Texto 2', resumo.body)
+
+    @override_settings(NOTIFICACOES={'janela_resumo': 600})
+    def test_processar_fila_resumo_por_destinatario(self):
+        # O mesmo endereço em listas diferentes recebe um único resumo
+        enfileirar_email('entrada_produto', 'Entrada 1', 'Texto 1', ['admin@test.com'])
+        enfileirar_email('entrada_produto', 'Entrada 2', 'Texto 2', ['admin@test.com', 'super@test.com'])
+        self.assertEqual(Notificacao.objects.count(), 3)
+        Notificacao.objects.update(proxima_tentativa=timezone.now())
+        self.assertEqual(processar_fila(), (3, 0))
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ['admin@test.com', 'super@test.com'])
+        resumo = next(email for email in mail.outbox if email.to == ['admin@test.com'])
+        self.assertEqual(resumo.subject, 'Resumo de Notificações (2) - Stock Flow')
+
+    @override_settings(NOTIFICACOES={'janela_resumo': 900})
+    def test_processar_fila_resumo_maior_que_lote(self):
+        for i in range(5):
+            enfileirar_email('entrada_produto', f'Entrada {i}', f'Texto {i}', ['admin@test.com'])
+        enfileirar_email('entrada_produto', 'Outra', 'Texto', ['super@test.com'])
+        Notificacao.objects.update(proxima_tentativa=timezone.now())
+        # O lote reservado é de 2, mas o resumo do destinatário leva todas as vencidas dele
+        self.assertEqual(processar_fila(limite=2), (5, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Resumo de Notificações (5) - Stock Flow')
+        self.assertEqual(processar_fila(limite=2), (1, 0))
+
+    def test_renderizar_email(self):
+        texto, html = renderizar_email('entrada_produto', {
+            'usuario': 'admin', 'produto': 'Parafuso & Porca', 'codigo': 'P1', 'quantidade': 3, 'data': 'hoje'
+        })
+        self.assertIn('Parafuso & Porca', texto)
+        self.assertIn('Parafuso &amp; Porca', html)
+        self.assertIn('+3 unidades', html)
+
+    def test_processar_fila_conexao_unica(self):
+        for email in ['a@test.com', 'b@test.com', 'c@test.com']:
+            enfileirar_email('teste', 'Assunto', 'Texto', [email])
+        with patch('app.notificacoes.get_connection', wraps=get_connection) as conexoes:
+            self.assertEqual(processar_fila(), (3, 0))
+        self.assertEqual(conexoes.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_solicitar_produto_email_template(self):
+        self.client.login(username='comum', password='test123')
+        self.client.post(reverse('solicitar_produto'), {'codigo': 'TEST001', 'quantidade': 5, 'destino': 'TI'})
+        notificacao = Notificacao.objects.get(canal='EMAIL')
+        self.assertEqual(notificacao.destinatarios, ['admin@test.com'])
+        self.assertIn('Produto Teste (Código: TEST001)', notificacao.texto)
+        self.assertIn('<h2>Solicitação #', notificacao.html)
+
+    def test_destinatarios_cache(self):
+        self.assertEqual(destinatarios('admin', 'email'), ['admin@test.com'])
+        self.assertEqual(destinatarios('admin', 'whatsapp'), [])
+        with self.assertNumQueries(0):
+            destinatarios('admin', 'email')
+        # Salvar um usuário invalida o diretório, mas só depois do commit: antes dele uma leitura
+        # concorrente gravaria as linhas antigas de volta no cache
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin_user.telefone = '+5511999999999'
+            self.admin_user.save()
+            self.assertEqual(destinatarios('admin', 'whatsapp'), [])
+        self.assertEqual(destinatarios('admin', 'whatsapp'), ['+5511999999999'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin_user.delete()
+        self.assertEqual(destinatarios('admin', 'email'), [])
+
+    def test_ledger_fechamento(self):
+        # O produto do setUp foi criado sem movimentação: estoque 50, ledger 0
+        self.assertEqual(divergencias_estoque(), [(self.produto.id, 'TEST001', 50, 0)])
+        self.client.login(username='admin', password='test123')
+        self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 20})
+        self.assertEqual(divergencias_estoque(), [(self.produto.id, 'TEST001', 70, 20)])
+        self.assertEqual(ajustar_ledger(divergencias_estoque(), 'admin'), 1)
+        self.assertEqual(divergencias_estoque(), [])
+
+        fechamento = criar_fechamento(margem=timedelta(0))
+        self.assertEqual(fechamento.saldos.get().quantidade, 70)
+        self.assertIsNone(criar_fechamento(margem=timedelta(0)))
+        sol = Solicitacao.objects.create(produto=self.produto, quantidade=30, destino='TI', solicitante='comum')
+        self.client.get(reverse('aprovar_solicitacao', args=[sol.id]))
+        self.assertEqual(saldos_ledger()[0][self.produto.id], 40)
+        self.assertEqual(divergencias_estoque(), [])
+
+    def test_migracao_ledger_registra_saldo_inicial(self):
+        # Produto cadastrado antes do ledger: sem saldo inicial e com as variações ainda zeradas
+        migracao = importlib.import_module('app.migrations.0018_ledger_estoque')
+        Movimentacao.objects.create(tipo='ENTRADA', produto=self.produto, quantidade=20, usuario='admin')
+        Movimentacao.objects.create(tipo='RETIRADA', produto=self.produto, quantidade=5, usuario='admin')
+        migracao.preencher_variacao(django_apps, None)
+        migracao.registrar_saldo_inicial(django_apps, None)
+        self.assertEqual(divergencias_estoque(), [])
+        ajuste = Movimentacao.objects.get(tipo='AJUSTE')
+        self.assertEqual((ajuste.variacao, ajuste.observacao), (35, 'Saldo inicial'))
+
+    def test_reconcile_stock_corrigir(self):
+        self.client.login(username='admin', password='test123')
+        self.client.post(reverse('cadastro_produto'), {
+            'nome': 'Novo', 'quantidade': 12, 'local': 'A', 'codigo': 'NOVO01', 'carencia': 1
+        })
+        novo = Product.objects.get(codigo='NOVO01')
+        self.assertEqual(Movimentacao.objects.get(produto=novo).variacao, 12)
+        Product.objects.filter(pk=novo.pk).update(quantidade=5)
+        saida = StringIO()
+        call_command('reconcile_stock', '--corrigir', stdout=saida)
+        self.assertIn('NOVO01: estoque 5, ledger 12', saida.getvalue())
+        novo.refresh_from_db()
+        self.assertEqual(novo.quantidade, 12)
+        # O produto do setUp também divergia (sem saldo inicial no ledger) e foi corrigido para 0
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 0)
+
+    def test_indicadores_incrementais(self):
+        recalcular_indicadores()
+        self.client.login(username='admin', password='test123')
+        self.client.post(reverse('cadastro_produto'), {'nome': 'Luva', 'quantidade': 3, 'local': 'B', 'codigo': 'LUV', 'carencia': 5})
+        self.client.post(reverse('solicitar_produto'), {'codigo': 'TEST001', 'quantidade': 45, 'destino': 'TI'})
+        self.client.post(reverse('solicitar_produto'), {'codigo': 'LUV', 'quantidade': 1, 'destino': 'TI'})
+        self.client.post(reverse('solicitar_produto'), {'codigo': 'TEST001', 'quantidade': 1, 'destino': 'RH'})
+        aprovar, luva, reprovar = Solicitacao.objects.order_by('id')
+        self.client.get(reverse('aprovar_solicitacao', args=[aprovar.id]))
+        self.client.get(reverse('reprovar_solicitacao', args=[reprovar.id]))
+        self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 20})
+        self.client.post(reverse('editar_produto', args=[self.produto.id]), {'nome': 'Produto Teste', 'local': 'A', 'carencia': 30})
+        self.client.post(reverse('deletar_produto', args=[luva.produto_id]))
+
+        incrementais = indicadores_dashboard()
+        self.assertEqual(incrementais, {
+            'produtos': 1, 'unidades': 25, 'abaixo_carencia': 1, 'solicitacoes_pendentes': 0,
+            'entradas_hoje': 1, 'saidas_hoje': 1,
+        })
+        recalcular_indicadores()
+        self.assertEqual(indicadores_dashboard(), incrementais)
+
+    def test_recalcular_indicadores_command(self):
+        Product.objects.create(nome='Sem KPI', codigo='X1', quantidade=2, local='A', carencia=2)
+        antigo = IndicadorEstoque.objects.create(chave='entradas:2000-01-01', valor=9)
+        saida = StringIO()
+        call_command('recalcular_indicadores', stdout=saida)
+        self.assertIn('produtos: 2', saida.getvalue())
+        self.assertFalse(IndicadorEstoque.objects.filter(pk=antigo.pk).exists())
+        self.client.login(username='admin', password='test123')
+        response = self.client.get(reverse('dashboard_admin'))
+        self.assertEqual(response.context['indicadores']['abaixo_carencia'], 1)
+        self.assertEqual(response.context['indicadores']['unidades'], 52)
+
+    def test_reposicao_api_ordem_e_cursor(self):
+        Product.objects.create(nome='Zerado', codigo='R1', quantidade=0, local='A', carencia=4)
+        Product.objects.create(nome='No limite', codigo='R2', quantidade=3, local='A', carencia=3)
+        Product.objects.create(nome='Quase', codigo='R3', quantidade=5, local='A', carencia=2)
+        Product.objects.create(nome='Sem carência', codigo='R4', quantidade=0, local='A', carencia=0)
+        codigos, cursor = [], ''
+        while True:
+            response = self.client.get(reverse('reposicao_api'), {'limit': 1, 'cursor': cursor})
+            data = response.json()
+            codigos += [produto['codigo'] for produto in data['produtos']]
+            cursor = data['proximo_cursor']
+            if not cursor:
+                break
+        # Folgas -4, 0, 0: empates pela ordem do id
+        self.assertEqual(codigos, ['R1', 'R2', 'R4'])
+        data = self.client.get(reverse('reposicao_api'), {'margem': 3}).json()
+        self.assertEqual([p['codigo'] for p in data['produtos']], ['R1', 'R2', 'R4', 'R3'])
+        self.assertEqual(data['produtos'][0]['folga'], -4)
+        self.assertEqual(self.client.get(reverse('reposicao_api'), {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('reposicao_api'), {'margem': 'a'}).status_code, 400)
+
+    def test_reposicao_e_estoque_geral(self):
+        Product.objects.create(nome='Acabando', codigo='R1', quantidade=2, local='A', carencia=2)
+        Product.objects.create(nome='Atenção', codigo='R2', quantidade=14, local='A', carencia=10)
+        self.client.login(username='comum', password='test123')
+        self.assertRedirects(self.client.get(reverse('reposicao')), reverse('dashboard_comum'), fetch_redirect_response=False)
+        # A cor da quantidade segue a carência, não mais valores fixos
+        response = self.client.get(reverse('estoque_geral'))
+        self.assertContains(response, '<span class="badge bg-danger">\n                                                    2', html=False)
+        self.assertContains(response, '<span class="badge bg-warning">\n                                                    14', html=False)
+        self.assertContains(response, '<span class="badge bg-success">\n                                                    50', html=False)
+        self.client.login(username='admin', password='test123')
+        response = self.client.get(reverse('reposicao'))
+        self.assertEqual([p.codigo for p in response.context['page_obj']], ['R1'])
+        response = self.client.get(reverse('reposicao'), {'proximos': '1'})
+        self.assertEqual([p.codigo for p in response.context['page_obj']], ['R1', 'R2'])
+
+    def test_verificar_estoque_baixo_notifica_uma_vez_por_cruzamento(self):
+        def alertas():
+            return Notificacao.objects.filter(tipo='estoque_baixo', canal='EMAIL').count()
+
+        call_command('verificar_estoque_baixo', stdout=StringIO())
+        self.assertEqual(alertas(), 0)
+        self.assertFalse(AlertaEstoque.objects.get(produto=self.produto).abaixo_carencia)
+
+        self.client.login(username='comum', password='test123')
+        self.client.post(reverse('solicitar_produto'), {'codigo': 'TEST001', 'quantidade': 45, 'destino': 'TI'})
+        self.client.login(username='admin', password='test123')
+        self.client.get(reverse('aprovar_solicitacao', args=[Solicitacao.objects.get().id]))
+        call_command('verificar_estoque_baixo', stdout=StringIO())
+        self.assertEqual(alertas(), 1)
+        notificacao = Notificacao.objects.get(tipo='estoque_baixo', canal='EMAIL')
+        self.assertEqual(notificacao.destinatarios, ['admin@test.com'])
+        self.assertIn('TEST001 - Produto Teste: 5 em estoque (carência 10)', notificacao.texto)
+
+        # Continua abaixo da carência: sem novo alerta
+        self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 1})
+        call_command('verificar_estoque_baixo', stdout=StringIO())
+        self.assertEqual(alertas(), 1)
+
+        # Reposto e abaixo de novo: um novo cruzamento, um novo alerta
+        self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 20})
+        call_command('verificar_estoque_baixo', stdout=StringIO())
+        self.assertFalse(AlertaEstoque.objects.get(produto=self.produto).abaixo_carencia)
+        self.client.post(reverse('editar_produto', args=[self.produto.id]), {'nome': 'Produto Teste', 'local': 'A', 'carencia': 30})
+        call_command('verificar_estoque_baixo', stdout=StringIO())
+        self.assertEqual(alertas(), 2)
+
+    def test_verificar_estoque_baixo_primeira_execucao(self):
+        Product.objects.create(nome='Zerado', codigo='Z1', quantidade=0, local='A', carencia=1)
+        Product.objects.create(nome='Baixo', codigo='Z2', quantidade=2, local='A', carencia=5)
+        saida = StringIO()
+        call_command('verificar_estoque_baixo', stdout=saida)
+        # Linha de base: o estado de todo o catálogo é gravado, sem rajada de alertas
+        self.assertIn('3 produtos verificados, 0 alertas', saida.getvalue())
+        self.assertFalse(Notificacao.objects.filter(tipo='estoque_baixo').exists())
+        self.assertEqual(AlertaEstoque.objects.filter(abaixo_carencia=True).count(), 2)
+
+        # Produtos que já estavam abaixo não são avisados depois; um novo cruzamento é
+        Product.objects.filter(codigo='Z1').update(quantidade=0, atualizado_em=timezone.now())
+        self.produto.quantidade = 1
+        self.produto.save()
+        call_command('verificar_estoque_baixo', stdout=StringIO())
+        notificacao = Notificacao.objects.get(tipo='estoque_baixo', canal='EMAIL')
+        self.assertIn('TEST001', notificacao.texto)
+        self.assertNotIn('Z1', notificacao.texto)
+
+    def test_verificar_estoque_baixo_incremental(self):
+        antigo = timezone.now() - timedelta(days=1)
+        parado = Product.objects.create(nome='Parado', codigo='P1', quantidade=0, local='A', carencia=1)
+        Product.objects.update(atualizado_em=antigo)
+        VarreduraEstoque.objects.create(iniciada_em=antigo + timedelta(hours=1))
+        Product.objects.create(nome='Novo', codigo='P2', quantidade=0, local='A', carencia=1)
+
+        saida = StringIO()
+        call_command('verificar_estoque_baixo', stdout=saida)
+        # Só o produto alterado depois da última varredura é verificado
+        self.assertIn('1 produtos verificados, 1 alertas', saida.getvalue())
+        self.assertFalse(AlertaEstoque.objects.filter(produto=parado).exists())
+
+        saida = StringIO()
+        call_command('verificar_estoque_baixo', '--completa', stdout=saida)
+        self.assertIn('3 produtos verificados, 1 alertas', saida.getvalue())
+        self.assertTrue(AlertaEstoque.objects.get(produto=parado).abaixo_carencia)
+        self.assertEqual(VarreduraEstoque.objects.count(), 3)
+
+    def test_entrada_produto_idempotente(self):
+        self.client.login(username='admin', password='test123')
+        dados = {'codigo': 'TEST001', 'quantidade': 20, 'idempotency_key': 'abc123'}
+        primeira = self.client.post(reverse('entrada_produto'), dados)
+        notificacoes = Notificacao.objects.count()
+        segunda = self.client.post(reverse('entrada_produto'), dados)
+        self.assertEqual(segunda['Location'], primeira['Location'])
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 70)
+        self.assertEqual(Movimentacao.objects.filter(tipo='ENTRADA').count(), 1)
+        self.assertEqual(Notificacao.objects.count(), notificacoes)
+        # A mensagem de sucesso é repetida no reenvio
+        response = self.client.get(segunda['Location'])
+        self.assertContains(response, 'Entrada de 20 unidades de Produto Teste registrada!')
+
+    def test_solicitar_produto_idempotency_key_header(self):
+        self.client.login(username='comum', password='test123')
+        for _ in range(2):
+            self.client.post(
+                reverse('solicitar_produto'),
+                {'codigo': 'TEST001', 'quantidade': 5, 'destino': 'TI'},
+                HTTP_IDEMPOTENCY_KEY='chave-1'
+            )
+        self.client.post(reverse('solicitar_produto'), {'codigo': 'TEST001', 'quantidade': 5, 'destino': 'TI'}, HTTP_IDEMPOTENCY_KEY='chave-2')
+        self.assertEqual(Solicitacao.objects.count(), 2)
+
+    def test_idempotencia_em_processamento_e_purga(self):
+        ChaveIdempotencia.objects.create(usuario=self.admin_user, endpoint='entrada_produto', chave='k1')
+        self.client.login(username='admin', password='test123')
+        response = self.client.post(reverse('entrada_produto'), {'codigo': 'TEST001', 'quantidade': 1}, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 409)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade, 50)
+        ChaveIdempotencia.objects.update(criado_em=timezone.now() - timedelta(days=2))
+        call_command('purgar_idempotencia', stdout=StringIO())
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+    @override_settings(SSE_DURACAO_MAXIMA=0)
+    async def test_eventos_estoque_last_event_id(self):
+        antigo = await EventoEstoque.objects.acreate(tipo='ENTRADA', produto=self.produto, dados={'quantidade': 1})
+        novo = await EventoEstoque.objects.acreate(tipo='APROVACAO', produto=self.produto, dados={'quantidade': 2})
+        client = AsyncClient()
+        await client.aforce_login(self.admin_user)
+        response = await client.get(reverse('eventos_estoque'), headers={'Last-Event-ID': str(antigo.id)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        conteudo = b''.join([parte async for parte in response.streaming_content]).decode()
+        self.assertIn(f'id: {novo.id}\nevent: aprovacao', conteudo)
+        self.assertNotIn(f'id: {antigo.id}\n', conteudo)
+
+    @override_settings(SSE_DURACAO_MAXIMA=0)
+    async def test_eventos_estoque_lacunas(self):
+        # O evento do meio é confirmado depois do seguinte: o id pulado fica pendente na posição
+        antigo = await EventoEstoque.objects.acreate(tipo='ENTRADA', produto=self.produto, dados={})
+        seguinte = await EventoEstoque.objects.acreate(id=antigo.id + 2, tipo='ENTRADA', produto=self.produto, dados={})
+        client = AsyncClient()
+        await client.aforce_login(self.admin_user)
+
+        async def ler(posicao):
+            response = await client.get(reverse('eventos_estoque'), headers={'Last-Event-ID': posicao})
+            return b''.join([parte async for parte in response.streaming_content]).decode()
+
+        self.assertIn(f'id: {seguinte.id}:{antigo.id + 1}\n', await ler(str(antigo.id)))
+        atrasado = await EventoEstoque.objects.acreate(id=antigo.id + 1, tipo='APROVACAO', produto=self.produto, dados={})
+        conteudo = await ler(f'{seguinte.id}:{atrasado.id}')
+        self.assertIn(f'id: {seguinte.id}\nevent: aprovacao\ndata: {{"id": {atrasado.id}', conteudo)
+        self.assertNotIn('event: entrada', conteudo)
+
+    @override_settings(SSE_INTERVALO_CONSULTA=0.01, SSE_DURACAO_MAXIMA=0.5)
+    async def test_eventos_estoque_difusor(self):
+        from .views_eventos import _difusor
+        client = AsyncClient()
+        await client.aforce_login(self.admin_user)
+        streams = []
+        for _ in range(3):
+            response = await client.get(reverse('eventos_estoque'))
+            streams.append(response.streaming_content)
+            await anext(streams[-1])
+        # As três conexões esperam na fila do mesmo laço de consulta
+        leituras = [asyncio.ensure_future(anext(stream)) for stream in streams]
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(_difusor.assinantes), 3)
+        evento = await EventoEstoque.objects.acreate(tipo='ENTRADA', produto=self.produto, dados={})
+        for mensagem in await asyncio.wait_for(asyncio.gather(*leituras), timeout=5):
+            self.assertTrue(mensagem.decode().startswith(f'id: {evento.id}\nevent: entrada'))
+        # Encerradas as conexões, o laço de consulta para
+        for stream in streams:
+            [parte async for parte in stream]
+        self.assertIsNone(_difusor.tarefa)
+
+    def test_purgar_eventos(self):
+        antigo = EventoEstoque.objects.create(tipo='ENTRADA', produto=self.produto, dados={})
+        recente = EventoEstoque.objects.create(tipo='ENTRADA', produto=self.produto, dados={})
+        EventoEstoque.objects.filter(pk=antigo.pk).update(criado_em=timezone.now() - timedelta(days=8))
+        call_command('purgar_eventos', stdout=StringIO())
+        self.assertEqual(list(EventoEstoque.objects.values_list('id', flat=True)), [recente.id])
+
     # Testes de Relatórios
     def test_relatorio_pdf(self):
         self.client.login(username='admin', password='test123')
@@ -274,4 +1220,187 @@ class ComprehensiveTestCase(TestCase):
 
     def test_relatorio_not_logged(self):
         response = self.client.get(reverse('relatorio_pdf_geral'))
-        self.assertEqual(response.status_code, 302)
\ No newline at end of file
+        self.assertEqual(response.status_code, 302)
+
+
+def _requisicao(metodo='get', args=(), dados=None, sessao=None, **extra):
+    """Descreve a requisição de um caso do orçamento de consultas"""
+    return {'metodo': metodo, 'args': args, 'dados': dados or {}, 'sessao': sessao or {}, 'extra': extra}
+
+
+class OrcamentoConsultasTestCase(EstoqueTestCase):
+    # Orçamento de consultas SQL e tempo por nome de URL (app/urls.py), com volumes realistas.
+    # Cada caso roda em uma transação desfeita no final, então as mutações não afetam os demais.
+    # Uma URL nova sem caso aqui (ou em SEM_ORCAMENTO) faz test_todas_urls_tem_orcamento falhar.
+
+    QTD_PRODUTOS = 300
+    QTD_PENDENTES = 150
+    QTD_MOVIMENTOS = 400
+    QTD_USUARIOS = 40
+
+    # Tempo máximo (segundos) por requisição; os relatórios montam o arquivo inteiro. Depende da
+    # máquina, então só é verificado com ORCAMENTO_TEMPO=1 no ambiente (ex.: antes de um deploy)
+    TEMPO_MAXIMO = 1.5
+    TEMPO_MAXIMO_RELATORIO = 5.0
+
+    # (nome da URL, usuário logado, máximo de consultas, requisição)
+    ORCAMENTOS = [
+        ('home', None, 2, lambda t: _requisicao()),
+        ('termos_politicas', None, 0, lambda t: _requisicao()),
+        ('dashboard', 'admin', 2, lambda t: _requisicao()),
+        ('dashboard_comum', 'comum', 3, lambda t: _requisicao()),
+        ('dashboard_admin', 'admin', 3, lambda t: _requisicao()),
+        ('dashboard_super', 'super', 3, lambda t: _requisicao()),
+        ('painel_dashboard', 'super', 5, lambda t: _requisicao(args=['produtos'])),
+        ('painel_dashboard', 'super', 5, lambda t: _requisicao(args=['solicitacoes'])),
+        ('painel_dashboard', 'super', 5, lambda t: _requisicao(args=['entradas'])),
+        ('painel_dashboard', 'super', 5, lambda t: _requisicao(args=['saidas'])),
+        ('painel_dashboard', 'super', 5, lambda t: _requisicao(args=['usuarios'])),
+        ('painel_dashboard', 'admin', 5, lambda t: _requisicao(args=['produtos'], HTTP_ACCEPT='application/json')),
+        ('logs', 'super', 4, lambda t: _requisicao()),
+        ('relatorio_pdf_geral', 'admin', 3, lambda t: _requisicao()),
+        ('relatorio_excel_geral', 'admin', 3, lambda t: _requisicao()),
+        ('cadastro', 'super', 2, lambda t: _requisicao()),
+        ('login', None, 5, lambda t: _requisicao('post', dados={'username': 'admin', 'password': 'test123'})),
+        ('aceitar_termos', None, 2, lambda t: _requisicao(sessao={'terms_user_id': t.admin_user.id})),
+        ('perfil', 'comum', 2, lambda t: _requisicao()),
+        ('logout', 'comum', 5, lambda t: _requisicao()),
+        ('esqueci_senha', None, 0, lambda t: _requisicao()),
+        ('verificar_token', None, 1, lambda t: _requisicao(sessao={'reset_token': '123456', 'reset_user_id': t.comum_user.id, 'token_expires': timezone.now().timestamp() + 600})),
+        ('nova_senha', None, 1, lambda t: _requisicao(sessao={'reset_token': '123456', 'reset_user_id': t.comum_user.id, 'token_expires': timezone.now().timestamp() + 600})),
+        ('setup_totp', None, 3, lambda t: _requisicao(sessao={'setup_user_id': t.admin_user.id})),
+        ('verify_totp', None, 2, lambda t: _requisicao(sessao={'login_user_id': t.admin_user.id})),
+        ('reset_user_totp', 'super', 4, lambda t: _requisicao(args=[t.comum_user.id])),
+        ('tabela_usuarios', 'super', 3, lambda t: _requisicao()),
+        ('deletar_usuario', 'super', 9, lambda t: _requisicao('post', args=[t.comum_user.id])),
+        ('listar_produtos_api', None, 2, lambda t: _requisicao()),
+        ('detalhes_produtos_api', None, 2, lambda t: _requisicao(args=[t.produto.id])),
+        ('lote_produtos_api', None, 1, lambda t: _requisicao(ids=','.join(str(i) for i in range(1, 201)))),
+        ('listar_movimentacoes_api', 'admin', 4, lambda t: _requisicao(limit='500', fields='id,produto,codigo,tipo,quantidade,data_hora')),
+        ('detalhes_movimentacoes_api', 'admin', 3, lambda t: _requisicao(args=[t.movimentacao.id], fields='id,produto,codigo,tipo')),
+        ('alteracoes_api', 'admin', 5, lambda t: _requisicao()),
+        ('limites_taxa_api', 'super', 2, lambda t: _requisicao()),
+        ('cadastro_produto', 'admin', 2, lambda t: _requisicao()),
+        ('estoque_geral', 'comum', 3, lambda t: _requisicao()),
+        ('reposicao', 'admin', 4, lambda t: _requisicao(proximos='1')),
+        ('reposicao_api', None, 2, lambda t: _requisicao(margem='5', limit='500')),
+        ('solicitar_produto', 'comum', 15, lambda t: _requisicao('post', dados={'codigo': 'TEST001', 'quantidade': 1, 'destino': 'TI'})),
+        ('aprovar_solicitacao', 'admin', 20, lambda t: _requisicao(args=[t.solicitacao.id])),
+        ('reprovar_solicitacao', 'admin', 11, lambda t: _requisicao(args=[t.solicitacao.id])),
+        ('processar_solicitacoes_lote', 'admin', 20, lambda t: _requisicao('post', dados={'acao': 'aprovar', 'solicitacoes': t.pendentes[:50]})),
+        ('entrada_produto', 'admin', 17, lambda t: _requisicao('post', dados={'codigo': 'TEST001', 'quantidade': 5})),
+        ('entrada_lote', 'admin', 16, lambda t: _requisicao('post', dados={'arquivo': t.planilha_entrada()})),
+        ('listar_movimentacoes', 'admin', 4, lambda t: _requisicao()),
+        ('exportar_movimentacoes_csv', 'admin', 3, lambda t: _requisicao()),
+        ('deletar_produto', 'admin', 22, lambda t: _requisicao('post', args=[t.produto.id])),
+        ('editar_produto', 'admin', 8, lambda t: _requisicao('post', args=[t.produto.id], dados={'nome': 'Novo', 'local': 'B', 'carencia': 3})),
+    ]
+
+    # URLs fora do orçamento, com o motivo
+    SEM_ORCAMENTO = {
+        'eventos_estoque': 'stream SSE contínuo; coberto por test_eventos_estoque_last_event_id',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        # Em produção os contadores de versão já existem; sem eles cada incremento faz um get_or_create
+        VersaoRecurso.objects.bulk_create([
+            VersaoRecurso(recurso=recurso) for recurso in ('catalogo', 'movimentacoes', 'solicitacoes')
+        ])
+        produtos = Product.objects.bulk_create([
+            Product(nome=f'Produto {i}', codigo=f'P{i:04d}', quantidade=1000, local=f'Prateleira {i % 20}', carencia=i % 15)
+            for i in range(cls.QTD_PRODUTOS)
+        ])
+        User.objects.bulk_create([
+            User(username=f'usuario{i}', email=f'usuario{i}@test.com', nivel_acesso='comum')
+            for i in range(cls.QTD_USUARIOS)
+        ])
+        Solicitacao.objects.bulk_create([
+            Solicitacao(produto=produtos[i % len(produtos)], quantidade=1, destino='TI', solicitante='comum')
+            for i in range(cls.QTD_PENDENTES)
+        ])
+        Entradas.objects.bulk_create([
+            Entradas(produto=produtos[i % len(produtos)], quantidade=10, usuario='admin')
+            for i in range(cls.QTD_MOVIMENTOS)
+        ])
+        Saidas.objects.bulk_create([
+            Saidas(produto=produtos[i % len(produtos)], quantidade=1, destino='TI', usuario='admin')
+            for i in range(cls.QTD_MOVIMENTOS)
+        ])
+        Movimentacao.objects.bulk_create([
+            Movimentacao(tipo='ENTRADA', produto=produtos[i % len(produtos)], quantidade=10, variacao=10, usuario='admin')
+            for i in range(cls.QTD_MOVIMENTOS)
+        ])
+        logs.objects.bulk_create([
+            logs(acao='Teste', usuario='admin', detalhes=f'Log {i}') for i in range(cls.QTD_MOVIMENTOS)
+        ])
+        # Como a migração e o recalcular_indicadores deixam as linhas de KPI prontas em produção
+        recalcular_indicadores()
+
+    def setUp(self):
+        super().setUp()
+        self.solicitacao = Solicitacao.objects.create(produto=self.produto, quantidade=1, destino='TI', solicitante='comum')
+        self.pendentes = list(Solicitacao.objects.filter(status='PENDENTE').values_list('id', flat=True))
+        self.movimentacao = Movimentacao.objects.first()
+        self.usuarios = {'admin': self.admin_user, 'super': self.super_user, 'comum': self.comum_user}
+
+    def planilha_entrada(self):
+        linhas = ''.join(f'P{i:04d},5\n' for i in range(100))
+        return SimpleUploadedFile('entradas.csv', ('codigo,quantidade\n' + linhas).encode(), content_type='text/csv')
+
+    def _executar(self, nome, usuario, requisicao):
+        """Executa a requisição e devolve (resposta, consultas capturadas, segundos)"""
+        cache.clear()
+        client = Client()
+        if usuario:
+            client.force_login(self.usuarios[usuario])
+        if requisicao['sessao']:
+            sessao = client.session
+            sessao.update(requisicao['sessao'])
+            sessao.save()
+        url = reverse(nome, args=requisicao['args'])
+        extra = {k: v for k, v in requisicao['extra'].items() if k.startswith('HTTP_')}
+        parametros = {k: v for k, v in requisicao['extra'].items() if not k.startswith('HTTP_')}
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            if requisicao['metodo'] == 'post':
+                response = client.post(url, requisicao['dados'], **extra)
+            else:
+                response = client.get(url, parametros, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            segundos = time.perf_counter() - inicio
+        return response, consultas.captured_queries, segundos
+
+    def test_orcamento_consultas_por_url(self):
+        for nome, usuario, maximo, montar in self.ORCAMENTOS:
+            requisicao = montar(self)
+            with self.subTest(url=nome, args=requisicao['args']):
+                with transaction.atomic():
+                    response, consultas, _ = self._executar(nome, usuario, requisicao)
+                    transaction.set_rollback(True)
+                self.assertLess(response.status_code, 500)
+                sql = '\n'.join(f"  {i}. {q['sql']}" for i, q in enumerate(consultas, 1))
+                self.assertLessEqual(
+                    len(consultas), maximo,
+                    f'{nome} fez {len(consultas)} consultas (orçamento: {maximo}):\n{sql}'
+                )
+
+    @unittest.skipUnless(os.environ.get('ORCAMENTO_TEMPO'), 'defina ORCAMENTO_TEMPO=1 para medir o tempo das requisições')
+    def test_orcamento_tempo_por_url(self):
+        for nome, usuario, _, montar in self.ORCAMENTOS:
+            requisicao = montar(self)
+            with self.subTest(url=nome, args=requisicao['args']):
+                with transaction.atomic():
+                    response, consultas, segundos = self._executar(nome, usuario, requisicao)
+                    transaction.set_rollback(True)
+                tempo_maximo = self.TEMPO_MAXIMO_RELATORIO if nome.startswith('relatorio_') else self.TEMPO_MAXIMO
+                self.assertLessEqual(
+                    segundos, tempo_maximo,
+                    f'{nome} levou {segundos:.2f}s (orçamento: {tempo_maximo}s) com {len(consultas)} consultas'
+                )
+
+    def test_todas_urls_tem_orcamento(self):
+        nomes = {padrao.name for padrao in urlpatterns if padrao.name}
+        cobertas = {nome for nome, *_ in self.ORCAMENTOS} | set(self.SEM_ORCAMENTO)
+        self.assertEqual(nomes - cobertas, set(), 'URLs sem orçamento de consultas')
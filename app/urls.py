@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views, views_api, views_users, views_product, views_reports
+from . import views, views_api, views_eventos, views_paineis, views_users, views_product, views_reports
 
 urlpatterns = [
     
@@ -9,6 +9,7 @@ urlpatterns = [
     path('dashboard_comum/', views.dashboard_comum, name='dashboard_comum'),
     path('dashboard_admin/', views.dashboard_admin, name='dashboard_admin'),
     path('dashboard_super/', views.dashboard_super, name='dashboard_super'),
+    path('dashboard/painel/<str:painel>/', views_paineis.painel_dashboard, name='painel_dashboard'),
     path('logs/', views.logs, name='logs'),
     path('termos-politicas/', views.termos_politicas, name='termos_politicas'),
 
@@ -34,17 +35,26 @@ urlpatterns = [
     # URLs de API
     path('api/listar_produtos/', views_api.listar_produtos_api, name='listar_produtos_api'),
     path('api/listar_produtos/<int:product_id>/', views_api.detalhes_produtos_api, name='detalhes_produtos_api'),
+    path('api/listar_produtos/lote/', views_api.lote_produtos_api, name='lote_produtos_api'),
     path('api/listar_movimentacoes/', views_api.listar_movimentacoes_api, name='listar_movimentacoes_api'),
     path('api/listar_movimentacoes/<int:movimentacao_id>/', views_api.detalhes_movimentacoes_api, name='detalhes_movimentacoes_api'),
+    path('api/alteracoes/', views_api.alteracoes_api, name='alteracoes_api'),
+    path('api/reposicao/', views_api.reposicao_api, name='reposicao_api'),
+    path('api/eventos/', views_eventos.eventos_estoque, name='eventos_estoque'),
+    path('api/limites/', views_api.limites_taxa_api, name='limites_taxa_api'),
     
     # URLs de controle dos produtos
     path('cadastro_produto/', views_product.cadastro_produto, name='cadastro_produto'), 
     path('estoque_geral/', views_product.estoque_geral, name='estoque_geral'),
+    path('reposicao/', views_product.reposicao, name='reposicao'),
     path('solicitar-produto/', views_product.solicitar_produto, name='solicitar_produto'),
     path('aprovar-solicitacao/<int:solicitacao_id>/', views_product.aprovar_solicitacao, name='aprovar_solicitacao'),
     path('reprovar-solicitacao/<int:solicitacao_id>/', views_product.reprovar_solicitacao, name='reprovar_solicitacao'),
+    path('solicitacoes/lote/', views_product.processar_solicitacoes_lote, name='processar_solicitacoes_lote'),
     path('entrada-produto/', views_product.entrada_produto, name='entrada_produto'),
+    path('entrada-produto/lote/', views_product.entrada_lote, name='entrada_lote'),
     path('movimentacoes/', views_product.listar_movimentacoes, name='listar_movimentacoes'),
+    path('movimentacoes.csv', views_product.exportar_movimentacoes_csv, name='exportar_movimentacoes_csv'),
     path('deletar-produto/<int:produto_id>/', views_product.deletar_produto, name='deletar_produto'),
     path('editar-produto/<int:produto_id>/', views_product.editar_produto, name='editar_produto'),
 ]
\ No newline at end of file
@@ -3,7 +3,8 @@ from django.contrib.auth import authenticate, login as auth_login, logout as aut
 from django.contrib.auth.decorators import login_required  
 from django.contrib import messages
 from decouple import config
-from .models import CustomUser, Product, Solicitacao, Saidas, Entradas, logs
+from .models import Product, Solicitacao, logs
+from .indicadores import indicadores_dashboard
 
 # ============================================================================
 # FUNÇÕES GERAIS
@@ -37,7 +38,7 @@ def dashboard(request):
 def dashboard_comum(request):
     """Dashboard para usuários comuns"""
     produtos = Product.objects.all()
-    minhas_solicitacoes = Solicitacao.objects.filter(solicitante=request.user.username).order_by('-data_solicitacao')[:10]
+    minhas_solicitacoes = Solicitacao.objects.filter(solicitante=request.user.username).select_related('produto').order_by('-data_solicitacao')[:10]
     
     context = {
         'produtos': produtos,
@@ -52,18 +53,8 @@ def dashboard_admin(request):
         messages.error(request, 'Acesso negado')
         return redirect('dashboard_comum')
     
-    produtos = Product.objects.all()
-    solicitacoes_pendentes = Solicitacao.objects.filter(status='PENDENTE').order_by('-data_solicitacao')
-    entradas_recentes = Entradas.objects.select_related('produto').order_by('-data_entrada')[:50]
-    saidas_recentes = Saidas.objects.select_related('produto').order_by('-data_saida')[:50]
-    
-    context = {
-        'produtos': produtos,
-        'solicitacoes_pendentes': solicitacoes_pendentes,
-        'entradas_recentes': entradas_recentes,
-        'saidas_recentes': saidas_recentes,
-    }
-    return render(request, 'dashboard_admin.html', context)
+    # Produtos, solicitações e históricos são carregados sob demanda pelos painéis (views_paineis)
+    return render(request, 'dashboard_admin.html', {'indicadores': indicadores_dashboard()})
 
 @login_required
 def dashboard_super(request):
@@ -72,20 +63,8 @@ def dashboard_super(request):
         messages.error(request, 'Acesso negado')
         return redirect('dashboard_comum')
     
-    produtos = Product.objects.all()
-    solicitacoes_pendentes = Solicitacao.objects.filter(status='PENDENTE').order_by('-data_solicitacao')
-    entradas_recentes = Entradas.objects.select_related('produto').order_by('-data_entrada')[:50]
-    saidas_recentes = Saidas.objects.select_related('produto').order_by('-data_saida')[:50]
-    usuarios = CustomUser.objects.all()
-    
-    context = {
-        'produtos': produtos,
-        'solicitacoes_pendentes': solicitacoes_pendentes,
-        'entradas_recentes': entradas_recentes,
-        'saidas_recentes': saidas_recentes,
-        'usuarios': usuarios,
-    }
-    return render(request, 'dashboard_super.html', context)
+    # Produtos, solicitações, históricos e usuários são carregados sob demanda pelos painéis (views_paineis)
+    return render(request, 'dashboard_super.html', {'indicadores': indicadores_dashboard()})
 
 # ============================================================================
 # FUNÇÕES DE LOGS
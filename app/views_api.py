@@ -1,42 +1,453 @@
-from django.http import JsonResponse
-from .models import Product, Movimentacao
+import base64
+import json
+from datetime import datetime, timedelta
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+from .cache_api import chave_cache_api, obter_ou_gerar
+from .models import Product, Movimentacao, ProdutoRemovido, VersaoRecurso
+from .ratelimit import configuracao_limites, contadores_limites, limitar_taxa
+from .reposicao import candidatos_reposicao
+from .streaming import resposta_streaming
+from .views_product import filtrar_movimentacoes
 
+# Limites da paginação por cursor da API de movimentações
+LIMITE_PADRAO_MOVIMENTACOES = 50
+LIMITE_MAXIMO_MOVIMENTACOES = 500
+
+# Formatos de streaming aceitos no parâmetro format e tamanho dos lotes lidos do banco
+FORMATOS_STREAMING = {
+    'ndjson': 'application/x-ndjson',
+    'json-stream': 'application/json',
+}
+TAMANHO_LOTE_STREAMING = 2000
+
+# Campos retornados pelo detalhe de produto e pela consulta em lote
+CAMPOS_DETALHE_PRODUTO = ('id', 'nome', 'quantidade', 'local', 'codigo', 'carencia')
+CAMPOS_LISTA_PRODUTO = ('id', 'nome', 'quantidade', 'codigo')
+LIMITE_LOTE_PRODUTOS = 500
+
+# Campos aceitos em fields= para movimentações: nome na API -> lookup usado no values()
+CAMPOS_MOVIMENTACAO = {
+    'id': 'id',
+    'produto': 'produto__nome',
+    'codigo': 'produto__codigo',
+    'tipo': 'tipo',
+    'quantidade': 'quantidade',
+    'variacao': 'variacao',
+    'data_hora': 'data_hora',
+    'usuario': 'usuario',
+    'referencia_id': 'referencia_id',
+    'observacao': 'observacao',
+}
+CAMPOS_PADRAO_MOVIMENTACAO = ('id', 'produto', 'tipo', 'quantidade', 'data_hora', 'observacao')
+
+# Lista de reposição: paginação por cursor em (folga, id), a mesma ordem do índice produto_folga_idx
+LIMITE_PADRAO_REPOSICAO = 100
+LIMITE_MAXIMO_REPOSICAO = 1000
+CAMPOS_REPOSICAO = ('id', 'codigo', 'nome', 'quantidade', 'carencia', 'local', 'folga')
+
+# Feed de alterações: máximo de movimentações por chamada e folga aplicada ao horário do token,
+# para não perder produtos salvos em transações que ainda não tinham sido confirmadas. Pelo mesmo
+# motivo movimentações e remoções mais novas que a folga ficam para a próxima chamada: uma
+# transação aberta pode ter reservado um id menor que o último já visível.
+LIMITE_MOVIMENTACOES_ALTERACOES = 1000
+MARGEM_TOKEN_ALTERACOES = timedelta(seconds=5)
+
+# ============================================================================
+# FUNÇÕES AUXILIARES
+# ============================================================================
+
+def _codificar_cursor(data_hora, mov_id):
+    """Gera o cursor opaco que aponta para a posição (data_hora, id) de uma movimentação"""
+    bruto = json.dumps([data_hora.isoformat(), mov_id])
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+def _decodificar_cursor(cursor):
+    """Converte o cursor opaco de volta em (data_hora, id); lança ValueError se for inválido"""
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        data_hora, mov_id = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        return datetime.fromisoformat(data_hora), int(mov_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Cursor inválido')
+
+def _codificar_cursor_reposicao(folga, produto_id):
+    """Gera o cursor opaco que aponta para a posição (folga, id) da lista de reposição"""
+    bruto = json.dumps([folga, produto_id])
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+def _decodificar_cursor_reposicao(cursor):
+    """Converte o cursor da lista de reposição de volta em (folga, id); lança ValueError se for inválido"""
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        folga, produto_id = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        return int(folga), int(produto_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Cursor inválido')
+
+def _codificar_token(produtos_desde, ultima_movimentacao, ultimo_removido):
+    """Gera o token opaco do feed de alterações"""
+    bruto = json.dumps([produtos_desde.isoformat(), ultima_movimentacao, ultimo_removido])
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+def _decodificar_token(token):
+    """Converte o token do feed de alterações em (produtos_desde, ultima_movimentacao, ultimo_removido)"""
+    try:
+        preenchimento = '=' * (-len(token) % 4)
+        produtos_desde, ultima_movimentacao, ultimo_removido = json.loads(base64.urlsafe_b64decode(token + preenchimento))
+        return datetime.fromisoformat(produtos_desde), int(ultima_movimentacao), int(ultimo_removido)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Token inválido')
+
+def _ler_limite(valor, padrao, maximo):
+    """Lê o parâmetro limit da query string respeitando o máximo permitido"""
+    if not valor:
+        return padrao
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ValueError('limit deve ser um número inteiro')
+    if limite <= 0:
+        raise ValueError('limit deve ser maior que zero')
+    return min(limite, maximo)
+
+def _gerar_ndjson(linhas):
+    for linha in linhas:
+        yield json.dumps(linha, cls=DjangoJSONEncoder) + '\n'
+
+def _gerar_array_json(linhas):
+    # Emite o array JSON item a item, sem montar a lista completa em memória
+    yield '['
+    separador = ''
+    for linha in linhas:
+        yield separador + json.dumps(linha, cls=DjangoJSONEncoder)
+        separador = ','
+    yield ']'
+
+def _resposta_streaming(request, linhas, formato):
+    """Monta a resposta em streaming no formato pedido (ndjson ou json-stream)"""
+    if formato == 'ndjson':
+        conteudo = _gerar_ndjson(linhas)
+    else:
+        conteudo = _gerar_array_json(linhas)
+    return resposta_streaming(request, conteudo, content_type=FORMATOS_STREAMING[formato])
+
+def _ler_formato(request):
+    """Retorna o formato de streaming pedido, None para a resposta JSON comum"""
+    formato = request.GET.get('format', '').strip()
+    if not formato or formato == 'json':
+        return None
+    if formato not in FORMATOS_STREAMING:
+        raise ValueError(f'format inválido, use json, {", ".join(FORMATOS_STREAMING)}')
+    return formato
+
+def _versao_catalogo(request):
+    # Guarda a versão no request para que ETag e Last-Modified custem uma única consulta
+    if not hasattr(request, '_versao_catalogo'):
+        request._versao_catalogo = VersaoRecurso.atual('catalogo')
+    return request._versao_catalogo
+
+def _etag_catalogo(request, *args, **kwargs):
+    numero, _ = _versao_catalogo(request)
+    return f'catalogo-{numero}'
+
+def _last_modified_catalogo(request, *args, **kwargs):
+    _, atualizado_em = _versao_catalogo(request)
+    return atualizado_em
+
+def _ler_campos(request, permitidos, padrao):
+    """Lê o parâmetro fields (separado por vírgula) validando contra a lista de campos do recurso"""
+    valor = request.GET.get('fields', '').strip()
+    if not valor:
+        return tuple(padrao)
+    campos = tuple(dict.fromkeys(c.strip() for c in valor.split(',') if c.strip()))
+    invalidos = [c for c in campos if c not in permitidos]
+    if invalidos or not campos:
+        raise ValueError(f'fields inválido: {", ".join(invalidos)}. Permitidos: {", ".join(permitidos)}')
+    return campos
+
+def _projetar_movimentacoes(movimentacoes, campos):
+    """Seleciona apenas as colunas pedidas e devolve (queryset de values, função que monta cada item)"""
+    lookups = [CAMPOS_MOVIMENTACAO[campo] for campo in campos]
+    # data_hora e id são sempre lidos porque formam o cursor da próxima página
+    linhas = movimentacoes.values(*dict.fromkeys(lookups + ['data_hora', 'id']))
+
+    def montar(linha):
+        item = {campo: linha[CAMPOS_MOVIMENTACAO[campo]] for campo in campos}
+        if 'data_hora' in item:
+            item['data_hora'] = item['data_hora'].isoformat()
+        return item
+
+    return linhas, montar
+
+# ============================================================================
+# FUNÇÕES DE API - PRODUTOS
+# ============================================================================
+
+@limitar_taxa('api')
+@condition(etag_func=_etag_catalogo, last_modified_func=_last_modified_catalogo)
 def listar_produtos_api(request):
-    produtos = Product.objects.all()
-    data = [{"id": produto.id, "nome": produto.nome, "quantidade": produto.quantidade, "codigo": produto.codigo} for produto in produtos]
-    return JsonResponse(data, safe=False)
+    """Lista o catálogo de produtos; com format=ndjson/json-stream a resposta é enviada em streaming"""
+    try:
+        formato = _ler_formato(request)
+        campos = _ler_campos(request, CAMPOS_DETALHE_PRODUTO, CAMPOS_LISTA_PRODUTO)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    produtos = Product.objects.order_by('id').values(*campos)
+    if formato:
+        return _resposta_streaming(request, produtos.iterator(chunk_size=TAMANHO_LOTE_STREAMING), formato)
+
+    versao_catalogo, _ = _versao_catalogo(request)
+    chave = chave_cache_api('produtos', [versao_catalogo], request.GET)
+    conteudo = obter_ou_gerar(chave, lambda: JsonResponse({"produtos": list(produtos)}).content)
+    return HttpResponse(conteudo, content_type='application/json')
 
+@limitar_taxa('api')
+@condition(etag_func=_etag_catalogo, last_modified_func=_last_modified_catalogo)
 def detalhes_produtos_api(request, product_id):
     try:
-        produto = Product.objects.get(id=product_id)
-        data = {"id": produto.id, "nome": produto.nome, "quantidade": produto.quantidade, "local": produto.local, "codigo": produto.codigo, "carencia": produto.carencia}
+        campos = _ler_campos(request, CAMPOS_DETALHE_PRODUTO, CAMPOS_DETALHE_PRODUTO)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        data = Product.objects.values(*campos).get(id=product_id)
         return JsonResponse(data)
     except Product.DoesNotExist:
         return JsonResponse({"error": "Produto não encontrado"}, status=404)
 
+def _ler_chaves_lote(request):
+    """Lê ids ou codigos da query string (separados por vírgula) ou do corpo JSON do POST"""
+    if request.method == 'POST':
+        try:
+            corpo = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ValueError('Corpo JSON inválido')
+        if not isinstance(corpo, dict):
+            raise ValueError('Corpo JSON deve ser um objeto com ids ou codigos')
+        ids, codigos = corpo.get('ids'), corpo.get('codigos')
+    else:
+        ids = [v for v in request.GET.get('ids', '').split(',') if v.strip()] or None
+        codigos = [v for v in request.GET.get('codigos', '').split(',') if v.strip()] or None
+
+    if bool(ids) == bool(codigos):
+        raise ValueError('Informe ids ou codigos (apenas um deles)')
+
+    campo, chaves = ('id', ids) if ids else ('codigo', codigos)
+    if not isinstance(chaves, list):
+        raise ValueError(f'{campo}s deve ser uma lista')
+    try:
+        chaves = [int(c) for c in chaves] if campo == 'id' else [str(c).strip() for c in chaves]
+    except (TypeError, ValueError):
+        raise ValueError('ids devem ser números inteiros')
+
+    # Remove repetidos preservando a ordem pedida pelo cliente
+    chaves = list(dict.fromkeys(chaves))
+    if len(chaves) > LIMITE_LOTE_PRODUTOS:
+        raise ValueError(f'Máximo de {LIMITE_LOTE_PRODUTOS} produtos por consulta')
+    return campo, chaves
+
+@csrf_exempt
+@limitar_taxa('api')
+@require_http_methods(['GET', 'POST'])
+def lote_produtos_api(request):
+    """Consulta vários produtos por id ou código em uma única query"""
+    try:
+        campo, chaves = _ler_chaves_lote(request)
+        campos = _ler_campos(request, CAMPOS_DETALHE_PRODUTO, CAMPOS_DETALHE_PRODUTO)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # A chave de busca é sempre lida para casar o resultado com o pedido, mesmo fora de fields
+    linhas = Product.objects.filter(**{f'{campo}__in': chaves}).values(*dict.fromkeys(campos + (campo,)))
+    encontrados = {linha[campo]: linha for linha in linhas}
+    data = {
+        "produtos": [
+            {c: encontrados[chave][c] for c in campos}
+            for chave in chaves if chave in encontrados
+        ],
+        "nao_encontrados": [chave for chave in chaves if chave not in encontrados],
+    }
+    return JsonResponse(data)
+
+@limitar_taxa('api')
+def reposicao_api(request):
+    """Lista os produtos no limite da carência (folga <= margem), do mais crítico para o menos crítico
+
+    margem (padrão 0) inclui também os produtos que estão a até essa quantidade da carência;
+    a paginação é por cursor em (folga, id).
+    """
+    try:
+        limite = _ler_limite(request.GET.get('limit'), LIMITE_PADRAO_REPOSICAO, LIMITE_MAXIMO_REPOSICAO)
+        try:
+            margem = int(request.GET.get('margem') or 0)
+        except ValueError:
+            raise ValueError('margem deve ser um número inteiro')
+        cursor = request.GET.get('cursor', '').strip()
+        posicao = _decodificar_cursor_reposicao(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    produtos = candidatos_reposicao(margem)
+    if posicao:
+        folga, produto_id = posicao
+        produtos = produtos.filter(Q(folga__gt=folga) | Q(folga=folga, id__gt=produto_id))
+    produtos = produtos.values(*CAMPOS_REPOSICAO)
+
+    def gerar_pagina():
+        # Busca um registro a mais para saber se existe próxima página sem precisar de COUNT
+        pagina = list(produtos[:limite + 1])
+        tem_mais = len(pagina) > limite
+        pagina = pagina[:limite]
+
+        data = {
+            "produtos": pagina,
+            "proximo_cursor": _codificar_cursor_reposicao(pagina[-1]['folga'], pagina[-1]['id']) if tem_mais else None,
+        }
+        return JsonResponse(data).content
+
+    chave = chave_cache_api('reposicao', VersaoRecurso.atuais('catalogo'), request.GET)
+    return HttpResponse(obter_ou_gerar(chave, gerar_pagina), content_type='application/json')
+
+# ============================================================================
+# FUNÇÕES DE API - MOVIMENTAÇÕES
+# ============================================================================
+
+@limitar_taxa('api')
 def listar_movimentacoes_api(request):
-    movimentacoes = Movimentacao.objects.all()
-    data = [{
-        "id": mov.id,
-        "produto": mov.produto.nome,
-        "tipo": mov.tipo,
-        "quantidade": mov.quantidade,
-        "data_hora": mov.data_hora.isoformat(), 
-        "observacao": mov.observacao,
-    } for mov in movimentacoes]
-    return JsonResponse(data, safe=False)
+    """Lista movimentações paginadas por cursor em (data_hora, id), da mais recente para a mais antiga
 
-def detalhes_movimentacoes_api(request, movimentacao_id):
+    Com format=ndjson/json-stream todas as movimentações filtradas (a partir do cursor, se
+    informado) são enviadas em streaming, ignorando o limit.
+    """
     try:
-        mov = Movimentacao.objects.get(id=movimentacao_id)
+        formato = _ler_formato(request)
+        campos = _ler_campos(request, CAMPOS_MOVIMENTACAO, CAMPOS_PADRAO_MOVIMENTACAO)
+        limite = _ler_limite(request.GET.get('limit'), LIMITE_PADRAO_MOVIMENTACOES, LIMITE_MAXIMO_MOVIMENTACOES)
+        cursor = request.GET.get('cursor', '').strip()
+        posicao = _decodificar_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    movimentacoes = Movimentacao.objects.order_by('-data_hora', '-id')
+    try:
+        movimentacoes, _ = filtrar_movimentacoes(movimentacoes, request.GET)
+    except ValidationError:
+        return JsonResponse({"error": "Data inválida, use o formato AAAA-MM-DD"}, status=400)
+
+    if posicao:
+        data_hora, mov_id = posicao
+        movimentacoes = movimentacoes.filter(
+            Q(data_hora__lt=data_hora) | Q(data_hora=data_hora, id__lt=mov_id)
+        )
+
+    # values() com produto__* faz o JOIN com produtos na mesma query, sem N+1
+    linhas, montar = _projetar_movimentacoes(movimentacoes, campos)
+
+    if formato:
+        itens = (montar(linha) for linha in linhas.iterator(chunk_size=TAMANHO_LOTE_STREAMING))
+        return _resposta_streaming(request, itens, formato)
+
+    def gerar_pagina():
+        # Busca um registro a mais para saber se existe próxima página sem precisar de COUNT
+        pagina = list(linhas[:limite + 1])
+        tem_mais = len(pagina) > limite
+        pagina = pagina[:limite]
+
         data = {
-            "id": mov.id,
-            "produto": mov.produto.nome,
-            "tipo": mov.tipo,
-            "quantidade": mov.quantidade,
-            "data_hora": mov.data_hora.isoformat(), 
-            "observacao": mov.observacao,
+            "movimentacoes": [montar(linha) for linha in pagina],
+            "proximo_cursor": _codificar_cursor(pagina[-1]['data_hora'], pagina[-1]['id']) if tem_mais else None,
         }
-        return JsonResponse(data)
+        return JsonResponse(data).content
+
+    # O nome do produto aparece nas movimentações, por isso a chave depende também do catálogo
+    versoes = VersaoRecurso.atuais('movimentacoes', 'catalogo')
+    chave = chave_cache_api('movimentacoes', versoes, request.GET)
+    return HttpResponse(obter_ou_gerar(chave, gerar_pagina), content_type='application/json')
+
+@limitar_taxa('api')
+def detalhes_movimentacoes_api(request, movimentacao_id):
+    try:
+        campos = _ler_campos(request, CAMPOS_MOVIMENTACAO, CAMPOS_PADRAO_MOVIMENTACAO)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    linhas, montar = _projetar_movimentacoes(Movimentacao.objects.filter(id=movimentacao_id), campos)
+    try:
+        return JsonResponse(montar(linhas.get()))
     except Movimentacao.DoesNotExist:
-        return JsonResponse({"error": "Movimentação não encontrada"}, status=404)
\ No newline at end of file
+        return JsonResponse({"error": "Movimentação não encontrada"}, status=404)
+
+# ============================================================================
+# FUNÇÕES DE API - SINCRONIZAÇÃO INCREMENTAL
+# ============================================================================
+
+@limitar_taxa('api')
+def alteracoes_api(request):
+    """Feed de alterações desde o token informado em since
+
+    Retorna os produtos criados ou alterados, os removidos (tombstones) e as novas movimentações,
+    junto com o token para a próxima chamada. Sem since, retorna o catálogo completo e um token
+    a partir do momento atual, sem o histórico de movimentações.
+    """
+    try:
+        since = request.GET.get('since', '').strip()
+        desde = _decodificar_token(since) if since else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    agora = timezone.now()
+    corte = agora - MARGEM_TOKEN_ALTERACOES
+    campos_produto = CAMPOS_DETALHE_PRODUTO + ('atualizado_em',)
+    produtos = Product.objects.order_by('atualizado_em', 'id').values(*campos_produto)
+    removidos_estaveis = ProdutoRemovido.objects.filter(removido_em__lt=corte)
+    movimentacoes_estaveis = Movimentacao.objects.filter(data_hora__lt=corte)
+    removidos = removidos_estaveis.order_by('id').values('id', 'produto_id', 'codigo')
+    linhas_mov, montar_mov = _projetar_movimentacoes(
+        movimentacoes_estaveis.order_by('id'), CAMPOS_PADRAO_MOVIMENTACAO + ('codigo',)
+    )
+
+    if desde:
+        produtos_desde, ultima_movimentacao, ultimo_removido = desde
+        produtos = produtos.filter(atualizado_em__gte=produtos_desde - MARGEM_TOKEN_ALTERACOES)
+        removidos = list(removidos.filter(id__gt=ultimo_removido))
+        movimentacoes = list(linhas_mov.filter(id__gt=ultima_movimentacao)[:LIMITE_MOVIMENTACOES_ALTERACOES + 1])
+    else:
+        ultima_movimentacao = movimentacoes_estaveis.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        ultimo_removido = removidos_estaveis.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        removidos = []
+        movimentacoes = []
+
+    tem_mais = len(movimentacoes) > LIMITE_MOVIMENTACOES_ALTERACOES
+    movimentacoes = movimentacoes[:LIMITE_MOVIMENTACOES_ALTERACOES]
+    if movimentacoes:
+        ultima_movimentacao = movimentacoes[-1]['id']
+    if removidos:
+        ultimo_removido = removidos[-1]['id']
+
+    data = {
+        "produtos": list(produtos),
+        "removidos": [{"id": r['produto_id'], "codigo": r['codigo']} for r in removidos],
+        "movimentacoes": [montar_mov(linha) for linha in movimentacoes],
+        "token": _codificar_token(agora, ultima_movimentacao, ultimo_removido),
+        "tem_mais": tem_mais,
+    }
+    return JsonResponse(data)
+
+# ============================================================================
+# FUNÇÕES DE API - LIMITES DE REQUISIÇÕES
+# ============================================================================
+
+@login_required
+def limites_taxa_api(request):
+    """Expõe a configuração e os contadores do rate limit - APENAS SUPERADMIN"""
+    if request.user.nivel_acesso != 'superadmin':
+        return JsonResponse({"error": "Acesso negado"}, status=403)
+    return JsonResponse({"limites": configuracao_limites(), "contadores": contadores_limites()})
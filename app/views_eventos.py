@@ -0,0 +1,229 @@
+import asyncio
+import contextvars
+import json
+import time
+import traceback
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import connection
+from django.db.models import Max, Q
+from django.http import StreamingHttpResponse
+from .models import EventoEstoque
+
+# Valores padrão, podem ser sobrescritos no settings.py
+SSE_INTERVALO_CONSULTA = 1
+SSE_INTERVALO_PING = 15
+SSE_DURACAO_MAXIMA = 300
+SSE_RETRY_MS = 3000
+
+# Eventos lidos por consulta, e lotes que podem ficar na fila de uma conexão antes de ela ser
+# encerrada por não acompanhar o ritmo (o cliente reconecta e lê o atraso do banco)
+SSE_LOTE = 100
+SSE_MAX_FILA = 100
+
+# Um evento pode ser confirmado depois de outro com id maior (transações concorrentes). Os ids
+# pulados viram lacunas, consultadas de novo por SSE_MARGEM_LACUNAS segundos antes de serem
+# descartadas; as lacunas pendentes vão no id do SSE para sobreviver à reconexão.
+SSE_MARGEM_LACUNAS = 5
+SSE_MAX_LACUNAS = 50
+
+# Eventos mais antigos que isso (segundos) são removidos por `manage.py purgar_eventos`; um
+# cliente que fique fora mais tempo reconecta a partir dos próximos eventos
+SSE_RETENCAO = 7 * 24 * 60 * 60
+
+# ============================================================================
+# FUNÇÕES AUXILIARES
+# ============================================================================
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+def retencao_eventos():
+    return timedelta(seconds=_config('SSE_RETENCAO', SSE_RETENCAO))
+
+def formatar_evento_sse(evento, posicao=None):
+    """Formata um evento no protocolo text/event-stream; o campo id leva a posição de retomada do stream"""
+    dados = json.dumps({'id': evento['id'], 'tipo': evento['tipo'], 'data_hora': evento['criado_em'].isoformat(), **evento['dados']})
+    return f"id: {posicao or evento['id']}\nevent: {evento['tipo'].lower()}\ndata: {dados}\n\n"
+
+def _codificar_posicao(ultimo_id, lacunas):
+    """Posição de retomada: o último id lido e, se houver, as lacunas ainda pendentes (ex.: 42:39,40)"""
+    if not lacunas:
+        return str(ultimo_id)
+    return f"{ultimo_id}:{','.join(str(i) for i in sorted(lacunas))}"
+
+def _decodificar_posicao(valor):
+    """Converte a posição de retomada em (ultimo_id, [lacunas]); lança ValueError se for inválida"""
+    ultimo, _, lacunas = valor.partition(':')
+    return int(ultimo), [int(i) for i in lacunas.split(',') if i]
+
+async def _ler_posicao(request):
+    """Lê o Last-Event-ID (cabeçalho ou ?last_event_id=); sem ele o stream começa nos próximos eventos"""
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id', '')
+    try:
+        return _decodificar_posicao(valor)
+    except ValueError:
+        resultado = await EventoEstoque.objects.aaggregate(ultimo=Max('id'))
+        return resultado['ultimo'] or 0, []
+
+def _consulta_eventos(ultimo_id, lacunas):
+    return (EventoEstoque.objects.filter(Q(id__gt=ultimo_id) | Q(id__in=list(lacunas)))
+            .order_by('id').values('id', 'tipo', 'dados', 'criado_em')[:SSE_LOTE])
+
+def _ler_eventos(ultimo_id, lacunas):
+    """Consulta do difusor; fecha a conexão em seguida para não mantê-la aberta entre as consultas"""
+    try:
+        if ultimo_id is None:
+            return EventoEstoque.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        return list(_consulta_eventos(ultimo_id, lacunas))
+    finally:
+        if not connection.in_atomic_block:
+            connection.close()
+
+def _avancar(eventos, ultimo_id, lacunas, margem, max_lacunas):
+    """Aplica os eventos lidos à posição (ultimo_id, lacunas); retorna o novo ultimo_id e os eventos inéditos
+
+    Um id pulado vira lacuna até `margem` segundos depois; eventos já vistos são ignorados.
+    """
+    agora = time.monotonic()
+    for i in [i for i, prazo in lacunas.items() if prazo <= agora]:
+        del lacunas[i]
+    novos = []
+    for evento in eventos:
+        if lacunas.pop(evento['id'], None) is None:
+            if evento['id'] <= ultimo_id:
+                continue
+            pulados = range(max(ultimo_id + 1, evento['id'] - max_lacunas), evento['id'])
+            lacunas.update((i, agora + margem) for i in pulados)
+            ultimo_id = evento['id']
+        novos.append((evento, _codificar_posicao(ultimo_id, lacunas)))
+    return ultimo_id, novos
+
+# ============================================================================
+# DIFUSOR DE EVENTOS
+# ============================================================================
+# Um único laço por processo consulta os eventos novos e repassa o mesmo lote para a fila de
+# cada conexão aberta: a carga no banco não cresce com o número de dashboards, e a conexão
+# com o banco é fechada entre as consultas. O laço para quando a última conexão é encerrada.
+
+class _Difusor:
+    def __init__(self):
+        self.assinantes = set()
+        self.tarefa = None
+        self.ultimo_id = None
+        self.lacunas = {}
+
+    async def assinar(self, lacunas):
+        """Registra uma conexão e retorna a fila em que ela recebe os lotes de eventos"""
+        if self.ultimo_id is None:
+            # A posição inicial é lida antes de a conexão ler o seu atraso: nenhum evento fica
+            # entre o que ela lê sozinha e o que passa a receber do difusor
+            ultimo_id = await sync_to_async(_ler_eventos)(None, ())
+            if self.ultimo_id is None:
+                self.ultimo_id = ultimo_id
+        prazo = time.monotonic() + _config('SSE_MARGEM_LACUNAS', SSE_MARGEM_LACUNAS)
+        for i in lacunas:
+            self.lacunas.setdefault(i, prazo)
+
+        fila = asyncio.Queue(maxsize=_config('SSE_MAX_FILA', SSE_MAX_FILA))
+        self.assinantes.add(fila)
+        if self.tarefa is None:
+            # Contexto vazio: o laço não herda o contexto (e a thread do banco) da requisição que o iniciou
+            self.tarefa = asyncio.get_running_loop().create_task(self._consultar(), context=contextvars.Context())
+        return fila
+
+    def cancelar(self, fila):
+        self.assinantes.discard(fila)
+        if not self.assinantes and self.tarefa is not None:
+            self.tarefa.cancel()
+            self.tarefa = None
+            self.ultimo_id = None
+            self.lacunas = {}
+
+    def ativa(self, fila):
+        """False quando a conexão foi descartada por não acompanhar os eventos (fila cheia)"""
+        return fila in self.assinantes
+
+    async def _consultar(self):
+        intervalo = _config('SSE_INTERVALO_CONSULTA', SSE_INTERVALO_CONSULTA)
+        margem_lacunas = _config('SSE_MARGEM_LACUNAS', SSE_MARGEM_LACUNAS)
+        max_lacunas = _config('SSE_MAX_LACUNAS', SSE_MAX_LACUNAS)
+        while True:
+            try:
+                eventos = await sync_to_async(_ler_eventos)(self.ultimo_id, list(self.lacunas))
+            except Exception:
+                traceback.print_exc()
+                await asyncio.sleep(intervalo)
+                continue
+
+            self.ultimo_id, novos = _avancar(eventos, self.ultimo_id, self.lacunas, margem_lacunas, max_lacunas)
+            if novos:
+                lote = [evento for evento, _ in novos]
+                for fila in list(self.assinantes):
+                    try:
+                        fila.put_nowait(lote)
+                    except asyncio.QueueFull:
+                        # Cliente lento: encerra o stream dele, que reconecta a partir do Last-Event-ID
+                        self.assinantes.discard(fila)
+            # Lote cheio: ainda há eventos para ler, consulta de novo sem esperar
+            if len(eventos) < SSE_LOTE:
+                await asyncio.sleep(intervalo)
+
+_difusor = _Difusor()
+
+async def _gerar_eventos(ultimo_id, lacunas_pendentes=()):
+    intervalo_ping = _config('SSE_INTERVALO_PING', SSE_INTERVALO_PING)
+    duracao_maxima = _config('SSE_DURACAO_MAXIMA', SSE_DURACAO_MAXIMA)
+    margem_lacunas = _config('SSE_MARGEM_LACUNAS', SSE_MARGEM_LACUNAS)
+    max_lacunas = _config('SSE_MAX_LACUNAS', SSE_MAX_LACUNAS)
+
+    yield f"retry: {_config('SSE_RETRY_MS', SSE_RETRY_MS)}\n\n"
+    inicio = ultimo_envio = time.monotonic()
+    # id pulado -> instante (monotonic) em que deixa de ser esperado
+    lacunas = {i: inicio + margem_lacunas for i in lacunas_pendentes[-max_lacunas:]}
+    fila = await _difusor.assinar(list(lacunas))
+    try:
+        # Atraso da própria conexão (desde o Last-Event-ID), lido uma vez; o resto chega pelo difusor
+        while True:
+            eventos = [evento async for evento in _consulta_eventos(ultimo_id, lacunas)]
+            ultimo_id, novos = _avancar(eventos, ultimo_id, lacunas, margem_lacunas, max_lacunas)
+            for evento, posicao in novos:
+                ultimo_envio = time.monotonic()
+                yield formatar_evento_sse(evento, posicao)
+            if len(eventos) < SSE_LOTE:
+                break
+
+        while _difusor.ativa(fila) or not fila.empty():
+            agora = time.monotonic()
+            # A conexão é encerrada periodicamente; o EventSource reconecta enviando o Last-Event-ID
+            if agora - inicio >= duracao_maxima:
+                break
+            espera = min(intervalo_ping - (agora - ultimo_envio), duracao_maxima - (agora - inicio))
+            try:
+                eventos = await asyncio.wait_for(fila.get(), timeout=max(espera, 0))
+            except asyncio.TimeoutError:
+                if time.monotonic() - ultimo_envio >= intervalo_ping:
+                    ultimo_envio = time.monotonic()
+                    yield ': ping\n\n'
+                continue
+            ultimo_id, novos = _avancar(eventos, ultimo_id, lacunas, margem_lacunas, max_lacunas)
+            for evento, posicao in novos:
+                ultimo_envio = time.monotonic()
+                yield formatar_evento_sse(evento, posicao)
+    finally:
+        _difusor.cancelar(fila)
+
+# ============================================================================
+# FUNÇÕES DE EVENTOS (SSE)
+# ============================================================================
+
+@login_required
+async def eventos_estoque(request):
+    """Stream SSE com as alterações de estoque (entradas, solicitações, aprovações e reprovações)"""
+    ultimo_id, lacunas = await _ler_posicao(request)
+    response = StreamingHttpResponse(_gerar_eventos(ultimo_id, lacunas), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
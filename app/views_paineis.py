@@ -0,0 +1,119 @@
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseForbidden, JsonResponse
+from django.shortcuts import render
+from .models import CustomUser, Product, Solicitacao, Saidas, Entradas, VersaoRecurso
+
+# Itens por página dos painéis carregados sob demanda pelos dashboards
+ITENS_POR_PAGINA_PAINEL = 25
+
+NIVEIS_ADMIN = ('admin', 'superadmin')
+
+# Tempo (segundos) dos fragmentos de template cacheados nos dashboards.
+# As chaves incluem as versões dos recursos, então alterações invalidam na hora.
+FRAGMENTOS_TIMEOUT = 600
+
+def versoes_dashboard():
+    """Versões usadas nas chaves dos fragmentos cacheados ({% cache %}) dos painéis"""
+    catalogo, movimentacoes, solicitacoes = VersaoRecurso.atuais('catalogo', 'movimentacoes', 'solicitacoes')
+    return {
+        'fragmentos_timeout': FRAGMENTOS_TIMEOUT,
+        'versao_catalogo': catalogo,
+        'versao_movimentacoes': movimentacoes,
+        'versao_solicitacoes': solicitacoes,
+    }
+
+# ============================================================================
+# CONSULTAS DOS PAINÉIS
+# ============================================================================
+
+# Cada painel lê só as colunas que o fragmento exibe (.only()) e as mesmas
+# colunas, com os nomes do values(), na resposta JSON
+
+def _produtos():
+    return Product.objects.only('id', 'codigo', 'nome', 'quantidade', 'local', 'carencia').order_by('codigo')
+
+def _solicitacoes():
+    return (Solicitacao.objects.filter(status='PENDENTE')
+            .select_related('produto')
+            .only('id', 'quantidade', 'destino', 'solicitante', 'data_solicitacao', 'status', 'produto__codigo', 'produto__nome')
+            .order_by('-data_solicitacao'))
+
+def _entradas():
+    return (Entradas.objects.select_related('produto')
+            .only('id', 'data_entrada', 'quantidade', 'usuario', 'produto__codigo', 'produto__nome')
+            .order_by('-data_entrada', '-id'))
+
+def _saidas():
+    return (Saidas.objects.select_related('produto')
+            .only('id', 'data_saida', 'quantidade', 'destino', 'usuario', 'produto__codigo', 'produto__nome')
+            .order_by('-data_saida', '-id'))
+
+def _usuarios():
+    return CustomUser.objects.only('id', 'username', 'email', 'nivel_acesso', 'is_active').order_by('username')
+
+PAINEIS = {
+    'produtos': {
+        'consulta': _produtos,
+        'campos': ('id', 'codigo', 'nome', 'quantidade', 'local', 'carencia'),
+        'niveis': NIVEIS_ADMIN,
+    },
+    'solicitacoes': {
+        'consulta': _solicitacoes,
+        'campos': ('id', 'produto__codigo', 'produto__nome', 'quantidade', 'destino', 'solicitante', 'data_solicitacao', 'status'),
+        'niveis': NIVEIS_ADMIN,
+    },
+    'entradas': {
+        'consulta': _entradas,
+        'campos': ('id', 'data_entrada', 'produto__codigo', 'produto__nome', 'quantidade', 'usuario'),
+        'niveis': NIVEIS_ADMIN,
+    },
+    'saidas': {
+        'consulta': _saidas,
+        'campos': ('id', 'data_saida', 'produto__codigo', 'produto__nome', 'quantidade', 'destino', 'usuario'),
+        'niveis': NIVEIS_ADMIN,
+    },
+    'usuarios': {
+        'consulta': _usuarios,
+        'campos': ('id', 'username', 'email', 'nivel_acesso', 'is_active'),
+        'niveis': ('superadmin',),
+    },
+}
+
+# ============================================================================
+# FRAGMENTOS DOS DASHBOARDS
+# ============================================================================
+
+@login_required
+def painel_dashboard(request, painel):
+    """Uma página de um painel do dashboard, como fragmento HTML ou JSON (Accept: application/json)"""
+    if painel not in PAINEIS:
+        raise Http404('Painel não encontrado')
+    config = PAINEIS[painel]
+    responder_json = 'application/json' in request.headers.get('Accept', '')
+
+    if request.user.nivel_acesso not in config['niveis']:
+        if responder_json:
+            return JsonResponse({'erro': 'Acesso negado'}, status=403)
+        return HttpResponseForbidden('Acesso negado')
+
+    consulta = config['consulta']()
+    if responder_json:
+        consulta = consulta.values(*config['campos'])
+    page_obj = Paginator(consulta, ITENS_POR_PAGINA_PAINEL).get_page(request.GET.get('page'))
+
+    if responder_json:
+        return JsonResponse({
+            'painel': painel,
+            'pagina': page_obj.number,
+            'paginas': page_obj.paginator.num_pages,
+            'total': page_obj.paginator.count,
+            'itens': list(page_obj),
+        })
+
+    context = {
+        'painel': painel,
+        'page_obj': page_obj,
+        **versoes_dashboard(),
+    }
+    return render(request, f'paineis/{painel}.html', context)
@@ -1,13 +1,22 @@
+import csv
+import io
 from django.shortcuts import render, redirect, get_object_or_404 
 from django.contrib.auth.decorators import login_required  
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.http import JsonResponse
 from django.utils import timezone
-from decouple import config
-from django.core.mail import send_mail, EmailMultiAlternatives
-from .models import CustomUser, Product, Solicitacao, Movimentacao, Saidas, Entradas
+from .models import CustomUser, Product, Solicitacao, Movimentacao, Saidas, Entradas, EventoEstoque, VersaoRecurso
 from .views_log import registrar_log
-from .whatsapp_service import WhatsAppService
+from .eventos import novo_evento, registrar_evento
+from .notificacoes import destinatarios, renderizar_email, enfileirar_email, enfileirar_whatsapp, enfileirar_whatsapp_lote
+from .estoque import adicionar_estoque, retirar_estoque
+from .indicadores import atualizar_indicadores, variacao_carencia
+from .reposicao import FOLGA, abaixo_da_carencia, candidatos_reposicao, margem_atencao
+from .ratelimit import limitar_taxa
+from .idempotencia import idempotente
+from .streaming import resposta_streaming
 
 # ============================================================================
 # FUNÇÕES DE ESTOQUE - PRODUTOS
@@ -31,20 +40,34 @@ def cadastro_produto(request):
             messages.error(request, 'Código do produto já existe')
             return render(request, 'cadastro_produto.html')
         
-        produto = Product.objects.create(
-            nome=nome,
-            quantidade=quantidade,
-            local=local,
-            codigo=codigo,
-            carencia=carencia
-        )
-        
-        # Registrar log no banco
-        registrar_log(
-            acao="Produto cadastrado",
-            usuario=request.user,
-            detalhes=f"Cadastrou produto: {produto.nome} (Código: {produto.codigo})"
-        )
+        with transaction.atomic():
+            produto = Product.objects.create(
+                nome=nome,
+                quantidade=quantidade,
+                local=local,
+                codigo=codigo,
+                carencia=carencia
+            )
+
+            # O saldo inicial também entra no ledger de movimentações
+            if quantidade:
+                Movimentacao.objects.create(
+                    tipo='AJUSTE',
+                    produto=produto,
+                    quantidade=abs(quantidade),
+                    variacao=quantidade,
+                    usuario=request.user.username,
+                    observacao='Saldo inicial do cadastro'
+                )
+
+            atualizar_indicadores(produtos=1, unidades=quantidade, abaixo_carencia=int(abaixo_da_carencia(quantidade, int(carencia))))
+            
+            # Registrar log no banco
+            registrar_log(
+                acao="Produto cadastrado",
+                usuario=request.user,
+                detalhes=f"Cadastrou produto: {produto.nome} (Código: {produto.codigo})"
+            )
         
         messages.success(request, 'Produto cadastrado com sucesso!')
         if request.user.nivel_acesso == 'comum':
@@ -59,7 +82,9 @@ def cadastro_produto(request):
 @login_required
 def estoque_geral(request):
     """View para exibir o estoque geral de produtos"""
-    produtos = Product.objects.all()
+    # A folga (quantidade - carencia) define a cor da quantidade: vermelho no limite da carência,
+    # amarelo até a margem de atenção
+    produtos = Product.objects.annotate(folga=FOLGA)
     
     codigo = request.GET.get('codigo', '').strip()
     nome = request.GET.get('nome', '').strip()
@@ -71,6 +96,7 @@ def estoque_geral(request):
     
     context = {
         'produtos': produtos,
+        'margem_atencao': margem_atencao(),
         'filtros': {
             'codigo': codigo,
             'nome': nome,
@@ -79,6 +105,30 @@ def estoque_geral(request):
     
     return render(request, 'estoque_geral.html', context)
 
+@login_required
+def reposicao(request):
+    """View da lista de reposição: produtos no limite da carência, do mais crítico para o menos - BLOQUEADA para usuário comum"""
+    if request.user.nivel_acesso == 'comum':
+        messages.error(request, 'Acesso negado')
+        return redirect('dashboard_comum')
+
+    from django.core.paginator import Paginator
+
+    # Com "incluir próximos" entram também os produtos que estão a até margem_atencao da carência
+    incluir_proximos = request.GET.get('proximos') == '1'
+    produtos = candidatos_reposicao(margem_atencao() if incluir_proximos else 0)
+
+    paginator = Paginator(produtos, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'page_obj': page_obj,
+        'incluir_proximos': incluir_proximos,
+        'margem_atencao': margem_atencao(),
+    }
+
+    return render(request, 'reposicao.html', context)
+
 @login_required
 def deletar_produto(request, produto_id):
     """View para deletar produto - APENAS ADMIN/SUPERADMIN"""
@@ -86,24 +136,35 @@ def deletar_produto(request, produto_id):
         messages.error(request, 'Acesso negado')
         return redirect('dashboard_comum')
     
-    produto = get_object_or_404(Product, id=produto_id)
-    
     if request.method == 'POST':
-        nome_produto = produto.nome
-        codigo_produto = produto.codigo
-        
-        # Registrar log antes de deletar
-        registrar_log(
-            acao="Produto deletado",
-            usuario=request.user,
-            detalhes=f"Deletou produto: {nome_produto} (Código: {codigo_produto})"
-        )
-        
-        produto.delete()
+        with transaction.atomic():
+            # Travado para que a quantidade descontada dos indicadores seja a que está sendo removida
+            produto = get_object_or_404(Product.objects.select_for_update(), id=produto_id)
+            nome_produto = produto.nome
+            codigo_produto = produto.codigo
+            
+            # Registrar log antes de deletar
+            registrar_log(
+                acao="Produto deletado",
+                usuario=request.user,
+                detalhes=f"Deletou produto: {nome_produto} (Código: {codigo_produto})"
+            )
+
+            # As solicitações pendentes do produto são removidas junto (CASCADE)
+            pendentes = Solicitacao.objects.filter(produto=produto, status='PENDENTE').count()
+            atualizar_indicadores(
+                produtos=-1,
+                unidades=-produto.quantidade,
+                abaixo_carencia=-int(abaixo_da_carencia(produto.quantidade, produto.carencia)),
+                solicitacoes_pendentes=-pendentes,
+            )
+            
+            produto.delete()
         
         messages.success(request, f'Produto {nome_produto} deletado com sucesso!')
         return redirect('estoque_geral')
     
+    get_object_or_404(Product, id=produto_id)
     return redirect('estoque_geral')
 
 @login_required
@@ -113,14 +174,19 @@ def editar_produto(request, produto_id):
         messages.error(request, 'Acesso negado')
         return redirect('dashboard_comum')
     
-    produto = get_object_or_404(Product, id=produto_id)
-    
     if request.method == 'POST':
-        nome_antigo = produto.nome
-        produto.nome = request.POST.get('nome', produto.nome)
-        produto.local = request.POST.get('local', produto.local)
-        produto.carencia = int(request.POST.get('carencia', produto.carencia))
-        produto.save()
+        with transaction.atomic():
+            produto = get_object_or_404(Product.objects.select_for_update(), id=produto_id)
+            nome_antigo = produto.nome
+            carencia_antiga = produto.carencia
+            produto.nome = request.POST.get('nome', produto.nome)
+            produto.local = request.POST.get('local', produto.local)
+            produto.carencia = int(request.POST.get('carencia', produto.carencia))
+            # Só os campos editados: salvar a linha inteira sobrescreveria a quantidade com um valor antigo
+            produto.save(update_fields=['nome', 'local', 'carencia', 'atualizado_em'])
+            atualizar_indicadores(abaixo_carencia=variacao_carencia(
+                produto.quantidade, produto.quantidade, carencia_antiga, produto.carencia
+            ))
         
         # Registrar log
         registrar_log(
@@ -135,6 +201,7 @@ def editar_produto(request, produto_id):
         else:
             return redirect('dashboard_super')
     
+    get_object_or_404(Product, id=produto_id)
     if request.user.nivel_acesso == 'admin':
         return redirect('dashboard_admin')
     else:
@@ -152,14 +219,75 @@ def listar_movimentacoes(request):
         return redirect('dashboard_comum')
     
     from django.core.paginator import Paginator
-    
+
     movimentacoes = Movimentacao.objects.select_related('produto').order_by('-data_hora')
-    
-    codigo = request.GET.get('codigo', '').strip()
-    usuario = request.GET.get('usuario', '').strip()
-    data_inicio = request.GET.get('data_inicio', '').strip()
-    data_fim = request.GET.get('data_fim', '').strip()
-    
+    movimentacoes, filtros = filtrar_movimentacoes(movimentacoes, request.GET)
+
+    paginator = Paginator(movimentacoes, 20)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+
+    context = {
+        'page_obj': page_obj,
+        'filtros': filtros,
+    }
+
+    return render(request, 'movimentacoes.html', context)
+
+class _Eco:
+    # Buffer mínimo para o csv.writer: devolve a linha em vez de guardá-la
+    def write(self, valor):
+        return valor
+
+@login_required
+@limitar_taxa('relatorios')
+def exportar_movimentacoes_csv(request):
+    """View para exportar as movimentações filtradas em CSV - BLOQUEADA para usuário comum"""
+    if request.user.nivel_acesso == 'comum':
+        messages.error(request, 'Acesso negado')
+        return redirect('dashboard_comum')
+
+    movimentacoes = Movimentacao.objects.order_by('-data_hora', '-id')
+    try:
+        movimentacoes, _ = filtrar_movimentacoes(movimentacoes, request.GET)
+    except ValidationError:
+        messages.error(request, 'Data inválida nos filtros')
+        return redirect('listar_movimentacoes')
+
+    # iterator() usa cursor do lado do servidor no PostgreSQL: memória constante e download imediato,
+    # também sob ASGI (resposta_streaming entrega o gerador como iterador assíncrono)
+    linhas = movimentacoes.values_list(
+        'data_hora', 'tipo', 'produto__codigo', 'produto__nome', 'quantidade', 'usuario', 'referencia_id', 'observacao'
+    ).iterator(chunk_size=2000)
+    tipos = dict(Movimentacao.TIPO_CHOICES)
+
+    def gerar_csv():
+        writer = csv.writer(_Eco(), delimiter=';')
+        # BOM para o Excel reconhecer o arquivo como UTF-8
+        yield '\ufeff' + writer.writerow(['Data/Hora', 'Tipo', 'Código', 'Produto', 'Quantidade', 'Usuário', 'Referência', 'Observação'])
+        for data_hora, tipo, codigo, nome, quantidade, usuario, referencia_id, observacao in linhas:
+            yield writer.writerow([
+                timezone.localtime(data_hora).strftime('%d/%m/%Y %H:%M:%S'),
+                tipos.get(tipo, tipo),
+                codigo,
+                nome,
+                quantidade if quantidade is not None else '',
+                usuario,
+                referencia_id or '',
+                observacao,
+            ])
+
+    response = resposta_streaming(request, gerar_csv(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="movimentacoes_{timezone.localtime().strftime("%Y%m%d_%H%M%S")}.csv"'
+    return response
+
+def filtrar_movimentacoes(movimentacoes, params):
+    """Aplica os filtros de código, usuário e período usados na auditoria de movimentações"""
+    codigo = params.get('codigo', '').strip()
+    usuario = params.get('usuario', '').strip()
+    data_inicio = params.get('data_inicio', '').strip()
+    data_fim = params.get('data_fim', '').strip()
+
     if codigo:
         movimentacoes = movimentacoes.filter(produto__codigo__icontains=codigo)
     if usuario:
@@ -168,28 +296,21 @@ def listar_movimentacoes(request):
         movimentacoes = movimentacoes.filter(data_hora__date__gte=data_inicio)
     if data_fim:
         movimentacoes = movimentacoes.filter(data_hora__date__lte=data_fim)
-    
-    paginator = Paginator(movimentacoes, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    context = {
-        'page_obj': page_obj,
-        'filtros': {
-            'codigo': codigo,
-            'usuario': usuario,
-            'data_inicio': data_inicio,
-            'data_fim': data_fim,
-        }
+
+    filtros = {
+        'codigo': codigo,
+        'usuario': usuario,
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
     }
-    
-    return render(request, 'movimentacoes.html', context)
+    return movimentacoes, filtros
 
 # ============================================================================
 # FUNÇÕES DE ESTOQUE - SOLICITAÇÕES
 # ============================================================================
 
 @login_required
+@idempotente('solicitar_produto')
 def solicitar_produto(request):
     """View para solicitar produtos"""
     if request.method == 'POST':
@@ -226,116 +347,61 @@ def solicitar_produto(request):
             else:
                 return redirect('dashboard_super')
         
-        solicitacao = Solicitacao.objects.create(
-            produto=produto,
-            quantidade=quantidade,
-            destino=destino,
-            solicitante=request.user.username,
-        )
-        
-        Movimentacao.objects.create(
-            tipo='SOLICITACAO',
-            produto=produto,
-            quantidade=quantidade,
-            usuario=request.user.username,
-            referencia_id=solicitacao.id,
-            observacao=f'Solicitação #{solicitacao.id} criada - Destino: {destino}'
-        )
-        
-        # Enviar notificações apenas para administradores (não superadmin)
-        admins = CustomUser.objects.filter(nivel_acesso='admin')
-        emails_admins = [admin.email for admin in admins if admin.email]
-        
-        # Enviar email
-        if emails_admins:
-            try:
-                html_content = f'''
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <style>
-                        body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                        .container {{ max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                        .header {{ background-color: #007bff; color: white; padding: 20px; text-align: center; }}
-                        .content {{ padding: 30px; }}
-                        .info-box {{ background-color: #f8f9fa; border-left: 4px solid #007bff; padding: 15px; margin: 20px 0; }}
-                        .footer {{ background-color: #6c757d; color: white; padding: 15px; text-align: center; font-size: 12px; }}
-                        .btn {{ display: inline-block; padding: 10px 20px; background-color: #28a745; color: white; text-decoration: none; border-radius: 5px; margin: 10px 5px; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="header">
-                            <h1>🔔 Nova Solicitação de Produto</h1>
-                            <p>Stock Flow - Sistema de Gerenciamento de Estoque</p>
-                        </div>
-                        <div class="content">
-                            <h2>Solicitação #{solicitacao.id}</h2>
-                            <p>Uma nova solicitação foi criada e precisa de sua validação:</p>
-                            
-                            <div class="info-box">
-                                <p><strong>👤 Solicitante:</strong> {request.user.username}</p>
-                                <p><strong>📦 Produto:</strong> {produto.nome}</p>
-                                <p><strong>🏷️ Código:</strong> {produto.codigo}</p>
-                                <p><strong>📊 Quantidade:</strong> {quantidade} unidades</p>
-                                <p><strong>📍 Destino:</strong> {destino}</p>
-                                <p><strong>📅 Data:</strong> {timezone.localtime(solicitacao.data_solicitacao).strftime('%d/%m/%Y às %H:%M')}</p>
-                            </div>
-                            
-                            <p>Por favor, acesse o sistema para aprovar ou reprovar esta solicitação.</p>
-                        </div>
-                        <div class="footer">
-                            <p>Este é um email automático. Não responda a esta mensagem.</p>
-                            <p>Stock Flow &copy; 2025 - Sistema de Gerenciamento de Estoque</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-                '''
-                
-                text_content = f'''Nova Solicitação de Produto - Stock Flow
-
-Solicitação #{solicitacao.id}
-Solicitante: {request.user.username}
-Produto: {produto.nome} (Código: {produto.codigo})
-Quantidade: {quantidade}
-Destino: {destino}
-Data: {timezone.localtime(solicitacao.data_solicitacao).strftime('%d/%m/%Y %H:%M')}
-
-Por favor, acesse o sistema para aprovar ou reprovar esta solicitação.'''
-                
-                msg = EmailMultiAlternatives(
-                    'Nova Solicitação de Produto - Stock Flow',
-                    text_content,
-                    config('EMAIL_HOST_USER'),
-                    emails_admins
-                )
-                msg.attach_alternative(html_content, "text/html")
-                msg.send(fail_silently=True)
-            except Exception:
-                pass
-        
-        # Enviar WhatsApp para administradores
-        whatsapp = WhatsAppService()
-        for admin in admins:
-            if admin.telefone:
-                dados_whatsapp = {
-                    'id': solicitacao.id,
-                    'solicitante': request.user.username,
-                    'produto': produto.nome,
-                    'codigo': produto.codigo,
-                    'quantidade': quantidade,
-                    'destino': destino,
-                    'data': timezone.localtime(solicitacao.data_solicitacao).strftime('%d/%m/%Y às %H:%M')
-                }
-                whatsapp.send_notification(admin.telefone, 'nova_solicitacao', dados_whatsapp)
-        
-        # Registrar log no banco
-        registrar_log(
-            acao="Solicitação criada",
-            usuario=request.user,
-            detalhes=f"Solicitou {quantidade} unidades do produto: {produto.nome} - Destino: {destino}"
-        )
+        with transaction.atomic():
+            solicitacao = Solicitacao.objects.create(
+                produto=produto,
+                quantidade=quantidade,
+                destino=destino,
+                solicitante=request.user.username,
+            )
+            
+            Movimentacao.objects.create(
+                tipo='SOLICITACAO',
+                produto=produto,
+                quantidade=quantidade,
+                usuario=request.user.username,
+                referencia_id=solicitacao.id,
+                observacao=f'Solicitação #{solicitacao.id} criada - Destino: {destino}'
+            )
+
+            registrar_evento('SOLICITACAO', produto, request.user, solicitacao_id=solicitacao.id, quantidade=quantidade, destino=destino)
+            atualizar_indicadores(solicitacoes_pendentes=1)
+            
+            # Notificações apenas para administradores (não superadmin), gravadas na fila na mesma transação
+            texto, html = renderizar_email('nova_solicitacao', {
+                'id': solicitacao.id,
+                'solicitante': request.user.username,
+                'produto': produto.nome,
+                'codigo': produto.codigo,
+                'quantidade': quantidade,
+                'destino': destino,
+                'data': timezone.localtime(solicitacao.data_solicitacao).strftime('%d/%m/%Y às %H:%M'),
+            })
+            enfileirar_email(
+                'nova_solicitacao',
+                'Nova Solicitação de Produto - Stock Flow',
+                texto,
+                destinatarios('admin', 'email'),
+                html=html
+            )
+            
+            dados_whatsapp = {
+                'id': solicitacao.id,
+                'solicitante': request.user.username,
+                'produto': produto.nome,
+                'codigo': produto.codigo,
+                'quantidade': quantidade,
+                'destino': destino,
+                'data': timezone.localtime(solicitacao.data_solicitacao).strftime('%d/%m/%Y às %H:%M')
+            }
+            enfileirar_whatsapp('nova_solicitacao', destinatarios('admin', 'whatsapp'), dados_whatsapp)
+            
+            # Registrar log no banco
+            registrar_log(
+                acao="Solicitação criada",
+                usuario=request.user,
+                detalhes=f"Solicitou {quantidade} unidades do produto: {produto.nome} - Destino: {destino}"
+            )
         
         messages.success(request, f'Solicitação #{solicitacao.id} criada com sucesso!')
         if request.user.nivel_acesso == 'comum':
@@ -355,26 +421,28 @@ Por favor, acesse o sistema para aprovar ou reprovar esta solicitação.'''
 @login_required
 def aprovar_solicitacao(request, solicitacao_id):
     """View para aprovar solicitação e executar retirada automaticamente"""
-    solicitacao = get_object_or_404(Solicitacao, id=solicitacao_id, status='PENDENTE')
-    produto = solicitacao.produto
-    
-    if produto.quantidade < solicitacao.quantidade:
-        messages.error(request, f'Estoque insuficiente para aprovação. Disponível: {produto.quantidade}, Solicitado: {solicitacao.quantidade}')
-        if request.user.nivel_acesso == 'comum':
-            return redirect('dashboard_comum')
-        elif request.user.nivel_acesso == 'admin':
-            return redirect('dashboard_admin')
-        else:
-            return redirect('dashboard_super')
-    
     with transaction.atomic():
+        # Trava a solicitação: duas aprovações simultâneas não podem retirar o estoque duas vezes
+        solicitacao = get_object_or_404(
+            Solicitacao.objects.select_for_update(of=('self',)).select_related('produto'),
+            id=solicitacao_id,
+            status='PENDENTE'
+        )
+        produto = solicitacao.produto
+
+        if not retirar_estoque(produto, solicitacao.quantidade):
+            messages.error(request, f'Estoque insuficiente para aprovação. Disponível: {produto.quantidade}, Solicitado: {solicitacao.quantidade}')
+            if request.user.nivel_acesso == 'comum':
+                return redirect('dashboard_comum')
+            elif request.user.nivel_acesso == 'admin':
+                return redirect('dashboard_admin')
+            else:
+                return redirect('dashboard_super')
+
         solicitacao.status = 'ATENDIDA'
         solicitacao.aprovador = request.user.username
         solicitacao.data_aprovacao = timezone.now()
-        solicitacao.save()
-        
-        produto.quantidade -= solicitacao.quantidade
-        produto.save()
+        solicitacao.save(update_fields=['status', 'aprovador', 'data_aprovacao'])
         
         Saidas.objects.create(
             produto=produto,
@@ -387,88 +455,19 @@ def aprovar_solicitacao(request, solicitacao_id):
             tipo='RETIRADA',
             produto=produto,
             quantidade=solicitacao.quantidade,
+            variacao=-solicitacao.quantidade,
             usuario=request.user.username,
             referencia_id=solicitacao.id,
             observacao=f'Solicitação #{solicitacao.id} aprovada e retirada executada automaticamente - Destino: {solicitacao.destino}'
         )
-        
-        # Enviar notificações de aprovação
-        email = "beltramevictor13@gmail.com"
-        
-        # Enviar email
-        try:
-            html_content = f'''
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                    .container {{ max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                    .header {{ background-color: #28a745; color: white; padding: 20px; text-align: center; }}
-                    .content {{ padding: 30px; }}
-                    .info-box {{ background-color: #d4edda; border-left: 4px solid #28a745; padding: 15px; margin: 20px 0; }}
-                    .footer {{ background-color: #6c757d; color: white; padding: 15px; text-align: center; font-size: 12px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>✅ Solicitação Aprovada</h1>
-                        <p>Stock Flow - Sistema de Gerenciamento de Estoque</p>
-                    </div>
-                    <div class="content">
-                        <h2>Solicitação #{solicitacao.id} Aprovada</h2>
-                        <p>Uma solicitação foi aprovada e o produto foi retirado do estoque:</p>
-                        
-                        <div class="info-box">
-                            <p><strong>👤 Solicitante:</strong> {solicitacao.solicitante}</p>
-                            <p><strong>👨‍💼 Aprovador:</strong> {request.user.username}</p>
-                            <p><strong>📦 Produto:</strong> {produto.nome}</p>
-                            <p><strong>🏷️ Código:</strong> {produto.codigo}</p>
-                            <p><strong>📊 Quantidade:</strong> -{solicitacao.quantidade} unidades</p>
-                            <p><strong>📍 Destino:</strong> {solicitacao.destino}</p>
-                            <p><strong>📅 Data Aprovação:</strong> {timezone.localtime().strftime('%d/%m/%Y às %H:%M')}</p>
-                        </div>
-                    </div>
-                    <div class="footer">
-                        <p>Este é um email automático. Não responda a esta mensagem.</p>
-                        <p>Stock Flow &copy; 2025 - Sistema de Gerenciamento de Estoque</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            '''
-            
-            text_content = f'Solicitação Aprovada - A solicitação #{solicitacao.id} foi aprovada por {request.user.username}. Produto: {produto.nome}, Quantidade: {solicitacao.quantidade}, Destino: {solicitacao.destino}.'
-            
-            msg = EmailMultiAlternatives(
-                'Solicitação Aprovada - Stock Flow',
-                text_content,
-                config('EMAIL_HOST_USER'),
-                [email]
-            )
-            msg.attach_alternative(html_content, "text/html")
-            msg.send(fail_silently=True)
-        except Exception:
-            pass
-        
-        # Enviar WhatsApp para o solicitante
-        try:
-            solicitante_user = CustomUser.objects.get(username=solicitacao.solicitante)
-            if solicitante_user.telefone:
-                whatsapp = WhatsAppService()
-                dados_whatsapp = {
-                    'id': solicitacao.id,
-                    'solicitante': solicitacao.solicitante,
-                    'aprovador': request.user.username,
-                    'produto': produto.nome,
-                    'quantidade': solicitacao.quantidade,
-                    'destino': solicitacao.destino,
-                    'data_aprovacao': timezone.localtime().strftime('%d/%m/%Y às %H:%M')
-                }
-                whatsapp.send_notification(solicitante_user.telefone, 'solicitacao_aprovada', dados_whatsapp)
-        except CustomUser.DoesNotExist:
-            pass
+
+        registrar_evento('APROVACAO', produto, request.user, solicitacao_id=solicitacao.id, quantidade=solicitacao.quantidade, destino=solicitacao.destino)
+        atualizar_indicadores(
+            unidades=-solicitacao.quantidade,
+            abaixo_carencia=variacao_carencia(produto.quantidade + solicitacao.quantidade, produto.quantidade, produto.carencia),
+            solicitacoes_pendentes=-1,
+            saidas=1,
+        )
         
         # Registrar log no banco
         registrar_log(
@@ -476,6 +475,38 @@ def aprovar_solicitacao(request, solicitacao_id):
             usuario=request.user.username,
             detalhes=f"Aprovou solicitação #{solicitacao.id} - {solicitacao.quantidade} unidades do produto: {produto.nome}"
         )
+
+        # Notificações de aprovação gravadas na fila na mesma transação; o envio fica com o worker
+        texto, html = renderizar_email('solicitacao_aprovada', {
+            'id': solicitacao.id,
+            'solicitante': solicitacao.solicitante,
+            'aprovador': request.user.username,
+            'produto': produto.nome,
+            'codigo': produto.codigo,
+            'quantidade': solicitacao.quantidade,
+            'destino': solicitacao.destino,
+            'data': timezone.localtime().strftime('%d/%m/%Y às %H:%M'),
+        })
+        enfileirar_email(
+            'solicitacao_aprovada',
+            'Solicitação Aprovada - Stock Flow',
+            texto,
+            ["beltramevictor13@gmail.com"],
+            html=html
+        )
+        
+        # WhatsApp para o solicitante
+        telefone = CustomUser.objects.filter(username=solicitacao.solicitante).values_list('telefone', flat=True).first()
+        dados_whatsapp = {
+            'id': solicitacao.id,
+            'solicitante': solicitacao.solicitante,
+            'aprovador': request.user.username,
+            'produto': produto.nome,
+            'quantidade': solicitacao.quantidade,
+            'destino': solicitacao.destino,
+            'data_aprovacao': timezone.localtime().strftime('%d/%m/%Y às %H:%M')
+        }
+        enfileirar_whatsapp('solicitacao_aprovada', [telefone], dados_whatsapp)
     
     messages.success(request, f'Solicitação #{solicitacao.id} aprovada e retirada executada automaticamente!')
     if request.user.nivel_acesso == 'comum':
@@ -488,38 +519,41 @@ def aprovar_solicitacao(request, solicitacao_id):
 @login_required
 def reprovar_solicitacao(request, solicitacao_id):
     """View para reprovar solicitação"""
-    solicitacao = get_object_or_404(Solicitacao, id=solicitacao_id, status='PENDENTE')
-    produto = solicitacao.produto
-    
-    solicitacao.status = 'REPROVADA'
-    solicitacao.aprovador = request.user.username
-    solicitacao.data_aprovacao = timezone.now()
-    solicitacao.save()
-    
-    # Enviar WhatsApp para o solicitante
-    try:
-        solicitante_user = CustomUser.objects.get(username=solicitacao.solicitante)
-        if solicitante_user.telefone:
-            whatsapp = WhatsAppService()
-            dados_whatsapp = {
-                'id': solicitacao.id,
-                'solicitante': solicitacao.solicitante,
-                'reprovador': request.user.username,
-                'produto': produto.nome,
-                'quantidade': solicitacao.quantidade,
-                'destino': solicitacao.destino,
-                'data_reprovacao': timezone.localtime().strftime('%d/%m/%Y às %H:%M')
-            }
-            whatsapp.send_notification(solicitante_user.telefone, 'solicitacao_reprovada', dados_whatsapp)
-    except CustomUser.DoesNotExist:
-        pass
-    
-    # Registrar log no banco
-    registrar_log(
-        acao="Solicitação reprovada",
-        usuario=request.user.username,
-        detalhes=f"Reprovou solicitação #{solicitacao.id} - {solicitacao.quantidade} unidades do produto: {solicitacao.produto.nome}"
-    )
+    with transaction.atomic():
+        solicitacao = get_object_or_404(
+            Solicitacao.objects.select_for_update(of=('self',)).select_related('produto'),
+            id=solicitacao_id,
+            status='PENDENTE'
+        )
+        produto = solicitacao.produto
+        
+        solicitacao.status = 'REPROVADA'
+        solicitacao.aprovador = request.user.username
+        solicitacao.data_aprovacao = timezone.now()
+        solicitacao.save()
+
+        registrar_evento('REPROVACAO', produto, request.user, solicitacao_id=solicitacao.id, quantidade=solicitacao.quantidade, destino=solicitacao.destino)
+        atualizar_indicadores(solicitacoes_pendentes=-1)
+        
+        # WhatsApp para o solicitante, gravado na fila na mesma transação
+        telefone = CustomUser.objects.filter(username=solicitacao.solicitante).values_list('telefone', flat=True).first()
+        dados_whatsapp = {
+            'id': solicitacao.id,
+            'solicitante': solicitacao.solicitante,
+            'reprovador': request.user.username,
+            'produto': produto.nome,
+            'quantidade': solicitacao.quantidade,
+            'destino': solicitacao.destino,
+            'data_reprovacao': timezone.localtime().strftime('%d/%m/%Y às %H:%M')
+        }
+        enfileirar_whatsapp('solicitacao_reprovada', [telefone], dados_whatsapp)
+        
+        # Registrar log no banco
+        registrar_log(
+            acao="Solicitação reprovada",
+            usuario=request.user.username,
+            detalhes=f"Reprovou solicitação #{solicitacao.id} - {solicitacao.quantidade} unidades do produto: {produto.nome}"
+        )
     
     messages.success(request, f'Solicitação #{solicitacao.id} reprovada!')
     if request.user.nivel_acesso == 'comum':
@@ -529,11 +563,228 @@ def reprovar_solicitacao(request, solicitacao_id):
     else:
         return redirect('dashboard_super')
 
+# Limite de solicitações processadas por envio em lote
+LIMITE_SOLICITACOES_LOTE = 500
+
+@login_required
+def processar_solicitacoes_lote(request):
+    """View para aprovar ou reprovar várias solicitações pendentes de uma só vez - BLOQUEADA para usuário comum"""
+    if request.user.nivel_acesso == 'comum':
+        messages.error(request, 'Acesso negado')
+        return redirect('dashboard_comum')
+
+    destino = 'dashboard_admin' if request.user.nivel_acesso == 'admin' else 'dashboard_super'
+    responder_json = 'application/json' in request.headers.get('Accept', '')
+    acao = request.POST.get('acao')
+
+    if request.method != 'POST' or acao not in ('aprovar', 'reprovar'):
+        if responder_json:
+            return JsonResponse({'erro': 'Envie um POST com acao=aprovar ou acao=reprovar'}, status=400)
+        return redirect(destino)
+
+    ids = []
+    for valor in request.POST.getlist('solicitacoes'):
+        try:
+            ids.append(int(valor))
+        except ValueError:
+            continue
+    ids = list(dict.fromkeys(ids))
+
+    if not ids or len(ids) > LIMITE_SOLICITACOES_LOTE:
+        erro = f'Selecione entre 1 e {LIMITE_SOLICITACOES_LOTE} solicitações'
+        if responder_json:
+            return JsonResponse({'erro': erro}, status=400)
+        messages.error(request, erro)
+        return redirect(destino)
+
+    usuario = request.user.username
+    agora = timezone.now()
+    resultados = {}
+    processadas = []
+
+    with transaction.atomic():
+        # Trava as solicitações em ordem de chegada; as já processadas por outro aprovador ficam de fora
+        solicitacoes = list(
+            Solicitacao.objects.select_for_update(of=('self',))
+            .select_related('produto')
+            .filter(id__in=ids, status='PENDENTE')
+            .order_by('data_solicitacao', 'id')
+        )
+
+        if acao == 'aprovar':
+            # Uma única passada travada sobre os produtos envolvidos, sempre na ordem do id
+            produtos = {
+                produto.id: produto
+                for produto in Product.objects.select_for_update()
+                .filter(id__in={solicitacao.produto_id for solicitacao in solicitacoes})
+                .order_by('id')
+            }
+            iniciais = {produto.id: produto.quantidade for produto in produtos.values()}
+            alterados = {}
+            saidas = []
+            movimentacoes = []
+            eventos = []
+            for solicitacao in solicitacoes:
+                produto = produtos[solicitacao.produto_id]
+                solicitacao.produto = produto
+                if produto.quantidade < solicitacao.quantidade:
+                    resultados[solicitacao.id] = (False, f'Estoque insuficiente. Disponível: {produto.quantidade}, Solicitado: {solicitacao.quantidade}')
+                    continue
+                produto.quantidade -= solicitacao.quantidade
+                produto.atualizado_em = agora
+                alterados[produto.id] = produto
+                processadas.append(solicitacao)
+                resultados[solicitacao.id] = (True, 'Aprovada e retirada')
+                saidas.append(Saidas(
+                    produto=produto,
+                    quantidade=solicitacao.quantidade,
+                    destino=solicitacao.destino,
+                    usuario=usuario,
+                ))
+                movimentacoes.append(Movimentacao(
+                    tipo='RETIRADA',
+                    produto=produto,
+                    quantidade=solicitacao.quantidade,
+                    variacao=-solicitacao.quantidade,
+                    usuario=usuario,
+                    referencia_id=solicitacao.id,
+                    observacao=f'Solicitação #{solicitacao.id} aprovada em lote e retirada executada automaticamente - Destino: {solicitacao.destino}'
+                ))
+                eventos.append(novo_evento(
+                    'APROVACAO', produto, usuario,
+                    estoque=produto.quantidade,
+                    solicitacao_id=solicitacao.id,
+                    quantidade=solicitacao.quantidade,
+                    destino=solicitacao.destino
+                ))
+
+            if processadas:
+                Product.objects.bulk_update(alterados.values(), ['quantidade', 'atualizado_em'])
+                Solicitacao.objects.filter(id__in=[solicitacao.id for solicitacao in processadas]).update(
+                    status='ATENDIDA', aprovador=usuario, data_aprovacao=agora
+                )
+                Saidas.objects.bulk_create(saidas)
+                Movimentacao.objects.bulk_create(movimentacoes)
+                EventoEstoque.objects.bulk_create(eventos)
+
+                # bulk_update/bulk_create não disparam signals, então as versões são atualizadas aqui
+                VersaoRecurso.incrementar_apos_commit('catalogo', 'movimentacoes', 'solicitacoes')
+
+                atualizar_indicadores(
+                    unidades=-sum(solicitacao.quantidade for solicitacao in processadas),
+                    abaixo_carencia=sum(
+                        variacao_carencia(iniciais[produto.id], produto.quantidade, produto.carencia)
+                        for produto in alterados.values()
+                    ),
+                    solicitacoes_pendentes=-len(processadas),
+                    saidas=len(processadas),
+                )
+
+                registrar_log(
+                    acao="Solicitações aprovadas em lote",
+                    usuario=usuario,
+                    detalhes=f"Aprovou {len(processadas)} solicitações em lote: " + ', '.join(f'#{solicitacao.id}' for solicitacao in processadas)
+                )
+        else:
+            processadas = solicitacoes
+            if processadas:
+                Solicitacao.objects.filter(id__in=[solicitacao.id for solicitacao in processadas]).update(
+                    status='REPROVADA', aprovador=usuario, data_aprovacao=agora
+                )
+                EventoEstoque.objects.bulk_create([
+                    novo_evento(
+                        'REPROVACAO', solicitacao.produto, usuario,
+                        solicitacao_id=solicitacao.id,
+                        quantidade=solicitacao.quantidade,
+                        destino=solicitacao.destino
+                    )
+                    for solicitacao in processadas
+                ])
+                # update() não dispara signals, então a versão é atualizada aqui
+                VersaoRecurso.incrementar_apos_commit('solicitacoes')
+                atualizar_indicadores(solicitacoes_pendentes=-len(processadas))
+                registrar_log(
+                    acao="Solicitações reprovadas em lote",
+                    usuario=usuario,
+                    detalhes=f"Reprovou {len(processadas)} solicitações em lote: " + ', '.join(f'#{solicitacao.id}' for solicitacao in processadas)
+                )
+            for solicitacao in processadas:
+                resultados[solicitacao.id] = (True, 'Reprovada')
+
+        # Notificações gravadas na fila na mesma transação; o envio fica com o worker
+        if processadas:
+            data = timezone.localtime().strftime('%d/%m/%Y às %H:%M')
+            if acao == 'aprovar':
+                texto, html = renderizar_email('solicitacoes_aprovadas_lote', {
+                    'aprovador': usuario,
+                    'data': data,
+                    'solicitacoes': [
+                        {'id': solicitacao.id, 'produto': solicitacao.produto.nome, 'quantidade': solicitacao.quantidade, 'destino': solicitacao.destino}
+                        for solicitacao in processadas
+                    ],
+                })
+                enfileirar_email(
+                    'solicitacoes_aprovadas_lote',
+                    'Solicitações Aprovadas em Lote - Stock Flow',
+                    texto,
+                    ["beltramevictor13@gmail.com"],
+                    html=html
+                )
+
+            telefones = dict(
+                CustomUser.objects.filter(username__in={solicitacao.solicitante for solicitacao in processadas})
+                .exclude(telefone__isnull=True).exclude(telefone='')
+                .values_list('username', 'telefone')
+            )
+            mensagens = []
+            for solicitacao in processadas:
+                dados_whatsapp = {
+                    'id': solicitacao.id,
+                    'solicitante': solicitacao.solicitante,
+                    'produto': solicitacao.produto.nome,
+                    'quantidade': solicitacao.quantidade,
+                    'destino': solicitacao.destino,
+                }
+                if acao == 'aprovar':
+                    dados_whatsapp.update({'aprovador': usuario, 'data_aprovacao': data})
+                else:
+                    dados_whatsapp.update({'reprovador': usuario, 'data_reprovacao': data})
+                mensagens.append((telefones.get(solicitacao.solicitante), dados_whatsapp))
+            tipo_whatsapp = 'solicitacao_aprovada' if acao == 'aprovar' else 'solicitacao_reprovada'
+            enfileirar_whatsapp_lote(tipo_whatsapp, mensagens)
+
+    for solicitacao_id in ids:
+        resultados.setdefault(solicitacao_id, (False, 'Solicitação não encontrada ou já processada'))
+
+    sucesso = [solicitacao_id for solicitacao_id in ids if resultados[solicitacao_id][0]]
+    falhas = [solicitacao_id for solicitacao_id in ids if not resultados[solicitacao_id][0]]
+
+    if responder_json:
+        return JsonResponse({
+            'acao': acao,
+            'sucesso': len(sucesso),
+            'falhas': len(falhas),
+            'resultados': [
+                {'id': solicitacao_id, 'ok': resultados[solicitacao_id][0], 'mensagem': resultados[solicitacao_id][1]}
+                for solicitacao_id in ids
+            ],
+        })
+
+    if sucesso:
+        verbo = 'aprovadas e retiradas' if acao == 'aprovar' else 'reprovadas'
+        messages.success(request, f'{len(sucesso)} solicitações {verbo}!')
+    for solicitacao_id in falhas[:10]:
+        messages.error(request, f'Solicitação #{solicitacao_id}: {resultados[solicitacao_id][1]}')
+    if len(falhas) > 10:
+        messages.error(request, f'... e mais {len(falhas) - 10} solicitações não processadas')
+    return redirect(destino)
+
 # ============================================================================
 # FUNÇÕES DE ESTOQUE - ENTRADAS E SAÍDAS
 # ============================================================================
 
 @login_required
+@idempotente('entrada_produto')
 def entrada_produto(request):
     """View para entrada de produtos"""
     if request.method == 'POST':
@@ -562,13 +813,13 @@ def entrada_produto(request):
                 return redirect('dashboard_super')
         
         with transaction.atomic():
-            produto.quantidade += quantidade
-            produto.save()
+            adicionar_estoque(produto, quantidade)
             
             Movimentacao.objects.create(
                 tipo='ENTRADA',
                 produto=produto,
                 quantidade=quantidade,
+                variacao=quantidade,
                 usuario=request.user.username,
                 observacao=f'Entrada de {quantidade} unidades'
             )
@@ -579,77 +830,45 @@ def entrada_produto(request):
                 usuario=request.user.username,
             )
 
-            html_content = f'''
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }}
-                    .container {{ max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                    .header {{ background-color: #28a745; color: white; padding: 20px; text-align: center; }}
-                    .content {{ padding: 30px; }}
-                    .info-box {{ background-color: #d4edda; border-left: 4px solid #28a745; padding: 15px; margin: 20px 0; }}
-                    .footer {{ background-color: #6c757d; color: white; padding: 15px; text-align: center; font-size: 12px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>⬆️ Entrada de Produto</h1>
-                        <p>Stock Flow - Sistema de Gerenciamento de Estoque</p>
-                    </div>
-                    <div class="content">
-                        <h2>Nova Entrada Registrada</h2>
-                        <p>Uma entrada de produto foi registrada no sistema:</p>
-                        
-                        <div class="info-box">
-                            <p><strong>👤 Usuário:</strong> {request.user.username}</p>
-                            <p><strong>📦 Produto:</strong> {produto.nome}</p>
-                            <p><strong>🏷️ Código:</strong> {produto.codigo}</p>
-                            <p><strong>📊 Quantidade:</strong> +{quantidade} unidades</p>
-                            <p><strong>📅 Data:</strong> {timezone.localtime().strftime('%d/%m/%Y às %H:%M')}</p>
-                        </div>
-                    </div>
-                    <div class="footer">
-                        <p>Este é um email automático. Não responda a esta mensagem.</p>
-                        <p>Stock Flow &copy; 2025 - Sistema de Gerenciamento de Estoque</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            '''
-            
-            text_content = f'Entrada de Produto - O usuário {request.user.username} realizou a entrada de {quantidade} unidades do produto {produto.nome}.'
-            
-            msg = EmailMultiAlternatives(
-                'Entrada de Produto - Stock Flow',
-                text_content,
-                config('EMAIL_HOST_USER'),
-                [email]
+            registrar_evento('ENTRADA', produto, request.user, quantidade=quantidade)
+            atualizar_indicadores(
+                unidades=quantidade,
+                abaixo_carencia=variacao_carencia(produto.quantidade - quantidade, produto.quantidade, produto.carencia),
+                entradas=1,
             )
-            msg.attach_alternative(html_content, "text/html")
-            msg.send(fail_silently=True)
-            
-            # Enviar WhatsApp apenas para administradores
-            admins = CustomUser.objects.filter(nivel_acesso='admin')
-            whatsapp = WhatsAppService()
-            for admin in admins:
-                if admin.telefone:
-                    dados_whatsapp = {
-                        'produto': produto.nome,
-                        'codigo': produto.codigo,
-                        'quantidade': quantidade,
-                        'usuario': request.user.username,
-                        'data': timezone.localtime().strftime('%d/%m/%Y às %H:%M')
-                    }
-                    whatsapp.send_notification(admin.telefone, 'entrada_produto', dados_whatsapp)
-            
+
             # Registrar log no banco
             registrar_log(
                 acao="Entrada de produto",
                 usuario=request.user.username,
                 detalhes=f"Registrou entrada de {quantidade} unidades do produto: {produto.nome}"
             )
+
+            # Notificações gravadas na fila na mesma transação; o envio fica com o worker
+            texto, html = renderizar_email('entrada_produto', {
+                'usuario': request.user.username,
+                'produto': produto.nome,
+                'codigo': produto.codigo,
+                'quantidade': quantidade,
+                'data': timezone.localtime().strftime('%d/%m/%Y às %H:%M'),
+            })
+            enfileirar_email(
+                'entrada_produto',
+                'Entrada de Produto - Stock Flow',
+                texto,
+                [email],
+                html=html
+            )
+            
+            # WhatsApp apenas para administradores
+            dados_whatsapp = {
+                'produto': produto.nome,
+                'codigo': produto.codigo,
+                'quantidade': quantidade,
+                'usuario': request.user.username,
+                'data': timezone.localtime().strftime('%d/%m/%Y às %H:%M')
+            }
+            enfileirar_whatsapp('entrada_produto', destinatarios('admin', 'whatsapp'), dados_whatsapp)
         
         messages.success(request, f'Entrada de {quantidade} unidades de {produto.nome} registrada!')
         if request.user.nivel_acesso == 'comum':
@@ -664,4 +883,139 @@ def entrada_produto(request):
     elif request.user.nivel_acesso == 'admin':
         return redirect('dashboard_admin')
     else:
-        return redirect('dashboard_super')
\ No newline at end of file
+        return redirect('dashboard_super')
+
+# Limite de linhas aceitas em uma planilha de entrada em lote
+LIMITE_LINHAS_ENTRADA_LOTE = 5000
+
+def _ler_planilha_entrada(arquivo):
+    """Lê um CSV ou XLSX com as colunas codigo,quantidade e soma as quantidades por código
+
+    Retorna (quantidades_por_codigo, erros). Uma linha de cabeçalho é ignorada automaticamente.
+    """
+    if arquivo.name.lower().endswith('.xlsx'):
+        import openpyxl
+        planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True).active
+        linhas = planilha.iter_rows(values_only=True)
+    else:
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig')
+        amostra = texto.read(2048)
+        texto.seek(0)
+        delimitador = ';' if amostra.count(';') > amostra.count(',') else ','
+        linhas = csv.reader(texto, delimiter=delimitador)
+
+    quantidades = {}
+    erros = []
+    for numero, linha in enumerate(linhas, start=1):
+        if numero > LIMITE_LINHAS_ENTRADA_LOTE + 1:
+            erros.append(f'Máximo de {LIMITE_LINHAS_ENTRADA_LOTE} linhas por arquivo')
+            break
+        if not linha or all(valor in (None, '') for valor in linha):
+            continue
+        codigo = str(linha[0] if linha[0] is not None else '').strip()
+        valor = linha[1] if len(linha) > 1 else None
+        try:
+            quantidade = int(str(valor).strip())
+        except (TypeError, ValueError):
+            if numero == 1:
+                continue  # cabeçalho
+            erros.append(f'Linha {numero}: quantidade inválida')
+            continue
+        if not codigo or quantidade <= 0:
+            erros.append(f'Linha {numero}: código vazio ou quantidade menor que 1')
+            continue
+        quantidades[codigo] = quantidades.get(codigo, 0) + quantidade
+    return quantidades, erros
+
+@login_required
+@idempotente('entrada_lote')
+def entrada_lote(request):
+    """View para entrada de produtos em lote a partir de um CSV/XLSX (codigo,quantidade) - BLOQUEADA para usuário comum"""
+    if request.user.nivel_acesso == 'comum':
+        messages.error(request, 'Acesso negado')
+        return redirect('dashboard_comum')
+
+    destino = 'dashboard_admin' if request.user.nivel_acesso == 'admin' else 'dashboard_super'
+    arquivo = request.FILES.get('arquivo')
+    if request.method != 'POST' or not arquivo:
+        if request.method == 'POST':
+            messages.error(request, 'Selecione um arquivo CSV ou XLSX')
+        return redirect(destino)
+
+    try:
+        quantidades, erros = _ler_planilha_entrada(arquivo)
+    except Exception:
+        messages.error(request, 'Não foi possível ler o arquivo. Envie um CSV ou XLSX com as colunas codigo e quantidade.')
+        return redirect(destino)
+
+    if not quantidades and not erros:
+        erros.append('Arquivo sem linhas de produtos')
+    if erros:
+        messages.error(request, 'Entrada em lote não registrada. ' + ' | '.join(erros[:10]))
+        return redirect(destino)
+
+    with transaction.atomic():
+        # Um único SELECT para todos os códigos; a ordem por id evita deadlock entre lotes concorrentes
+        produtos = list(Product.objects.select_for_update().filter(codigo__in=quantidades).order_by('id'))
+        nao_encontrados = sorted(set(quantidades) - {produto.codigo for produto in produtos})
+        if nao_encontrados:
+            messages.error(request, f'Entrada em lote não registrada. Códigos não encontrados: {", ".join(nao_encontrados[:20])}')
+            return redirect(destino)
+
+        agora = timezone.now()
+        abaixo_carencia = 0
+        for produto in produtos:
+            abaixo_carencia += variacao_carencia(produto.quantidade, produto.quantidade + quantidades[produto.codigo], produto.carencia)
+            produto.quantidade += quantidades[produto.codigo]
+            produto.atualizado_em = agora
+        Product.objects.bulk_update(produtos, ['quantidade', 'atualizado_em'])
+
+        usuario = request.user.username
+        Movimentacao.objects.bulk_create([
+            Movimentacao(
+                tipo='ENTRADA',
+                produto=produto,
+                quantidade=quantidades[produto.codigo],
+                variacao=quantidades[produto.codigo],
+                usuario=usuario,
+                observacao=f'Entrada de {quantidades[produto.codigo]} unidades (lote: {arquivo.name})'
+            )
+            for produto in produtos
+        ])
+        Entradas.objects.bulk_create([
+            Entradas(produto=produto, quantidade=quantidades[produto.codigo], usuario=usuario)
+            for produto in produtos
+        ])
+        EventoEstoque.objects.bulk_create([
+            novo_evento('ENTRADA', produto, usuario, quantidade=quantidades[produto.codigo])
+            for produto in produtos
+        ])
+
+        # bulk_update/bulk_create não disparam signals, então as versões são atualizadas aqui
+        VersaoRecurso.incrementar_apos_commit('catalogo', 'movimentacoes')
+
+        total_unidades = sum(quantidades.values())
+        atualizar_indicadores(unidades=total_unidades, abaixo_carencia=abaixo_carencia, entradas=len(produtos))
+        registrar_log(
+            acao="Entrada de produtos em lote",
+            usuario=usuario,
+            detalhes=f"Registrou entrada em lote de {total_unidades} unidades em {len(produtos)} produtos (arquivo: {arquivo.name})"
+        )
+
+        # Uma única notificação para o lote inteiro, gravada na fila na mesma transação
+        itens = [{'codigo': produto.codigo, 'produto': produto.nome, 'quantidade': quantidades[produto.codigo]} for produto in produtos]
+        data = timezone.localtime().strftime('%d/%m/%Y às %H:%M')
+        texto, html = renderizar_email('entrada_lote', {'usuario': usuario, 'itens': itens, 'total': total_unidades, 'data': data})
+        enfileirar_email(
+            'entrada_lote',
+            'Entrada de Produtos em Lote - Stock Flow',
+            texto,
+            ["beltramevictor13@gmail.com"],
+            html=html
+        )
+
+        dados_whatsapp = {'usuario': usuario, 'itens': itens, 'total': total_unidades, 'data': data}
+        enfileirar_whatsapp('entrada_lote', destinatarios('admin', 'whatsapp'), dados_whatsapp)
+
+    messages.success(request, f'Entrada em lote registrada: {total_unidades} unidades em {len(produtos)} produtos!')
+    return redirect(destino)
@@ -8,6 +8,8 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from datetime import datetime
 from .models import Product
+from .ratelimit import limitar_taxa
+from .reposicao import abaixo_da_carencia
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
@@ -19,6 +21,7 @@ from datetime import datetime
 # ============================================================================
 
 @login_required
+@limitar_taxa('relatorios')
 def relatorio_pdf_geral(request):
     """View para gerar relatório PDF do estoque"""  
     produtos = Product.objects.all().order_by('nome')
@@ -65,6 +68,7 @@ def relatorio_pdf_geral(request):
     return response
 
 @login_required
+@limitar_taxa('relatorios')
 def relatorio_excel_geral(request):
     """View para gerar relatório Excel do estoque"""   
     produtos = Product.objects.all().order_by('nome')
@@ -106,12 +110,12 @@ def relatorio_excel_geral(request):
     # Dados dos produtos
     for produto in produtos:
         # Determinar status
-        if produto.quantidade > (produto.carencia or 0):
-            status = "Quantidade OK"
-            cor_status = cor_verde
-        else:
+        if abaixo_da_carencia(produto.quantidade, produto.carencia):
             status = "Realizar Compra"
             cor_status = cor_vermelha
+        else:
+            status = "Quantidade OK"
+            cor_status = cor_verde
         
         # Adicionar linha
         sheet.append([
@@ -7,6 +7,7 @@ from decouple import config
 from django.core.mail import send_mail
 from .models import CustomUser
 from .views_log import registrar_log
+from .ratelimit import limitar_taxa
 import re
 
 # ============================================================================
@@ -94,6 +95,7 @@ def cadastro(request):
     
     return render(request, 'cadastro.html')
 
+@limitar_taxa('login', metodos=('POST',))
 def login(request):
     """View para autenticação de usuários"""
     if request.method == 'POST':
@@ -306,6 +308,7 @@ def aceitar_termos(request):
 # FUNÇÕES DE AUTENTICAÇÃO 2FA
 # ============================================================================
 
+@limitar_taxa('totp', metodos=('POST',))
 def setup_totp(request):
     """Configuração inicial do TOTP"""
     if 'setup_user_id' not in request.session:
@@ -372,6 +375,7 @@ def setup_totp(request):
         'secret': user.totp_secret
     })
 
+@limitar_taxa('totp', metodos=('POST',))
 def verify_totp(request):
     """Verificação do TOTP no login"""
     if 'login_user_id' not in request.session:
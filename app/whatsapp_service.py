@@ -1,19 +1,124 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from decouple import config
 from django.utils import timezone
 
+class CircuitBreaker:
+    """Bloqueia as chamadas ao provedor depois de `limiar` falhas seguidas, por `recuperacao` segundos"""
+
+    def __init__(self, limiar, recuperacao):
+        self.limiar = limiar
+        self.recuperacao = recuperacao
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Indica se uma chamada pode ser feita; no estado meio-aberto libera uma única chamada de teste"""
+        with self._lock:
+            if self.falhas < self.limiar:
+                return True
+            agora = time.monotonic()
+            if agora >= self.aberto_ate:
+                self.aberto_ate = agora + self.recuperacao
+                return True
+            return False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.limiar:
+                self.aberto_ate = time.monotonic() + self.recuperacao
+
+    def fechar(self):
+        """Volta ao estado inicial (fechado)"""
+        with self._lock:
+            self.falhas = 0
+            self.aberto_ate = 0.0
+
+    def segundos_para_reabrir(self):
+        """Segundos até o circuito aceitar uma nova chamada (0 quando fechado)"""
+        with self._lock:
+            if self.falhas < self.limiar:
+                return 0
+            return max(self.aberto_ate - time.monotonic(), 0)
+
+    @property
+    def estado(self):
+        if self.falhas < self.limiar:
+            return 'fechado'
+        return 'aberto' if self.segundos_para_reabrir() else 'meio-aberto'
+
+# Estado compartilhado entre as instâncias do serviço (cada worker/processo tem o seu)
+MAX_CONEXOES = config('WHATSAPP_MAX_CONEXOES', default=8, cast=int)
+circuito_whatsapp = CircuitBreaker(
+    limiar=config('WHATSAPP_LIMIAR_FALHAS', default=5, cast=int),
+    recuperacao=config('WHATSAPP_TEMPO_RECUPERACAO', default=60, cast=int),
+)
+_sessao = None
+_sessao_lock = threading.Lock()
+_metricas = {'chamadas': 0, 'sucessos': 0, 'falhas': 0, 'bloqueadas': 0, 'latencia_total_ms': 0.0, 'latencia_max_ms': 0.0}
+_metricas_lock = threading.Lock()
+
+def _obter_sessao():
+    """Sessão HTTP persistente (keep-alive) com pool de conexões dimensionado para o fan-out"""
+    global _sessao
+    with _sessao_lock:
+        if _sessao is None:
+            _sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONEXOES)
+            _sessao.mount('https://', adaptador)
+            _sessao.mount('http://', adaptador)
+        return _sessao
+
+def _registrar_metrica(resultado, latencia_ms=0.0):
+    with _metricas_lock:
+        _metricas[resultado] += 1
+        if resultado != 'bloqueadas':
+            _metricas['chamadas'] += 1
+            _metricas['latencia_total_ms'] += latencia_ms
+            _metricas['latencia_max_ms'] = max(_metricas['latencia_max_ms'], latencia_ms)
+
 class WhatsAppService:
     """Serviço para envio de mensagens via WhatsApp usando UltraMsg API"""
     
-    def __init__(self):
+    def __init__(self, sessao=None, circuito=None):
         self.instance_id = config('ULTRAMSG_INSTANCE_ID', default='')
         self.token = config('ULTRAMSG_TOKEN', default='')
-        self.base_url = f"https://api.ultramsg.com/{self.instance_id}"
+        # A URL base pode apontar para um servidor local em testes e homologação
+        api_url = config('ULTRAMSG_BASE_URL', default='https://api.ultramsg.com').rstrip('/')
+        self.base_url = f"{api_url}/{self.instance_id}"
+        self.sessao = sessao or _obter_sessao()
+        self.circuito = circuito or circuito_whatsapp
+
+    @staticmethod
+    def metricas():
+        """Retorna os contadores de chamadas, falhas e latência do provedor"""
+        with _metricas_lock:
+            dados = dict(_metricas)
+        dados['latencia_media_ms'] = round(dados['latencia_total_ms'] / dados['chamadas'], 1) if dados['chamadas'] else 0.0
+        dados['circuito'] = circuito_whatsapp.estado
+        return dados
+
+    def disponivel(self):
+        """Indica se o serviço está configurado e o circuito não está aberto"""
+        return bool(self.instance_id and self.token) and self.circuito.segundos_para_reabrir() == 0
     
     def send_message(self, phone_number, message):
         """Envia mensagem de texto via WhatsApp"""
         if not self.instance_id or not self.token:
             return False
+
+        if not self.circuito.permitir():
+            _registrar_metrica('bloqueadas')
+            return False
             
         url = f"{self.base_url}/messages/chat"
         
@@ -23,12 +128,47 @@ class WhatsAppService:
             'body': message
         }
         
+        inicio = time.perf_counter()
         try:
-            response = requests.post(url, data=payload, timeout=10)
-            return response.status_code == 200
-        except:
-            return False
+            response = self.sessao.post(url, data=payload, timeout=10)
+            enviado = response.status_code == 200
+        except requests.RequestException:
+            enviado = False
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+
+        if enviado:
+            self.circuito.registrar_sucesso()
+            _registrar_metrica('sucessos', latencia_ms)
+        else:
+            self.circuito.registrar_falha()
+            _registrar_metrica('falhas', latencia_ms)
+        return enviado
+
+    def send_notifications(self, envios):
+        """Envia várias notificações (telefone, tipo, dados) em paralelo; retorna a lista de resultados na mesma ordem"""
+        envios = list(envios)
+        if not envios:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(envios), MAX_CONEXOES)) as executor:
+            return list(executor.map(lambda envio: self.send_notification(*envio), envios))
     
+    @staticmethod
+    def _linha_resumo(tipo, dados):
+        """Linha curta de uma notificação dentro da mensagem de resumo"""
+        if tipo == 'nova_solicitacao':
+            return f"🔔 Solicitação #{dados['id']} de {dados['solicitante']}: {dados['produto']} x{dados['quantidade']} ({dados['destino']})"
+        if tipo == 'solicitacao_aprovada':
+            return f"✅ Solicitação #{dados['id']} aprovada: {dados['produto']} -{dados['quantidade']}"
+        if tipo == 'solicitacao_reprovada':
+            return f"❌ Solicitação #{dados['id']} reprovada: {dados['produto']}"
+        if tipo == 'entrada_produto':
+            return f"⬆️ {dados['codigo']} - {dados['produto']}: +{dados['quantidade']} ({dados['usuario']})"
+        if tipo == 'entrada_lote':
+            return f"⬆️ Lote de {dados['usuario']}: +{dados['total']} em {len(dados['itens'])} produtos"
+        if tipo == 'estoque_baixo':
+            return f"⚠️ Estoque baixo em {len(dados['itens'])} produtos"
+        return f"• {tipo}"
+
     def send_notification(self, phone_number, tipo, dados):
         """Envia notificação formatada baseada no tipo"""
         if not phone_number:
@@ -70,6 +210,38 @@ class WhatsAppService:
             📅 *Data:* {dados['data']}
 
             ✅ Entrada registrada com sucesso!"""
+        elif tipo == 'entrada_lote':
+            itens = '\n'.join(
+                f"            • {item['codigo']} - {item['produto']}: +{item['quantidade']}"
+                for item in dados['itens'][:20]
+            )
+            if len(dados['itens']) > 20:
+                itens += f"\n            ... e mais {len(dados['itens']) - 20} produtos"
+            message = f"""⬆️ *Entrada em Lote - Stock Flow*
+
+            👤 *Usuário:* {dados['usuario']}
+            📦 *Produtos:* {len(dados['itens'])}
+            📊 *Total:* +{dados['total']} unidades
+            📅 *Data:* {dados['data']}
+
+{itens}
+
+            ✅ Entrada registrada com sucesso!"""
+        elif tipo == 'estoque_baixo':
+            itens = '\n'.join(
+                f"            • {item['codigo']} - {item['produto']}: {item['quantidade']} (carência {item['carencia']})"
+                for item in dados['itens'][:20]
+            )
+            if len(dados['itens']) > 20:
+                itens += f"\n            ... e mais {len(dados['itens']) - 20} produtos"
+            message = f"""⚠️ *Estoque Baixo - Stock Flow*
+
+            📦 *Produtos no limite da carência:* {len(dados['itens'])}
+            📅 *Data:* {dados['data']}
+
+{itens}
+
+            🛒 Verifique a lista de reposição."""
         elif tipo == 'solicitacao_reprovada':
             message = f"""❌ *Solicitação Reprovada - Stock Flow*
 
@@ -82,6 +254,18 @@ class WhatsAppService:
             📅 *Reprovação:* {dados['data_reprovacao']}
 
             ❌ Status: *REPROVADA*"""
+        elif tipo == 'resumo':
+            itens = '\n'.join(
+                f"            {self._linha_resumo(item['tipo'], item['dados'])}"
+                for item in dados['itens'][:30]
+            )
+            if len(dados['itens']) > 30:
+                itens += f"\n            ... e mais {len(dados['itens']) - 30} notificações"
+            message = f"""📋 *Resumo de Notificações - Stock Flow*
+
+            🔔 *Notificações:* {len(dados['itens'])}
+
+{itens}"""
         else:
             message = ''
         
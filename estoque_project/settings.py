@@ -58,6 +58,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'estoque_project.urls'
 
+# Sem 'loaders' explícito o Django envolve os loaders padrão no cached.Loader: os templates
+# (inclusive os de email em templates/emails/) são compilados uma vez por processo.
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -68,6 +70,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.idempotencia.chave_idempotencia_contexto',
             ],
         },
     },
@@ -91,6 +94,41 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local-memory por padrão (sem serviços externos); use CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# e CACHE_LOCATION=/caminho/do/diretorio para compartilhar o cache entre os workers do gunicorn
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='stockflow'),
+    }
+}
+
+# Rate limit (token bucket) por grupo de endpoints: api, login, totp e relatorios.
+# Os padrões estão em app/ratelimit.py; para alterar um grupo, por exemplo:
+# RATE_LIMITS = {'api': {'capacidade': 300, 'por_segundo': 5}}
+# Anônimos são identificados pelo IP. Só confie no X-Forwarded-For atrás de proxies conhecidos:
+# RATE_LIMIT_PROXIES é quantos proxies confiáveis adicionam o IP ao header (1 no Render); com 0
+# (padrão) é usado o REMOTE_ADDR.
+RATE_LIMIT_PROXIES = config('RATE_LIMIT_PROXIES', default=0, cast=int)
+
+# Chaves de idempotência dos POSTs de estoque ficam guardadas por IDEMPOTENCIA_TTL segundos (padrão: 24h);
+# as expiradas são removidas por `manage.py purgar_idempotencia`.
+# IDEMPOTENCIA_TTL = 86400
+
+# No estoque geral, produtos a até REPOSICAO_MARGEM_ATENCAO unidades da carência aparecem em amarelo
+# (padrão: 5); no limite da carência aparecem em vermelho e entram na lista de reposição.
+# REPOSICAO_MARGEM_ATENCAO = 5
+
+# Fila de notificações (emails e WhatsApp), enviada pelo worker `manage.py processar_notificacoes`.
+# Os padrões estão em app/notificacoes.py; para alterar, por exemplo:
+# NOTIFICACOES = {'max_tentativas': 8, 'backoff_inicial': 60}
+# Modo resumo: com 'janela_resumo' (segundos) as notificações de cada destinatário são agrupadas
+# em uma única mensagem por janela; os tipos em 'tipos_urgentes' continuam saindo na hora:
+# NOTIFICACOES = {'janela_resumo': 900, 'tipos_urgentes': ['nova_solicitacao']}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 